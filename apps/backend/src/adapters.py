@@ -0,0 +1,306 @@
+import os
+import logging
+from src import codec
+
+logger = logging.getLogger(__name__)
+
+# Base URL of the inference balancer that fronts the GPU providers
+INFERENCE_BALANCER_URL = os.environ.get(
+    'INFERENCE_BALANCER_URL',
+    'http://inference-balancer.inference-balancer.svc.cluster.local'
+)
+
+# Registered model adapters, keyed by the inference_model name used in the API
+MODEL_ADAPTERS = {}
+
+class ModelAdapter:
+    """
+    Describes how to call one inference model through the balancer.
+
+    Subclasses set `name`, `path` and `input_fields`, and can override
+    `build_request` and `parse_output` when the model's API differs from the
+    DataCrunch `{"input": {...}}` convention.
+
+    For micro-batching, `batch_fields` lists the parameters that must match
+    for requests to share a batch. Models whose API accepts several inputs
+    in one call set `batch_path` and implement `build_batch_request` and
+    `split_batch_response`.
+
+    `response_fields` lists the parts of the response that `parse_output`
+    reads, as dotted paths (`.item` for array elements). When set, the
+    pipeline parses the response body incrementally as it arrives and keeps
+    only those fields, instead of buffering the whole body and decoding all
+    of it.
+
+    Models with a streaming endpoint set `stream_path`. The endpoint answers
+    with server-sent events (or JSON lines), and `parse_stream_event` tells
+    progress updates apart from the final response.
+
+    Queued providers that answer a submission with a prediction ID set
+    `submit_path` and `poll_path` (with an `{id}` placeholder) and implement
+    `parse_submission` and `parse_poll`. Providers with a bulk status
+    endpoint also set `poll_batch_path` and implement
+    `build_poll_batch_request` and `split_poll_batch_response`. Models called
+    directly rather than through the balancer set `api_url`.
+    """
+    name = None
+    path = None
+    input_fields = ()
+    default_params = {}
+    batch_fields = ()
+    batch_path = None
+    stream_path = None
+    response_fields = ()
+    api_url = None
+    submit_path = None
+    poll_path = None
+    poll_batch_path = None
+
+    @property
+    def url(self):
+        return f"{INFERENCE_BALANCER_URL}{self.path}"
+
+    @property
+    def batch_url(self):
+        return f"{INFERENCE_BALANCER_URL}{self.batch_path or self.path}"
+
+    @property
+    def supports_batch(self):
+        return bool(self.batch_path)
+
+    @property
+    def supports_stream(self):
+        return bool(self.stream_path)
+
+    @property
+    def supports_poll(self):
+        return bool(self.submit_path)
+
+    @property
+    def submit_url(self):
+        return f"{self.api_url or INFERENCE_BALANCER_URL}{self.submit_path}"
+
+    def poll_url(self, prediction_id):
+        return f"{self.api_url or INFERENCE_BALANCER_URL}{self.poll_path.format(id=prediction_id)}"
+
+    @property
+    def poll_batch_url(self):
+        return f"{self.api_url or INFERENCE_BALANCER_URL}{self.poll_batch_path}"
+
+    def request_headers(self):
+        """Extra headers for calls to the model (e.g. credentials for a provider called directly)."""
+        return {}
+
+    def build_request(self, params):
+        """Build the JSON body sent to the balancer from the task parameters."""
+        model_input = dict(self.default_params)
+        for field in self.input_fields:
+            if params.get(field) is not None:
+                model_input[field] = params[field]
+        return {"input": model_input}
+
+    def parse_response_stream(self, fp):
+        """
+        Decode `response_fields` from a JSON response body read from the file object `fp`.
+
+        Returns a dict shaped like the full response but holding only those
+        fields. Only scalar values (and arrays of them) are supported.
+        Raises ValueError for malformed JSON. Requires `ijson`.
+        """
+        import ijson
+        data = {}
+        try:
+            for prefix, event, value in ijson.parse(fp, use_float=True):
+                if prefix not in self.response_fields or event in ('start_map', 'end_map', 'start_array', 'end_array', 'map_key'):
+                    continue
+                *parents, key = prefix.split('.')
+                if key == 'item':
+                    key = parents.pop()
+                target = data
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                if prefix.endswith('.item'):
+                    target.setdefault(key, []).append(value)
+                else:
+                    target[key] = value
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON response: {str(e).strip()}") from e
+        return data
+
+    def parse_output(self, data):
+        """Extract the fields delivered to clients from the decoded model response."""
+        return data
+
+    def offload_outputs(self, data, blob_store):
+        """Move inline (base64) outputs in the decoded response to the blob store, in place."""
+        return data
+
+    def parse_stream_event(self, event, data):
+        """
+        Classify one decoded stream event.
+
+        Returns ('result', response_data) for the final response, which is then
+        parsed like a non-streamed one, ('progress', fields) for an update to
+        forward to clients, or None to skip the event.
+        """
+        if event in ('result', 'complete', 'completed') or 'output' in data:
+            return 'result', data
+        progress = {key: data[key] for key in ('status', 'progress', 'step', 'total_steps', 'preview') if key in data}
+        return ('progress', progress) if progress else None
+
+    def parse_submission(self, data):
+        """Return the prediction ID from a decoded submission response."""
+        raise NotImplementedError
+
+    def parse_poll(self, data):
+        """
+        Classify a decoded status response.
+
+        Returns ('pending', None) while the prediction runs, or ('completed' or
+        'failed', response_data) once it has finished; response_data is then
+        parsed like a synchronous response.
+        """
+        raise NotImplementedError
+
+    def build_poll_batch_request(self, prediction_ids):
+        """Build the body of one bulk status request for several predictions."""
+        raise NotImplementedError
+
+    def split_poll_batch_response(self, data):
+        """Split a decoded bulk status response into {prediction_id: status response}."""
+        raise NotImplementedError
+
+    def batch_key(self, params):
+        """Requests with equal batch keys can be dispatched together."""
+        return (self.name,) + tuple(params.get(field) for field in self.batch_fields)
+
+    def build_batch_request(self, payloads):
+        """Combine single-request payloads into one batched upstream request body."""
+        raise NotImplementedError
+
+    def split_batch_response(self, status_code, response_text, count):
+        """Split a batched upstream response into `count` (status_code, response_text) pairs."""
+        raise NotImplementedError
+
+def register_adapter(adapter):
+    """Register an adapter instance so tasks and the API can look it up by model name."""
+    MODEL_ADAPTERS[adapter.name] = adapter
+    return adapter
+
+def get_adapter(name):
+    """Return the adapter registered for `name`, or None if the model is unknown."""
+    return MODEL_ADAPTERS.get(name)
+
+class FluxAdapter(ModelAdapter):
+    """Flux text-to-image served by DataCrunch behind the inference balancer."""
+    name = 'flux'
+    path = '/flux'
+    input_fields = ('prompt', 'seed', 'enable_base64_output', 'cache_threshold', 'size')
+    default_params = {"prompt": "A car"}
+    # Batch endpoint on the balancer, if the deployment exposes one (e.g. '/flux/batch').
+    # It takes a JSON array of /flux request bodies and answers with the array of their responses.
+    batch_path = os.environ.get('FLUX_BATCH_PATH') or None
+    batch_fields = ('size', 'cache_threshold', 'enable_base64_output')
+    response_fields = ('status', 'id', 'output.seed', 'output.outputs.item', 'output.has_nsfw_contents.item')
+    # Streaming endpoint on the balancer, if the deployment exposes one (e.g. '/flux/stream')
+    stream_path = os.environ.get('FLUX_STREAM_PATH') or None
+
+    def parse_output(self, data):
+        output = data.get('output') or {}
+        image_url = None
+        if output.get('outputs'):
+            image_url = output['outputs'][0]
+        return {
+            "status": data.get('status', 'UNKNOWN'),
+            "id": data.get('id', ''),
+            "image_url": image_url,  # Direct reference to image URL
+            "seed": output.get('seed', None),
+            "has_nsfw": (output.get('has_nsfw_contents') or [False])[0]
+        }
+
+    def build_batch_request(self, payloads):
+        return payloads
+
+    def split_batch_response(self, status_code, response_text, count):
+        if status_code != 200:
+            return [(status_code, response_text)] * count
+        try:
+            responses = codec.loads(response_text)
+        except ValueError:
+            responses = None
+        if not isinstance(responses, list) or len(responses) != count:
+            logger.warning(f"Unexpected flux batch response: {response_text[:200]}")
+            return [(502, response_text)] * count
+        return [(200, codec.dumps(response).decode('utf-8')) for response in responses]
+
+    def offload_outputs(self, data, blob_store):
+        outputs = (data.get('output') or {}).get('outputs') or []
+        for i, item in enumerate(outputs):
+            # With enable_base64_output the outputs are base64 images instead of URLs
+            if isinstance(item, str) and not item.startswith(('http://', 'https://')):
+                outputs[i] = blob_store.put_base64(item)
+        return data
+
+register_adapter(FluxAdapter())
+
+# Wavespeed API, called directly with the account's key
+WAVESPEED_API_URL = os.environ.get('WAVESPEED_API_URL', 'https://api.wavespeed.ai/api/v2')
+WAVESPEED_API_KEY = os.environ.get('WAVESPEED_API_KEY', '')
+
+class WavespeedFluxAdapter(ModelAdapter):
+    """
+    Flux dev on Wavespeed, which queues each generation: the submission
+    returns a prediction ID and the result is polled for.
+    """
+    name = 'wavespeed-flux'
+    api_url = WAVESPEED_API_URL
+    submit_path = '/wavespeed-ai/flux-dev'
+    poll_path = '/predictions/{id}/result'
+    input_fields = ('prompt', 'seed', 'enable_base64_output', 'size')
+    default_params = {
+        "prompt": "A car",
+        "enable_safety_checker": True,
+        "guidance_scale": 3.5,
+        "num_images": 1,
+        "num_inference_steps": 28,
+        "seed": -1,
+        "size": "1024*1024",
+        "strength": 0.8,
+    }
+
+    def build_request(self, params):
+        # Wavespeed takes the parameters at the top level, not under "input"
+        return super().build_request(params)["input"]
+
+    def request_headers(self):
+        return {"Authorization": f"Bearer {WAVESPEED_API_KEY}"} if WAVESPEED_API_KEY else {}
+
+    def parse_submission(self, data):
+        return data["data"]["id"]
+
+    def parse_poll(self, data):
+        prediction = data.get("data") or {}
+        status = prediction.get("status")
+        if status in ("completed", "failed"):
+            return status, prediction
+        return 'pending', None
+
+    def parse_output(self, data):
+        outputs = data.get('outputs') or []
+        return {
+            "status": data.get('status', 'UNKNOWN'),
+            "id": data.get('id', ''),
+            "image_url": outputs[0] if outputs else None,
+            "seed": data.get('seed'),
+            "has_nsfw": (data.get('has_nsfw_contents') or [False])[0],
+            "error": data.get('error') or None,
+        }
+
+    def offload_outputs(self, data, blob_store):
+        outputs = data.get('outputs') or []
+        for i, item in enumerate(outputs):
+            if isinstance(item, str) and not item.startswith(('http://', 'https://')):
+                outputs[i] = blob_store.put_base64(item)
+        return data
+
+register_adapter(WavespeedFluxAdapter())
@@ -0,0 +1,238 @@
+import os
+import asyncio
+import logging
+import threading
+from celery.signals import worker_process_shutdown, worker_shutdown
+from src.http_client import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_POOL_MAXSIZE,
+    HTTP_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of outbound requests awaited concurrently by one worker process
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get('ASYNC_MAX_IN_FLIGHT', 200))
+# Upper bound on open connections across all upstream hosts
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', ASYNC_MAX_IN_FLIGHT))
+# Body chunks a streamed response buffers ahead of the task reading it
+ASYNC_STREAM_BUFFER_CHUNKS = int(os.environ.get('ASYNC_STREAM_BUFFER_CHUNKS', 16))
+
+def httpx_timeout(timeout):
+    """Convert a requests-style timeout (number or (connect, read) tuple) to an httpx.Timeout."""
+    import httpx
+    if timeout is None:
+        return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+class AsyncRuntime:
+    """
+    Event loop running in a background thread of the worker process.
+
+    Celery tasks stay synchronous: each one hands its HTTP calls to this loop
+    and waits on the result, so a threads pool with many slots can keep
+    hundreds of inference calls in flight from a single process. The
+    semaphore caps how many requests are awaited at once.
+    """
+
+    def __init__(self, max_in_flight=ASYNC_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.loop = None
+        self.client = None
+        self.in_flight = 0
+        self._semaphore = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='aio-runtime', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        logger.info(f"Async runtime started (max_in_flight={self.max_in_flight}, max_connections={ASYNC_MAX_CONNECTIONS})")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._setup())
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _setup(self):
+        import httpx
+        # Created on the loop thread so it binds to this loop
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            ),
+            timeout=httpx_timeout(None),
+            transport=httpx.AsyncHTTPTransport(retries=HTTP_MAX_RETRIES),
+            headers={"Content-Type": "application/json"},
+        )
+
+    def stop(self):
+        if self.loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"Error closing async HTTP client: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.loop = None
+
+    def run(self, coro, timeout=None):
+        """Schedule a coroutine on the runtime loop and block the calling thread until it completes."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout)
+
+    async def request(self, method, url, data=None, timeout=None, **kwargs):
+        """Send a request with the shared async client, waiting for a free in-flight slot first."""
+        if data is not None:
+            kwargs['content'] = data
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await self.client.request(method, url, timeout=httpx_timeout(timeout), **kwargs)
+            finally:
+                self.in_flight -= 1
+
+    def stream(self, method, url, timeout=None, **kwargs):
+        """Start a streamed request on the loop and return a StreamedResponse read from the calling thread."""
+        response = StreamedResponse(self.loop, self.run(self._stream_buffer()))
+        response.future = asyncio.run_coroutine_threadsafe(
+            self._pump(response.chunks, method, url, timeout=timeout, **kwargs), self.loop
+        )
+        response.wait_for_status()
+        return response
+
+    async def _stream_buffer(self):
+        # Created on the loop thread so it binds to this loop
+        return asyncio.Queue(maxsize=ASYNC_STREAM_BUFFER_CHUNKS)
+
+    async def _pump(self, chunks, method, url, data=None, timeout=None, **kwargs):
+        if data is not None:
+            kwargs['content'] = data
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                async with self.client.stream(method, url, timeout=httpx_timeout(timeout), **kwargs) as upstream:
+                    await chunks.put(upstream.status_code)
+                    # Each put waits while the reader is a full buffer behind, so a slow
+                    # task holds at most ASYNC_STREAM_BUFFER_CHUNKS chunks in memory
+                    async for chunk in upstream.aiter_bytes():
+                        await chunks.put(chunk)
+            except Exception as e:
+                await chunks.put(e)
+            finally:
+                self.in_flight -= 1
+        # Not reached when the reader closes the response, which cancels the pump
+        await chunks.put(StreamedResponse.END)
+
+class StreamedResponse:
+    """
+    A streamed response read from a task thread.
+
+    The runtime loop pushes the status code, then each body chunk, then END
+    onto a bounded asyncio queue, and the task thread takes them off through
+    the loop. Like a streamed requests response, the body can be read with
+    `iter_lines()`, `text`, or as a file object through `raw`.
+    """
+    END = object()
+
+    def __init__(self, loop, chunks):
+        self.loop = loop
+        self.chunks = chunks
+        self.status_code = None
+        self.future = None
+        self._done = False
+        self._pending = memoryview(b'')  # Unread rest of a chunk after read(size)
+
+    def _next(self):
+        item = asyncio.run_coroutine_threadsafe(self.chunks.get(), self.loop).result()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def wait_for_status(self):
+        self.status_code = self._next()
+        if self.status_code is self.END:
+            raise ConnectionError("Stream closed before a response was received")
+
+    def iter_content(self):
+        if self._pending:
+            chunk, self._pending = bytes(self._pending), memoryview(b'')
+            yield chunk
+        while not self._done:
+            chunk = self._next()
+            if chunk is self.END:
+                self._done = True
+                return
+            yield chunk
+
+    def iter_lines(self, decode_unicode=True):
+        pending = b''
+        for chunk in self.iter_content():
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip(b'\r').decode() if decode_unicode else line.rstrip(b'\r')
+        if pending:
+            yield pending.decode() if decode_unicode else pending
+
+    def read(self, size=-1):
+        """Return up to `size` bytes of the body, the rest of the body for size < 0, or b'' at the end."""
+        if size is None or size < 0:
+            return b''.join(self.iter_content())
+        while not self._pending and not self._done:
+            chunk = self._next()
+            if chunk is self.END:
+                self._done = True
+            else:
+                self._pending = memoryview(chunk)
+        data, self._pending = bytes(self._pending[:size]), self._pending[size:]
+        return data
+
+    @property
+    def raw(self):
+        return self
+
+    @property
+    def text(self):
+        return b''.join(self.iter_content()).decode()
+
+    def close(self):
+        if self.future is not None:
+            self.future.cancel()
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+def get_runtime():
+    """
+    Return the async runtime for this process, starting it on first use.
+
+    The runtime is never created in the prefork parent, so each child process
+    (or the single process of a threads pool) starts its own loop and client.
+    """
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                runtime = AsyncRuntime()
+                runtime.start()
+                _runtime = runtime
+    return _runtime
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_runtime(**kwargs):
+    global _runtime
+    with _runtime_lock:
+        if _runtime is not None:
+            _runtime.stop()
+            _runtime = None
@@ -0,0 +1,217 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from kombu.transport.redis import Channel, PRIORITY_STEPS
+from src.celery import BROKER_URL
+from src.inflight import INFLIGHT_KEY, INFLIGHT_MAX_AGE
+from src.metrics import ADMISSION_DECISIONS, QUEUE_DEPTH, TASKS_IN_FLIGHT
+from src.tiers import TIER_QUEUE_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Admission control configuration from environment variables
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'false').lower() == 'true'
+ADMISSION_QUEUES = [q for q in os.environ.get('ADMISSION_QUEUES', ','.join(TIER_QUEUE_NAMES)).split(',') if q]
+ADMISSION_MAX_QUEUE_DEPTH = int(os.environ.get('ADMISSION_MAX_QUEUE_DEPTH', 1000))  # 0 disables the check
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 0))  # 0 disables the check; needs INFLIGHT_TRACKING_ENABLED on workers
+ADMISSION_REFRESH_INTERVAL = float(os.environ.get('ADMISSION_REFRESH_INTERVAL', 0.5))  # Seconds between load refreshes
+ADMISSION_DEFER_SECONDS = float(os.environ.get('ADMISSION_DEFER_SECONDS', 0))  # Hold requests this long waiting for capacity before rejecting
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 5))  # Retry-After sent with overload rejections
+
+# Per-client rate limiting (tokens per second, 0 disables it)
+CLIENT_RATE_LIMIT = float(os.environ.get('CLIENT_RATE_LIMIT', 0))
+CLIENT_BURST = int(os.environ.get('CLIENT_BURST', 20))
+CLIENT_ID_HEADER = os.environ.get('CLIENT_ID_HEADER', 'X-Client-Id')
+CLIENT_BUCKETS_MAX = 10000
+
+def queue_lists(queue):
+    """
+    The Redis lists that hold a broker queue's messages. Kombu keeps messages
+    sent with a priority (TIER_PRIORITIES) in a sub-list per priority step.
+    """
+    return [queue] + [f"{queue}{Channel.sep}{step}" for step in PRIORITY_STEPS if step]
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self):
+        """Take one token. Returns 0 on success, otherwise the seconds until a token is available."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take_up_to(self, count):
+        """Take as many of `count` tokens as are available and return how many were taken."""
+        self._refill()
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+class AdmissionController:
+    """
+    Sheds submissions before they reach the queue when the system is overloaded.
+
+    Queue depth (LLEN of the broker queues) and the in-flight count (the
+    workers' in-flight sorted set) are refreshed in the background with one
+    pipelined Redis call, so admitting a request never costs a round-trip.
+    If the load can't be read, requests are admitted.
+    """
+
+    def __init__(self, redis_url=BROKER_URL, queues=ADMISSION_QUEUES):
+        self.redis_url = redis_url
+        self.queues = queues
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.updated_at = 0
+        self.client_buckets = OrderedDict()
+        self._client = None
+
+    async def refresh(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+            self._client = aioredis.from_url(self.redis_url)
+        pipe = self._client.pipeline(transaction=False)
+        for queue in self.queues:
+            for name in queue_lists(queue):
+                pipe.llen(name)
+        pipe.zcount(INFLIGHT_KEY, time.time() - INFLIGHT_MAX_AGE, '+inf')
+        results = await pipe.execute()
+        self.queue_depth = sum(results[:-1])
+        self.in_flight = results[-1]
+        self.updated_at = time.monotonic()
+        QUEUE_DEPTH.set(self.queue_depth)
+        TASKS_IN_FLIGHT.set(self.in_flight)
+
+    async def run(self):
+        """Refresh the load snapshot forever; started on API startup."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Admission control refresh failed: {str(e)}")
+            await asyncio.sleep(ADMISSION_REFRESH_INTERVAL)
+
+    def is_stale(self):
+        return time.monotonic() - self.updated_at > ADMISSION_REFRESH_INTERVAL * 10
+
+    def overload_reason(self):
+        """Return why the system is overloaded, or None. A stale snapshot never rejects."""
+        if self.is_stale():
+            return None
+        if ADMISSION_MAX_QUEUE_DEPTH and self.queue_depth >= ADMISSION_MAX_QUEUE_DEPTH:
+            return 'queue_depth'
+        if ADMISSION_MAX_IN_FLIGHT and self.in_flight >= ADMISSION_MAX_IN_FLIGHT:
+            return 'in_flight'
+        return None
+
+    def client_bucket(self, request):
+        """The token bucket of the client making `request`."""
+        client_id = request.headers.get(CLIENT_ID_HEADER) or (request.client.host if request.client else 'unknown')
+        bucket = self.client_buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(CLIENT_RATE_LIMIT, CLIENT_BURST)
+            self.client_buckets[client_id] = bucket
+            if len(self.client_buckets) > CLIENT_BUCKETS_MAX:
+                self.client_buckets.popitem(last=False)
+        else:
+            self.client_buckets.move_to_end(client_id)
+        return bucket
+
+    async def admit(self, request: Request):
+        """FastAPI dependency that raises 429 with Retry-After when a submission must be shed."""
+        if not ADMISSION_ENABLED:
+            return
+
+        if CLIENT_RATE_LIMIT > 0:
+            wait = self.client_bucket(request).take()
+            if wait > 0:
+                ADMISSION_DECISIONS.labels(outcome='rejected', reason='rate_limit').inc()
+                raise HTTPException(
+                    status_code=429,
+                    detail="Rate limit exceeded",
+                    headers={"Retry-After": str(max(1, int(wait + 0.999)))}
+                )
+
+        await self.wait_for_capacity()
+        ADMISSION_DECISIONS.labels(outcome='admitted', reason='none').inc()
+
+    async def admit_batch(self, request: Request):
+        """
+        FastAPI dependency for batch submissions: sheds the whole batch while
+        the system is overloaded. Its items are charged with `admit_items`.
+        """
+        if ADMISSION_ENABLED:
+            await self.wait_for_capacity()
+
+    async def wait_for_capacity(self):
+        """Hold a submission for up to ADMISSION_DEFER_SECONDS while overloaded, then raise 429."""
+        reason = self.overload_reason()
+        if reason is not None and ADMISSION_DEFER_SECONDS > 0:
+            deadline = time.monotonic() + ADMISSION_DEFER_SECONDS
+            while reason is not None and time.monotonic() < deadline:
+                await asyncio.sleep(ADMISSION_REFRESH_INTERVAL)
+                reason = self.overload_reason()
+            if reason is None:
+                ADMISSION_DECISIONS.labels(outcome='deferred', reason='none').inc()
+                return
+
+        if reason is not None:
+            ADMISSION_DECISIONS.labels(outcome='rejected', reason=reason).inc()
+            raise HTTPException(
+                status_code=429,
+                detail=f"Server overloaded ({reason}), retry later",
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+            )
+
+    def admit_items(self, request, count):
+        """
+        Charge `count` batch items to the queue's headroom and the client's
+        bucket, one token per item. Returns how many of them may be enqueued
+        and, if not all, the reason the rest were refused.
+        """
+        if not ADMISSION_ENABLED:
+            return count, None
+
+        admitted, reason = count, None
+        if ADMISSION_MAX_QUEUE_DEPTH and not self.is_stale():
+            headroom = max(0, ADMISSION_MAX_QUEUE_DEPTH - self.queue_depth)
+            if headroom < admitted:
+                admitted, reason = headroom, 'queue_depth'
+        if CLIENT_RATE_LIMIT > 0 and admitted:
+            taken = self.client_bucket(request).take_up_to(admitted)
+            if taken < admitted:
+                admitted, reason = taken, 'rate_limit'
+
+        # Count admitted items until the next refresh, so concurrent batches can't each fill the headroom
+        self.queue_depth += admitted
+        if admitted:
+            ADMISSION_DECISIONS.labels(outcome='admitted', reason='none').inc(admitted)
+        if admitted < count:
+            ADMISSION_DECISIONS.labels(outcome='rejected', reason=reason).inc(count - admitted)
+        return admitted, reason
+
+    def refuse_items(self, reason):
+        """The 429 raised when none of a batch's items were admitted."""
+        return HTTPException(
+            status_code=429,
+            detail=f"Batch not admitted ({reason}), retry later",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+
+admission = AdmissionController()
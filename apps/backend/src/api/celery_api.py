@@ -1,22 +1,59 @@
-from fastapi import FastAPI, HTTPException, Path
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
-from importlib import import_module
-from src.tasks import flux, webhook_flux, websocket_flux
+import os
+import uuid
+import time
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Path, Query, BackgroundTasks, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Optional, Dict, Any, List
+from celery import group, states
+from src import codec
+from src.celery import app as celery_app, BACKEND_URL
+from src.tasks import flux, inference
+from src.adapters import get_adapter
+from src.pipeline import lookup_cached_result, deliver_cached_result
+from src.webhook_queue import get_webhook_queue
+from src.api.admission import admission, ADMISSION_ENABLED
+from src.tiers import resolve_tier, routing_options
+from src.metrics import TASKS_SUBMITTED
+
+# Bulk submission limits
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 1000))
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 100))  # Tasks published per group
+
+# Seconds a submission's result is wanted for when the request doesn't set `timeout` (0: no deadline)
+DEFAULT_TASK_TIMEOUT = float(os.environ.get('DEFAULT_TASK_TIMEOUT', 0))
+
+# Status lookup limits
+STATUS_MAX_IDS = int(os.environ.get('STATUS_MAX_IDS', 1000))  # Task IDs per status request or event stream
+STATUS_STREAM_TIMEOUT = float(os.environ.get('STATUS_STREAM_TIMEOUT', 300))  # Seconds before an event stream closes
+STATUS_STREAM_KEEPALIVE = float(os.environ.get('STATUS_STREAM_KEEPALIVE', 15))
 
 app = FastAPI(title="Celery Task API", description="API for submitting Celery tasks")
 
+@app.on_event("startup")
+async def start_admission_control():
+    # Keep the queue depth / in-flight snapshot fresh in the background
+    if ADMISSION_ENABLED:
+        app.state.admission_task = asyncio.create_task(admission.run())
+
 class TaskResponse(BaseModel):
     task_id: str
     status: str = "pending"
 
 class WebhookRequest(BaseModel):
     webhook_url: Optional[str] = None
+    webhook_batch: Optional[bool] = None
     prompt: Optional[str] = None
     seed: Optional[int] = None
     enable_base64_output: Optional[bool] = None
     cache_threshold: Optional[float] = None
     size: Optional[str] = None
+    tier: Optional[str] = None
+    timeout: Optional[float] = None
 
 class WebsocketRequest(BaseModel):
     websocket_url: Optional[str] = None
@@ -25,6 +62,9 @@ class WebsocketRequest(BaseModel):
     enable_base64_output: Optional[bool] = None
     cache_threshold: Optional[float] = None
     size: Optional[str] = None
+    tier: Optional[str] = None
+    timeout: Optional[float] = None
+    topics: Optional[List[str]] = None
     
 class DataCrunchInput(BaseModel):
     prompt: str
@@ -35,9 +75,247 @@ class DataCrunchInput(BaseModel):
     
 class DataCrunchRequest(BaseModel):
     input: DataCrunchInput
+    tier: Optional[str] = None
+    timeout: Optional[float] = None
+    topics: Optional[List[str]] = None
+
+class BatchItem(BaseModel):
+    prompt: Optional[str] = None
+    seed: Optional[int] = None
+    enable_base64_output: Optional[bool] = None
+    cache_threshold: Optional[float] = None
+    size: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+    webhook_url: Optional[str] = None
+    webhook_batch: Optional[bool] = None
+    websocket_url: Optional[str] = None
+    tier: Optional[str] = None
+    timeout: Optional[float] = None
+    topics: Optional[List[str]] = None
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    task_ids: List[str]
+    status: str = "pending"
+    errors: List[Dict[str, Any]] = []
+
+class TaskStatusRequest(BaseModel):
+    task_ids: List[str]
+
+# Request fields forwarded to the model adapter as input parameters
+INPUT_PARAMS = ('prompt', 'seed', 'enable_base64_output', 'cache_threshold', 'size')
+
+def input_params(request):
+    """Collect the model input parameters that were set on a request model."""
+    return {
+        name: getattr(request, name)
+        for name in INPUT_PARAMS
+        if getattr(request, name, None) is not None
+    }
+
+def get_adapter_or_404(inference_model):
+    adapter = get_adapter(inference_model)
+    if adapter is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Task for inference model '{inference_model}' not found"
+        )
+    return adapter
+
+def complete_cached_task(task_id, inference_model, params, sinks, cached):
+    """Deliver a cached result and record it in the result backend under its task ID."""
+    result = deliver_cached_result(task_id, inference_model, params, sinks, cached)
+    celery_app.backend.store_result(task_id, result, states.SUCCESS)
+
+def resolve_timeout_or_422(timeout):
+    """Seconds until the deadline of a submission, or None for no deadline."""
+    if timeout is None:
+        timeout = DEFAULT_TASK_TIMEOUT or None
+    elif timeout <= 0:
+        raise HTTPException(status_code=422, detail="timeout must be a positive number of seconds")
+    return timeout
+
+def deadline_options(submitted_at, timeout):
+    """Task kwargs and Celery options carrying a submission's deadline."""
+    if timeout is None:
+        return {}, {}
+    deadline = submitted_at + timeout
+    # `expires` makes Celery revoke the message if no worker took it in time
+    return {"deadline": deadline}, {"expires": datetime.fromtimestamp(deadline, timezone.utc)}
+
+async def submit_inference(inference_model, params, sinks, background_tasks, tier=None, timeout=None):
+    """
+    Enqueue an inference task on its tier's queue, or answer it from the result cache.
+
+    Cache hits never reach the queue: the response is returned immediately
+    and delivery to the sinks runs as a background task. `timeout` sets
+    the task's deadline, which is carried to the worker's upstream call.
+    """
+    tier = resolve_tier_or_422(tier)
+    timeout = resolve_timeout_or_422(timeout)
 
-@app.post("/flux", response_model=TaskResponse)
-async def submit_flux_task(request: Optional[DataCrunchRequest] = None):
+    cached = await run_in_threadpool(lookup_cached_result, inference_model, params, 'api')
+    if cached is not None:
+        task_id = str(uuid.uuid4())
+        background_tasks.add_task(complete_cached_task, task_id, inference_model, params, sinks, cached)
+        return TaskResponse(task_id=task_id, status="cached")
+
+    submitted_at = time.time()
+    deadline_kwargs, deadline_opts = deadline_options(submitted_at, timeout)
+    task = inference.apply_async(
+        args=(inference_model, params, sinks),
+        kwargs={"tier": tier, "submitted_at": submitted_at, **deadline_kwargs},
+        **routing_options(tier),
+        **deadline_opts
+    )
+    TASKS_SUBMITTED.labels(tier=tier).inc()
+    return TaskResponse(task_id=task.id)
+
+def websocket_sink(url=None, topics=None):
+    """Websocket sink spec; `topics` adds WebSocket topics beyond the task ID."""
+    sink = {"type": "websocket", "url": url}
+    if topics:
+        sink["topics"] = topics
+    return sink
+
+def webhook_sink(url=None, batch=None):
+    """Webhook sink spec; `batch` lets queued deliveries share POSTs (as a JSON array)."""
+    sink = {"type": "webhook", "url": url}
+    if batch:
+        sink["batch"] = True
+    return sink
+
+def batch_sinks(webhook_url=None, websocket_url=None, topics=None, webhook_batch=None):
+    """Sink specs for a batch: the given webhook and/or websocket, falling back to the default websocket."""
+    sinks = []
+    if webhook_url:
+        sinks.append(webhook_sink(webhook_url, webhook_batch))
+    if websocket_url or not sinks:
+        sinks.append(websocket_sink(websocket_url, topics))
+    return sinks
+
+def enqueue_group(inference_model, params_list, sinks, tier, timeout=None):
+    """Publish one inference task per params dict as a single group and return their AsyncResults."""
+    submitted_at = time.time()
+    deadline_kwargs, options = deadline_options(submitted_at, timeout)
+    options.update(routing_options(tier))
+    signatures = [
+        inference.signature(
+            (inference_model, params, sinks),
+            {"tier": tier, "submitted_at": submitted_at, **deadline_kwargs},
+            **options
+        )
+        for params in params_list
+    ]
+    result = group(signatures).apply_async()
+    TASKS_SUBMITTED.labels(tier=tier).inc(len(signatures))
+    return result.results
+
+def save_batch(batch_id, results):
+    """Record a batch's tasks in the result backend so its aggregate status can be queried."""
+    celery_app.GroupResult(batch_id, results).save()
+
+def fetch_task_metas(task_ids):
+    """Read the result metadata of many tasks, in one MGET when the backend supports it."""
+    backend = celery_app.backend
+    try:
+        values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+    except (AttributeError, NotImplementedError):
+        return [backend.get_task_meta(task_id) for task_id in task_ids]
+    return [
+        backend.decode_result(value) if value else {"status": states.PENDING, "result": None}
+        for value in values
+    ]
+
+def task_status(task_id, meta):
+    """Status response for one task. The result is only included once the task succeeded."""
+    status = {"task_id": task_id, "status": meta["status"]}
+    if meta["status"] == states.SUCCESS:
+        status["result"] = meta.get("result")
+    return status
+
+def parse_task_ids(task_ids):
+    """Deduplicate a list of task IDs and enforce STATUS_MAX_IDS."""
+    task_ids = list(dict.fromkeys(t for t in task_ids if t))
+    if not task_ids:
+        raise HTTPException(status_code=422, detail="No task IDs given")
+    if len(task_ids) > STATUS_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {STATUS_MAX_IDS} task IDs per request")
+    return task_ids
+
+_result_client = None
+
+def get_result_client():
+    """Async Redis client for the result backend, used to subscribe to task state changes."""
+    global _result_client
+    if _result_client is None:
+        import redis.asyncio as aioredis
+        _result_client = aioredis.from_url(BACKEND_URL)
+    return _result_client
+
+def sse_event(data, event=None):
+    lines = f"event: {event}\n" if event else ""
+    return f"{lines}data: {codec.dumps(data).decode()}\n\n"
+
+async def task_events(task_ids):
+    """
+    Yield server-sent events for the given tasks until all are ready.
+
+    The Redis result backend publishes every stored result on a channel
+    named after the task's result key. We subscribe before reading the
+    current states, so a transition can't slip in between.
+    """
+    backend = celery_app.backend
+    channels = {backend.get_key_for_task(task_id): task_id for task_id in task_ids}
+    pubsub = get_result_client().pubsub()
+    await pubsub.subscribe(*channels)
+    try:
+        metas = await run_in_threadpool(fetch_task_metas, task_ids)
+        pending = set()
+        for task_id, meta in zip(task_ids, metas):
+            yield sse_event(task_status(task_id, meta))
+            if meta["status"] not in states.READY_STATES:
+                pending.add(task_id)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STATUS_STREAM_TIMEOUT
+        last_sent = loop.time()
+        while pending and loop.time() < deadline:
+            timeout = min(STATUS_STREAM_KEEPALIVE, deadline - loop.time())
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+            if message is None:
+                # Also returned for skipped subscribe confirmations, so only ping when idle
+                if loop.time() - last_sent >= STATUS_STREAM_KEEPALIVE:
+                    yield ": keepalive\n\n"
+                    last_sent = loop.time()
+                continue
+            task_id = channels.get(message["channel"])
+            if task_id not in pending:
+                continue
+            meta = backend.decode_result(message["data"])
+            yield sse_event(task_status(task_id, meta))
+            last_sent = loop.time()
+            if meta["status"] in states.READY_STATES:
+                pending.discard(task_id)
+                await pubsub.unsubscribe(message["channel"])
+        yield sse_event({"pending": sorted(pending)}, event="end")
+    finally:
+        await pubsub.reset()
+
+def not_admitted(index, reason):
+    """A batch `errors` entry for an item refused by admission control."""
+    return {"index": index, "detail": f"Not admitted ({reason}), retry later"}
+
+def resolve_tier_or_422(tier):
+    try:
+        return resolve_tier(tier)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/flux", response_model=TaskResponse, dependencies=[Depends(admission.admit)])
+async def submit_flux_task(background_tasks: BackgroundTasks, request: Optional[DataCrunchRequest] = None):
     """Submit a flux task to test the inference-balancer.
     
     Can accept a DataCrunch-style payload with input.prompt format.
@@ -45,140 +323,293 @@ async def submit_flux_task(request: Optional[DataCrunchRequest] = None):
     """
     try:
         if request and request.input and request.input.prompt:
-            # If we have a DataCrunch format payload, use it
-            prompt = request.input.prompt
-            seed = request.input.seed if hasattr(request.input, 'seed') else None
-            task = websocket_flux.delay(prompt=prompt, seed=seed, enable_base64_output=request.input.enable_base64_output, cache_threshold=request.input.cache_threshold, size=request.input.size)
-        else:
-            # Otherwise use the default task
-            task = flux.delay()
+            # If we have a DataCrunch format payload, run it and forward the result to the websocket
+            return await submit_inference('flux', input_params(request.input), [websocket_sink(topics=request.topics)], background_tasks, request.tier, request.timeout)
+        # Otherwise use the default task
+        task = flux.delay()
         return TaskResponse(task_id=task.id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit task: {str(e)}")
 
-@app.post("/datacrunch_flux", response_model=TaskResponse)
-async def submit_datacrunch_flux_task(request: DataCrunchRequest):
+@app.post("/datacrunch_flux", response_model=TaskResponse, dependencies=[Depends(admission.admit)])
+async def submit_datacrunch_flux_task(request: DataCrunchRequest, background_tasks: BackgroundTasks):
     """Submit a flux task with DataCrunch API format."""
     try:
-        # Extract prompt and seed from the DataCrunch format
-        prompt = request.input.prompt
-        seed = request.input.seed
-        
-        # Call the websocket_flux task which will forward to the websocket endpoint
-        task = websocket_flux.delay(prompt=prompt, seed=seed, enable_base64_output=request.input.enable_base64_output, cache_threshold=request.input.cache_threshold, size=request.input.size)
-        return TaskResponse(task_id=task.id)
+        # Run the flux model and forward the result to the websocket endpoint
+        return await submit_inference('flux', input_params(request.input), [websocket_sink(topics=request.topics)], background_tasks, request.tier, request.timeout)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit task: {str(e)}")
 
-@app.post("/webhook/{inference_model}", response_model=TaskResponse)
+@app.post("/webhook/{inference_model}", response_model=TaskResponse, dependencies=[Depends(admission.admit)])
 async def submit_webhook_task(
     request: WebhookRequest,
+    background_tasks: BackgroundTasks,
     inference_model: str = Path(..., description="The inference model to use (e.g., flux)")
 ):
     """
     Dynamic webhook task endpoint that forwards results to the specified webhook URL.
-    The specific task is determined by the inference_model path parameter.
+    The model is determined by the inference_model path parameter, which must
+    match an adapter registered in src/adapters.py.
     """
     try:
-        # Try to get the task dynamically
-        task_name = f"webhook_{inference_model}"
-        try:
-            # First try to get it from already imported tasks
-            task_module = import_module("src.tasks")
-            task = getattr(task_module, task_name, None)
-            
-            if task is None:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Task for inference model '{inference_model}' not found"
-                )
-                
-        except (ImportError, AttributeError):
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Task for inference model '{inference_model}' not found"
-            )
-            
-        # Execute the task with all parameters
-        celery_task = task.delay(
-            webhook_url=request.webhook_url,
-            prompt=request.prompt,
-            seed=request.seed,
-            enable_base64_output=request.enable_base64_output,
-            cache_threshold=request.cache_threshold,
-            size=request.size
+        get_adapter_or_404(inference_model)
+
+        # Execute the pipeline task with all parameters
+        return await submit_inference(
+            inference_model,
+            input_params(request),
+            [webhook_sink(request.webhook_url, request.webhook_batch)],
+            background_tasks,
+            request.tier,
+            request.timeout
         )
-        return TaskResponse(task_id=celery_task.id)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit webhook task: {str(e)}")
 
-@app.post("/websocket/{inference_model}", response_model=TaskResponse)
+@app.post("/websocket/{inference_model}", response_model=TaskResponse, dependencies=[Depends(admission.admit)])
 async def submit_websocket_task(
     request: WebsocketRequest,
+    background_tasks: BackgroundTasks,
     inference_model: str = Path(..., description="The inference model to use (e.g., flux)")
 ):
     """
     Dynamic websocket task endpoint that forwards results to the specified websocket URL.
-    The specific task is determined by the inference_model path parameter.
+    The model is determined by the inference_model path parameter, which must
+    match an adapter registered in src/adapters.py.
     """
     try:
-        # Try to get the task dynamically
-        task_name = f"websocket_{inference_model}"
-        try:
-            # First try to get it from already imported tasks
-            task_module = import_module("src.tasks")
-            task = getattr(task_module, task_name, None)
-            
-            if task is None:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Task for inference model '{inference_model}' not found"
-                )
-                
-        except (ImportError, AttributeError):
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Task for inference model '{inference_model}' not found"
-            )
-            
-        # Execute the task with all parameters
-        celery_task = task.delay(
-            websocket_url=request.websocket_url,
-            prompt=request.prompt,
-            seed=request.seed,
-            enable_base64_output=request.enable_base64_output,
-            cache_threshold=request.cache_threshold,
-            size=request.size
+        get_adapter_or_404(inference_model)
+
+        # Execute the pipeline task with all parameters
+        return await submit_inference(
+            inference_model,
+            input_params(request),
+            [websocket_sink(request.websocket_url, request.topics)],
+            background_tasks,
+            request.tier,
+            request.timeout
         )
-        return TaskResponse(task_id=celery_task.id)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit websocket task: {str(e)}")
 
+@app.post("/batch/{inference_model}", response_model=BatchResponse, dependencies=[Depends(admission.admit_batch)])
+async def submit_batch(
+    request: BatchRequest,
+    http_request: Request,
+    inference_model: str = Path(..., description="The inference model to use (e.g., flux)")
+):
+    """
+    Submit many inference requests at once.
+
+    All requests are validated before anything is enqueued, then published
+    in groups of BULK_CHUNK_SIZE tasks. Admission control charges every
+    request; those over the client's rate limit or the queue's headroom are
+    not enqueued and are reported in `errors`. The returned batch ID can be
+    passed to GET /batch/{batch_id} for aggregate status.
+    """
+    get_adapter_or_404(inference_model)
+    tier = resolve_tier_or_422(request.tier)
+    timeout = resolve_timeout_or_422(request.timeout)
+    if not request.requests:
+        raise HTTPException(status_code=422, detail="Batch must contain at least one request")
+    if len(request.requests) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BULK_MAX_ITEMS} requests")
+
+    admitted, reason = admission.admit_items(http_request, len(request.requests))
+    if not admitted:
+        raise admission.refuse_items(reason)
+    errors = [not_admitted(index, reason) for index in range(admitted, len(request.requests))]
+
+    try:
+        sinks = batch_sinks(request.webhook_url, request.websocket_url, request.topics, request.webhook_batch)
+        params_list = [input_params(item) for item in request.requests[:admitted]]
+        results = []
+        for start in range(0, len(params_list), BULK_CHUNK_SIZE):
+            chunk = params_list[start:start + BULK_CHUNK_SIZE]
+            results.extend(await run_in_threadpool(enqueue_group, inference_model, chunk, sinks, tier, timeout))
+        batch_id = str(uuid.uuid4())
+        await run_in_threadpool(save_batch, batch_id, results)
+        return BatchResponse(batch_id=batch_id, task_ids=[r.id for r in results], errors=errors)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to submit batch: {str(e)}")
+
+@app.post("/batch/{inference_model}/ndjson", response_model=BatchResponse, dependencies=[Depends(admission.admit_batch)])
+async def submit_batch_ndjson(
+    request: Request,
+    inference_model: str = Path(..., description="The inference model to use (e.g., flux)"),
+    webhook_url: Optional[str] = Query(None),
+    webhook_batch: Optional[bool] = Query(None, description="POST queued results to the webhook in batches"),
+    websocket_url: Optional[str] = Query(None),
+    tier: Optional[str] = Query(None),
+    timeout: Optional[float] = Query(None, description="Seconds each request's result is wanted for"),
+    topics: Optional[str] = Query(None, description="Comma-separated WebSocket topics")
+):
+    """
+    Streaming variant of /batch/{inference_model}: one JSON request per line.
+
+    Requests are enqueued in groups while the body is still being uploaded,
+    so invalid lines can't reject the whole batch. They are skipped and
+    reported in `errors` with their zero-based line index, as are requests
+    refused by admission control.
+    """
+    get_adapter_or_404(inference_model)
+    tier = resolve_tier_or_422(tier)
+    timeout = resolve_timeout_or_422(timeout)
+    sinks = batch_sinks(webhook_url, websocket_url, [t for t in (topics or "").split(",") if t], webhook_batch)
+
+    results = []
+    errors = []
+    pending = []  # (index, params)
+    accepted = 0
+    refused = None
+    index = 0
+    buffer = b""
+
+    async def flush():
+        nonlocal refused
+        if not pending:
+            return
+        admitted, reason = admission.admit_items(request, len(pending))
+        if admitted < len(pending):
+            refused = reason
+            errors.extend(not_admitted(index, reason) for index, _ in pending[admitted:])
+        if admitted:
+            params_list = [params for _, params in pending[:admitted]]
+            results.extend(await run_in_threadpool(enqueue_group, inference_model, params_list, sinks, tier, timeout))
+        pending.clear()
+
+    def add_line(line, index):
+        nonlocal accepted
+        try:
+            item = BatchItem(**codec.loads(line))
+        except (ValueError, TypeError, ValidationError) as e:
+            errors.append({"index": index, "detail": str(e)})
+            return
+        if accepted >= BULK_MAX_ITEMS:
+            errors.append({"index": index, "detail": f"Batch exceeds {BULK_MAX_ITEMS} requests"})
+            return
+        accepted += 1
+        pending.append((index, input_params(item)))
+
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    add_line(line, index)
+                    index += 1
+            if len(pending) >= BULK_CHUNK_SIZE:
+                await flush()
+        if buffer.strip():
+            add_line(buffer, index)
+        await flush()
+
+        if not results:
+            if refused is not None:
+                raise admission.refuse_items(refused)
+            raise HTTPException(status_code=422, detail={"message": "Batch contains no valid requests", "errors": errors})
+        batch_id = str(uuid.uuid4())
+        await run_in_threadpool(save_batch, batch_id, results)
+        errors.sort(key=lambda error: error["index"])
+        return BatchResponse(batch_id=batch_id, task_ids=[r.id for r in results], errors=errors)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to submit batch: {str(e)}")
+
+@app.get("/batch/{batch_id}", response_model=Dict[str, Any])
+async def get_batch_status(batch_id: str):
+    """Get the aggregate status of a batch submitted through /batch/{inference_model}."""
+    try:
+        batch = await run_in_threadpool(celery_app.GroupResult.restore, batch_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get batch status: {str(e)}")
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch '{batch_id}' not found")
+
+    try:
+        task_ids = [r.id for r in batch.results]
+        metas = await run_in_threadpool(fetch_task_metas, task_ids)
+        counts = Counter(meta["status"] for meta in metas)
+        return {
+            "batch_id": batch_id,
+            "total": len(task_ids),
+            "completed": sum(n for status, n in counts.items() if status in states.READY_STATES),
+            "states": dict(counts),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get batch status: {str(e)}")
+
+@app.post("/tasks/status", response_model=Dict[str, Any])
+async def get_task_statuses(request: TaskStatusRequest):
+    """Get the status of many tasks with a single result backend read."""
+    task_ids = parse_task_ids(request.task_ids)
+    try:
+        metas = await run_in_threadpool(fetch_task_metas, task_ids)
+        return {"tasks": [task_status(task_id, meta) for task_id, meta in zip(task_ids, metas)]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get task status: {str(e)}")
+
+@app.get("/tasks/events")
+async def stream_task_events(ids: str = Query(..., description="Comma-separated task IDs")):
+    """
+    Server-sent events with the status of each task, followed by every
+    change until all tasks are ready or STATUS_STREAM_TIMEOUT passes.
+    Requires the Redis result backend.
+    """
+    task_ids = parse_task_ids(ids.split(','))
+    if not hasattr(celery_app.backend, 'get_key_for_task') or not BACKEND_URL.startswith(('redis://', 'rediss://')):
+        raise HTTPException(status_code=501, detail="Task events require the Redis result backend")
+    return StreamingResponse(
+        task_events(task_ids),
+        media_type="text/event-stream",
+        # Keep nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/tasks/{task_id}", response_model=Dict[str, Any])
 async def get_task_status(task_id: str):
     """Get status of a submitted task."""
     try:
-        # Create an AsyncResult instance to check task status
-        from celery.result import AsyncResult
-        task_result = AsyncResult(task_id)
-        
-        result = {
-            "task_id": task_id,
-            "status": task_result.status,
-        }
-        
-        # Include result if task is successful
-        if task_result.status == "SUCCESS":
-            result["result"] = task_result.get()
-            
-        return result
+        # Read the result off the event loop; the backend client is blocking
+        metas = await run_in_threadpool(fetch_task_metas, [task_id])
+        return task_status(task_id, metas[0])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get task status: {str(e)}")
 
+def get_webhook_queue_or_404():
+    queue = get_webhook_queue()
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Webhook queue is not enabled")
+    return queue
+
+@app.get("/webhooks/dead-letters", response_model=Dict[str, Any])
+async def get_webhook_dead_letters(limit: int = Query(100, ge=1, le=1000)):
+    """Most recent webhook deliveries that ran out of attempts or were rejected, without their bodies."""
+    queue = get_webhook_queue_or_404()
+    try:
+        return {"dead_letters": await run_in_threadpool(queue.dead_letters, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read dead letters: {str(e)}")
+
+@app.post("/webhooks/dead-letters/replay", response_model=Dict[str, Any])
+async def replay_webhook_dead_letters(limit: int = Query(100, ge=1, le=10000)):
+    """Queue the oldest dead-lettered webhook deliveries again, e.g. once a customer endpoint is fixed."""
+    queue = get_webhook_queue_or_404()
+    try:
+        return {"replayed": await run_in_threadpool(queue.replay_dead_letters, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to replay dead letters: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from src import codec
+from src.http_client import http_post, deadline_timeout, DeadlineExceeded, INFERENCE_TIMEOUT, TASK_EXECUTION_MODE
+from src.routing import upstream_call
+from src.metrics import BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Micro-batching configuration from environment variables
+BATCHING_ENABLED = os.environ.get('BATCHING_ENABLED', 'false').lower() == 'true'
+BATCH_WINDOW_MS = float(os.environ.get('BATCH_WINDOW_MS', 50))  # Maximum added latency for the first request of a batch
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+
+class _Batch:
+    def __init__(self, key):
+        self.key = key
+        self.items = []  # (adapter, body, deadline, future)
+        self.timer = None
+
+class MicroBatcher:
+    """
+    Accumulates compatible inference calls from concurrent tasks in this process.
+
+    Calls with the same batch key (model plus the adapter's `batch_fields`)
+    are collected for up to `window` seconds or `max_size` requests, then
+    dispatched together as one batched upstream request to the adapter's
+    `batch_path`. Only adapters with a batch endpoint are sent here; for the
+    others waiting out the window would add latency without saving a call.
+    A batch of one is sent as a plain request. Each task blocks on its own future, for no longer than
+    its deadline, and receives its own (status_code, response_text). Upstream
+    calls are timed to the deadlines of the requests they carry.
+
+    Batching only has an effect when one process runs many tasks at once,
+    i.e. with the threads pool used by the async execution mode.
+    """
+
+    def __init__(self, window=BATCH_WINDOW_MS / 1000.0, max_size=BATCH_MAX_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix='batch-dispatch')
+
+    def call(self, adapter, params, body, deadline=None):
+        """Send a serialized request with the next batch and wait for its (status_code, response_text)."""
+        future = self.submit(adapter, params, body, deadline)
+        if deadline is not None:
+            wait = deadline - time.time()
+        else:
+            wait = self.window + sum(INFERENCE_TIMEOUT)
+        try:
+            return future.result(timeout=max(0, wait))
+        except FutureTimeout:
+            future.cancel()
+            if deadline is not None:
+                raise DeadlineExceeded("Deadline exceeded waiting for the batched inference call")
+            raise TimeoutError("Timed out waiting for the batched inference call")
+
+    def submit(self, adapter, params, body, deadline=None):
+        """Queue a serialized request and return a future for its (status_code, response_text)."""
+        key = adapter.batch_key(params)
+        future = Future()
+        flush = None
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = _Batch(key)
+                self._pending[key] = batch
+                batch.timer = threading.Timer(self.window, self._flush_expired, args=(batch,))
+                batch.timer.daemon = True
+                batch.timer.start()
+            batch.items.append((adapter, body, deadline, future))
+            if len(batch.items) >= self.max_size:
+                del self._pending[key]
+                batch.timer.cancel()
+                flush = batch
+        if flush is not None:
+            self._dispatch(flush)
+        return future
+
+    def _flush_expired(self, batch):
+        with self._lock:
+            # The batch may already have been flushed for reaching max_size
+            if self._pending.get(batch.key) is not batch:
+                return
+            del self._pending[batch.key]
+        self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        BATCH_SIZE.labels(model=batch.key[0]).observe(len(batch.items))
+        # Requests whose task stopped waiting or whose deadline passed during the window aren't sent
+        now = time.time()
+        items = []
+        for item in batch.items:
+            _, _, deadline, future = item
+            if deadline is not None and deadline <= now:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(DeadlineExceeded("Deadline exceeded before calling the inference backend"))
+            elif future.set_running_or_notify_cancel():
+                items.append(item)
+        if not items:
+            return
+        adapter = items[0][0]
+        try:
+            if adapter.supports_batch and len(items) > 1:
+                self._dispatch_batched(adapter, items)
+            else:
+                self._dispatch_each(items)
+        except Exception as e:
+            for _, _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _dispatch_batched(self, adapter, items):
+        """Send all requests as one upstream call, timed to the latest of their deadlines, and split the response."""
+        payloads = [codec.loads(body) for _, body, _, _ in items]
+        deadlines = [deadline for _, _, deadline, _ in items]
+        timeout = deadline_timeout(None if None in deadlines else max(deadlines))
+        with upstream_call(adapter.batch_path or adapter.path) as call:
+            response = http_post(call.url, data=codec.dumps(adapter.build_batch_request(payloads)), timeout=timeout)
+            call.status_code = response.status_code
+        results = adapter.split_batch_response(response.status_code, response.text, len(items))
+        for (_, _, _, future), result in zip(items, results):
+            future.set_result(result)
+
+    def _dispatch_each(self, items):
+        """Send each request as a plain call over the shared pool and resolve its future when it completes."""
+        if TASK_EXECUTION_MODE == 'async':
+            from src.aio import get_runtime
+            runtime = get_runtime()
+            for adapter, body, deadline, future in items:
+                task = asyncio.run_coroutine_threadsafe(_send_async(runtime, adapter, body, deadline), runtime.loop)
+                task.add_done_callback(lambda done, future=future: _resolve(future, done))
+        else:
+            for adapter, body, deadline, future in items:
+                task = self._executor.submit(_send, adapter, body, deadline)
+                task.add_done_callback(lambda done, future=future: _resolve(future, done))
+
+def _send(adapter, body, deadline=None):
+    timeout = deadline_timeout(deadline)
+    with upstream_call(adapter.path) as call:
+        response = http_post(call.url, data=body, timeout=timeout)
+        call.status_code = response.status_code
+        return response
+
+async def _send_async(runtime, adapter, body, deadline=None):
+    timeout = deadline_timeout(deadline)
+    with upstream_call(adapter.path) as call:
+        response = await runtime.request('POST', call.url, data=body, timeout=timeout)
+        call.status_code = response.status_code
+        return response
+
+def _resolve(future, done):
+    """Copy the outcome of an upstream call into the task's future as (status_code, response_text)."""
+    if done.exception() is not None:
+        future.set_exception(done.exception())
+    else:
+        response = done.result()
+        future.set_result((response.status_code, response.text))
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    """Return the process-wide micro-batcher, or None when batching is disabled."""
+    global _batcher
+    if not BATCHING_ENABLED:
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher()
+    return _batcher
@@ -0,0 +1,165 @@
+import os
+import re
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Blob storage configuration from environment variables
+BLOB_STORE_BACKEND = os.environ.get('BLOB_STORE_BACKEND', 'none').lower()  # 'none', 'filesystem' or 's3'
+BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', '/data/blobs')
+# Served by the websocket server's HTTP port (GET /blobs/{key}), next to /publish
+BLOB_PUBLIC_URL = os.environ.get('BLOB_PUBLIC_URL', 'http://visualize-websocket.frontend.svc.cluster.local:8766/blobs').rstrip('/')
+BLOB_S3_BUCKET = os.environ.get('BLOB_S3_BUCKET', '')
+BLOB_S3_ENDPOINT_URL = os.environ.get('BLOB_S3_ENDPOINT_URL') or None  # For S3-compatible stores (MinIO, R2, ...)
+BLOB_S3_PREFIX = os.environ.get('BLOB_S3_PREFIX', '')
+
+# Blob keys are the SHA-256 of the content plus an extension
+BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}\.(jpg|png|webp|bin)$')
+
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'application/octet-stream': 'bin',
+}
+
+def sniff_content_type(data):
+    """Detect the image type from its magic bytes."""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+def decode_base64_output(value):
+    """
+    Decode a base64 model output, with or without a `data:` URI prefix.
+
+    Returns (bytes, content_type).
+    """
+    content_type = None
+    if value.startswith('data:'):
+        header, value = value.split(',', 1)
+        content_type = header[5:].split(';', 1)[0] or None
+    data = base64.b64decode(value)
+    return data, content_type or sniff_content_type(data)
+
+def blob_key(data, content_type):
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest}.{CONTENT_TYPE_EXTENSIONS.get(content_type, 'bin')}"
+
+class BlobStore:
+    """
+    Content-addressed storage for generated images.
+
+    Only the blob's URL travels through Redis, webhooks and WebSocket frames;
+    identical outputs map to the same key and are written once.
+    """
+
+    def __init__(self, public_url=BLOB_PUBLIC_URL):
+        self.public_url = public_url
+
+    def url(self, key):
+        return f"{self.public_url}/{key}"
+
+    def put(self, data, content_type):
+        """Store `data` and return its public URL."""
+        key = blob_key(data, content_type)
+        if not self.exists(key):
+            self.write(key, data, content_type)
+        return self.url(key)
+
+    def put_base64(self, value):
+        data, content_type = decode_base64_output(value)
+        return self.put(data, content_type)
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def write(self, key, data, content_type):
+        raise NotImplementedError
+
+def blob_path(root, key):
+    """Filesystem location of a blob, sharded by the first two hex digits."""
+    return os.path.join(root, key[:2], key)
+
+class FilesystemBlobStore(BlobStore):
+    """Stores blobs in a local or shared directory; the websocket server serves them from `/blobs/{key}`."""
+
+    def __init__(self, root=BLOB_STORE_DIR, public_url=BLOB_PUBLIC_URL):
+        super().__init__(public_url)
+        self.root = root
+
+    def exists(self, key):
+        return os.path.exists(blob_path(self.root, key))
+
+    def write(self, key, data, content_type):
+        path = blob_path(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+class S3BlobStore(BlobStore):
+    """Stores blobs in an S3-compatible bucket. Requires the optional `boto3` package."""
+
+    def __init__(self, bucket=BLOB_S3_BUCKET, endpoint_url=BLOB_S3_ENDPOINT_URL, prefix=BLOB_S3_PREFIX, public_url=BLOB_PUBLIC_URL):
+        super().__init__(public_url)
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("BLOB_STORE_BACKEND=s3 requires the boto3 package")
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+    def write(self, key, data, content_type):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=data,
+            ContentType=content_type,
+            CacheControl='public, max-age=31536000, immutable',
+        )
+
+BLOB_STORE_BACKENDS = {
+    'filesystem': FilesystemBlobStore,
+    's3': S3BlobStore,
+}
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+def get_blob_store():
+    """Return the configured blob store for this process, or None when offloading is disabled."""
+    global _blob_store
+    if BLOB_STORE_BACKEND == 'none':
+        return None
+    if _blob_store is None:
+        backend = BLOB_STORE_BACKENDS.get(BLOB_STORE_BACKEND)
+        if backend is None:
+            raise ValueError(f"Unknown BLOB_STORE_BACKEND: {BLOB_STORE_BACKEND}")
+        with _blob_store_lock:
+            if _blob_store is None:
+                _blob_store = backend()
+                logger.info(f"Blob store initialized (backend={BLOB_STORE_BACKEND}, public_url={BLOB_PUBLIC_URL})")
+    return _blob_store
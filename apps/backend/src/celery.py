@@ -1,9 +1,14 @@
 from celery import Celery
 import os
+from src.codec import TASK_SERIALIZER, RESULT_SERIALIZER, ACCEPT_CONTENT, RESULT_ACCEPT_CONTENT
 
 # Get broker and backend URLs from environment variables or use defaults
 BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
 BACKEND_URL = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
+# How a worker consuming several queues picks the next one: 'priority' always
+# drains queues in the order given to -Q (interactive before batch),
+# 'round_robin' alternates between them
+BROKER_QUEUE_ORDER_STRATEGY = os.environ.get('BROKER_QUEUE_ORDER_STRATEGY', 'priority')
 
 # Configure Celery app
 app = Celery(
@@ -16,12 +21,14 @@ app = Celery(
 # Optional configuration
 app.conf.update(
     result_expires=3600,  # Results expire after 1 hour
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    task_serializer=TASK_SERIALIZER,  # See src/codec.py (CELERY_SERIALIZER)
+    accept_content=ACCEPT_CONTENT,
+    result_serializer=RESULT_SERIALIZER,
+    result_accept_content=RESULT_ACCEPT_CONTENT,
     timezone='UTC',
     enable_utc=True,
     task_default_queue='default',  # Ensure tasks go to the default queue
+    broker_transport_options={'queue_order_strategy': BROKER_QUEUE_ORDER_STRATEGY},
 )
 
 if __name__ == '__main__':
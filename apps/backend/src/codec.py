@@ -0,0 +1,88 @@
+import os
+import json
+import zlib
+import logging
+import importlib.util
+from kombu.serialization import register, dumps as kombu_dumps, loads as kombu_loads, registry
+
+logger = logging.getLogger(__name__)
+
+# Serializer for Celery task messages and results: 'json', 'orjson' or 'msgpack'.
+# JSON stays accepted either way, so messages queued before a switch still decode.
+CELERY_SERIALIZER = os.environ.get('CELERY_SERIALIZER', 'json')
+# zlib-compress stored results larger than this many bytes (0 disables)
+RESULT_COMPRESSION_THRESHOLD = int(os.environ.get('RESULT_COMPRESSION_THRESHOLD', 0))
+RESULT_COMPRESSION_LEVEL = int(os.environ.get('RESULT_COMPRESSION_LEVEL', 1))
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj):
+    """Serialize to JSON bytes, with orjson when it's installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def loads(data):
+    """Parse JSON from bytes or str, with orjson when it's installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+def resolve_serializer(name):
+    """Return the serializer to use for `name`, falling back to json when its library isn't installed."""
+    if name in ('orjson', 'msgpack') and not _installed(name):
+        logger.warning(f"CELERY_SERIALIZER={name} but {name} is not installed, using json")
+        return 'json'
+    if name not in ('json', 'orjson', 'msgpack'):
+        raise ValueError(f"Unknown CELERY_SERIALIZER '{name}', expected json, orjson or msgpack")
+    return name
+
+def register_result_serializer(base, threshold=RESULT_COMPRESSION_THRESHOLD, level=RESULT_COMPRESSION_LEVEL):
+    """
+    Register '<base>-result' for the result backend and return its name.
+
+    Results are encoded with `base` and zlib-compressed when larger than
+    `threshold` bytes (0 never compresses). Decoding recognizes compressed
+    payloads by the zlib header byte (0x78) and JSON ones by their leading
+    '{'. Neither starts a msgpack-encoded result, which is always a map, so
+    results stored before a change of serializer or threshold still decode.
+    """
+    name = f'{base}-result'
+    content_type, content_encoding, _ = registry._encoders[base]
+
+    def encode(obj):
+        _, _, payload = kombu_dumps(obj, serializer=base)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if threshold and len(payload) > threshold:
+            return zlib.compress(payload, level)
+        return payload
+
+    def decode(data):
+        if isinstance(data, str):
+            data = data.encode()
+        if data[:1] == b'\x78':
+            data = zlib.decompress(data)
+        if data[:1] == b'{':
+            return loads(data)
+        return kombu_loads(data, content_type, content_encoding, accept={content_type})
+
+    register(name, encode, decode, content_type=f'application/x-{name}', content_encoding='binary')
+    return name
+
+if orjson is not None:
+    register('orjson', orjson.dumps, orjson.loads, content_type='application/x-orjson', content_encoding='binary')
+
+TASK_SERIALIZER = resolve_serializer(CELERY_SERIALIZER)
+if TASK_SERIALIZER == 'json' and not RESULT_COMPRESSION_THRESHOLD:
+    RESULT_SERIALIZER = 'json'
+else:
+    RESULT_SERIALIZER = register_result_serializer(TASK_SERIALIZER)
+ACCEPT_CONTENT = sorted({'json', TASK_SERIALIZER})
+RESULT_ACCEPT_CONTENT = sorted({'json', TASK_SERIALIZER, RESULT_SERIALIZER})
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+import os
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit
+from src.aio import httpx_timeout
+from src.http_client import DELIVERY_TIMEOUT
+from src.webhook_queue import get_webhook_queue, retry_delay, WEBHOOK_MAX_ATTEMPTS
+from src.metrics import start_metrics_server, WEBHOOK_DELIVERIES, WEBHOOK_BATCH_SIZE, WEBHOOK_QUEUE_DEPTH
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+WEBHOOK_CLAIM_SIZE = int(os.environ.get('WEBHOOK_CLAIM_SIZE', 500))  # Deliveries claimed from Redis at once
+WEBHOOK_CONCURRENCY = int(os.environ.get('WEBHOOK_CONCURRENCY', 500))  # POSTs in flight at once, across destinations
+WEBHOOK_DESTINATION_CONCURRENCY = int(os.environ.get('WEBHOOK_DESTINATION_CONCURRENCY', 10))  # ... and per destination
+WEBHOOK_BATCH_MAX_SIZE = int(os.environ.get('WEBHOOK_BATCH_MAX_SIZE', 50))  # Results per POST to a batching endpoint
+# A claimed delivery is retried after this long if its deliverer died mid-send
+WEBHOOK_LEASE_SECONDS = float(os.environ.get('WEBHOOK_LEASE_SECONDS', 120))
+# Connection pools of destinations without traffic for this long are closed
+WEBHOOK_DESTINATION_IDLE_SECONDS = float(os.environ.get('WEBHOOK_DESTINATION_IDLE_SECONDS', 300))
+WEBHOOK_TICK = float(os.environ.get('WEBHOOK_TICK', 0.1))  # Seconds between claims when nothing is due
+WEBHOOK_BUSY_DELAY = 1.0  # Deliveries for a destination at its concurrency limit are put back for this long
+
+# Statuses worth retrying; other non-2xx answers are dead-lettered at once
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+class Destination:
+    """Connection pool and in-flight count for one webhook origin (scheme://host:port)."""
+
+    def __init__(self):
+        import httpx
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=WEBHOOK_DESTINATION_CONCURRENCY,
+                max_keepalive_connections=WEBHOOK_DESTINATION_CONCURRENCY,
+            ),
+            timeout=httpx_timeout(DELIVERY_TIMEOUT),
+            headers={"Content-Type": "application/json"},
+        )
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+def retry_after(response):
+    """Seconds from a Retry-After header, or None (HTTP dates aren't supported)."""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class Deliverer:
+    """
+    Delivers queued webhook results, keeping slow customer endpoints away
+    from the inference workers.
+
+    Each destination origin gets its own keep-alive pool and at most
+    WEBHOOK_DESTINATION_CONCURRENCY requests in flight. Deliveries for a
+    busy destination are put back briefly rather than waiting for a slot,
+    so one slow endpoint can't hold up the others. Results for endpoints
+    that accept batches are POSTed together as a JSON array. Failed
+    deliveries are retried with exponential backoff and jitter; permanent
+    failures (4xx other than 408/425/429) and deliveries out of attempts
+    go to the dead-letter list.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.destinations = {}
+        self.active = set()
+
+    async def run(self):
+        logger.info(f"Webhook deliverer started (concurrency={WEBHOOK_CONCURRENCY}, per destination={WEBHOOK_DESTINATION_CONCURRENCY})")
+        while True:
+            claimed = []
+            free = WEBHOOK_CONCURRENCY - len(self.active)
+            if free > 0:
+                try:
+                    claimed, queued = await asyncio.to_thread(self.queue.claim, min(free, WEBHOOK_CLAIM_SIZE), WEBHOOK_LEASE_SECONDS)
+                    WEBHOOK_QUEUE_DEPTH.set(queued)
+                except Exception as e:
+                    logger.error(f"Error claiming webhook deliveries: {str(e)}")
+            await self.dispatch(claimed)
+            await self.close_idle()
+            if len(claimed) < WEBHOOK_CLAIM_SIZE:
+                await asyncio.sleep(WEBHOOK_TICK)
+
+    async def dispatch(self, claimed):
+        """Group claimed deliveries into POSTs and start those whose destination has a free slot."""
+        posts = {}
+        for job, body in claimed:
+            # Batching endpoints share POSTs per URL; everything else is sent alone
+            key = job["url"] if job.get("batch") else job["id"]
+            posts.setdefault(key, []).append((job, body))
+        busy = []
+        for items in posts.values():
+            for start in range(0, len(items), WEBHOOK_BATCH_MAX_SIZE):
+                chunk = items[start:start + WEBHOOK_BATCH_MAX_SIZE]
+                destination = self.destination(chunk[0][0]["url"])
+                if destination.in_flight >= WEBHOOK_DESTINATION_CONCURRENCY:
+                    busy.extend(job for job, _ in chunk)
+                    continue
+                destination.in_flight += 1
+                task = asyncio.ensure_future(self.send(destination, chunk))
+                self.active.add(task)
+                task.add_done_callback(self.active.discard)
+        if busy:
+            WEBHOOK_DELIVERIES.labels(outcome='deferred').inc(len(busy))
+            try:
+                await asyncio.to_thread(self.queue.defer, busy, WEBHOOK_BUSY_DELAY)
+            except Exception as e:
+                # The lease runs out and they are claimed again
+                logger.error(f"Error deferring webhook deliveries: {str(e)}")
+
+    def destination(self, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self.destinations:
+            self.destinations[origin] = Destination()
+        return self.destinations[origin]
+
+    async def close_idle(self):
+        now = time.monotonic()
+        for origin, destination in list(self.destinations.items()):
+            if destination.in_flight == 0 and now - destination.last_used > WEBHOOK_DESTINATION_IDLE_SECONDS:
+                del self.destinations[origin]
+                await destination.client.aclose()
+
+    async def send(self, destination, items):
+        url = items[0][0]["url"]
+        if items[0][0].get("batch"):
+            # The bodies are JSON already, so the array is built without re-encoding them
+            payload = b"[" + b",".join(body for _, body in items) + b"]"
+            WEBHOOK_BATCH_SIZE.observe(len(items))
+        else:
+            payload = items[0][1]
+        status_code, error, delay = None, None, None
+        try:
+            response = await destination.client.post(url, content=payload)
+            status_code, delay = response.status_code, retry_after(response)
+            error = None if 200 <= status_code < 300 else f"HTTP {status_code}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        finally:
+            destination.in_flight -= 1
+            destination.last_used = time.monotonic()
+        try:
+            await asyncio.to_thread(self.record, items, status_code, error, delay)
+        except Exception as e:
+            logger.error(f"Error recording webhook delivery to {url}: {str(e)}")
+
+    def record(self, items, status_code, error, delay):
+        """Complete, retry or dead-letter the deliveries of one POST."""
+        url = items[0][0]["url"]
+        if error is None:
+            self.queue.complete([job for job, _ in items])
+            WEBHOOK_DELIVERIES.labels(outcome='delivered').inc(len(items))
+            return
+        if status_code is not None and status_code not in RETRY_STATUSES:
+            logger.warning(f"Webhook {url} rejected {len(items)} deliveries ({error}), dead-lettering")
+            self.queue.dead_letter(items, error)
+            WEBHOOK_DELIVERIES.labels(outcome='dead_lettered').inc(len(items))
+            return
+        retry, dead, due = [], [], {}
+        for job, body in items:
+            job["attempts"] += 1
+            job["last_error"] = error
+            if job["attempts"] >= WEBHOOK_MAX_ATTEMPTS:
+                dead.append((job, body))
+            else:
+                retry.append(job)
+                due[job["id"]] = time.time() + retry_delay(job["attempts"], delay)
+        logger.warning(f"Webhook delivery to {url} failed ({error}): {len(retry)} to retry, {len(dead)} out of attempts")
+        if retry:
+            self.queue.retry(retry, due)
+            WEBHOOK_DELIVERIES.labels(outcome='retried').inc(len(retry))
+        if dead:
+            self.queue.dead_letter(dead, error)
+            WEBHOOK_DELIVERIES.labels(outcome='dead_lettered').inc(len(dead))
+
+if __name__ == '__main__':
+    queue = get_webhook_queue()
+    if queue is None:
+        raise SystemExit("WEBHOOK_QUEUE_ENABLED is not set; workers deliver webhooks themselves")
+    start_metrics_server()
+    asyncio.run(Deliverer(queue).run())
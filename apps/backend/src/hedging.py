@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from src.routing import upstream_call, call_failed, parse_backends, INFERENCE_BACKENDS
+from src.http_client import DeadlineExceeded
+from src.metrics import HEDGED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Send a second copy of a slow inference call to another backend and use whichever answers first
+HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', 'false').lower() == 'true'
+# Hedge once the call has taken longer than this percentile of recent call latencies
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 95))
+# Fixed hedge delay in seconds, instead of the percentile (0 uses the percentile)
+HEDGE_DELAY = float(os.environ.get('HEDGE_DELAY', 0))
+# Latencies needed before the percentile is trusted; no hedging until then
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', 20))
+HEDGE_WINDOW = int(os.environ.get('HEDGE_WINDOW', 1000))  # Recent latencies the percentile is taken over
+# Hedges allowed, as a percentage of calls, so hedging can't double the load on a struggling fleet
+HEDGE_BUDGET_PERCENT = float(os.environ.get('HEDGE_BUDGET_PERCENT', 10))
+HEDGE_BUDGET_BURST = float(os.environ.get('HEDGE_BUDGET_BURST', 10))  # Hedges that can be sent back to back
+
+# A hedge has to go to a different backend, so it needs at least two distinct INFERENCE_BACKENDS
+HEDGE_POSSIBLE = len({url for url, _ in parse_backends(INFERENCE_BACKENDS)}) >= 2
+if HEDGE_ENABLED and not HEDGE_POSSIBLE:
+    logger.warning("HEDGE_ENABLED needs at least two distinct INFERENCE_BACKENDS; hedging is disabled")
+
+class Hedger:
+    """
+    Sends inference calls with at most one hedge.
+
+    The primary call starts at once. If it hasn't answered after the hedge
+    delay (a percentile of recent latencies, or HEDGE_DELAY), a duplicate
+    is sent to a different backend, and the first successful response wins.
+    The other call is cancelled, which closes its connection; a cancelled
+    call isn't counted as a failure of its backend. Hedges draw from a token
+    bucket refilled by HEDGE_BUDGET_PERCENT of the calls.
+
+    Calls run on the async runtime in both execution modes, since a call
+    blocked in a requests session can't be cancelled.
+    """
+
+    def __init__(self):
+        self.latencies = deque(maxlen=HEDGE_WINDOW)
+        self.tokens = HEDGE_BUDGET_BURST
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        if HEDGE_DELAY > 0:
+            return HEDGE_DELAY
+        with self._lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return ordered[index]
+
+    def _record(self, elapsed):
+        with self._lock:
+            self.latencies.append(elapsed)
+
+    def _earn(self):
+        with self._lock:
+            self.tokens = min(HEDGE_BUDGET_BURST, self.tokens + HEDGE_BUDGET_PERCENT / 100)
+
+    def _spend(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def post(self, path, body, timeout, deadline=None):
+        """Send `body` to `path` (hedged) and return (status_code, response_text)."""
+        from src.aio import get_runtime
+        runtime = get_runtime()
+        return runtime.run(self._post(runtime, path, body, timeout, deadline))
+
+    async def _attempt(self, runtime, path, body, timeout, backends, primary=False):
+        # Each attempt avoids the backends earlier attempts went to
+        with upstream_call(path, exclude=list(backends)) as call:
+            backends.append(call.backend)
+            started = time.monotonic()
+            try:
+                response = await runtime.request('POST', call.url, data=body, timeout=timeout)
+            except asyncio.CancelledError:
+                # A primary that lost to its hedge took at least this long. Leaving
+                # the slow tail out of the window would pull the percentile down.
+                if primary:
+                    self._record(time.monotonic() - started)
+                raise
+            call.status_code = response.status_code
+        if not call_failed(response.status_code):
+            self._record(time.monotonic() - started)
+        return response
+
+    async def _post(self, runtime, path, body, timeout, deadline):
+        self._earn()
+        backends = []
+        attempts = [asyncio.ensure_future(self._attempt(runtime, path, body, timeout, backends, primary=True))]
+        remaining = None if deadline is None else deadline - time.time()
+        delay = self.delay()
+        try:
+            # A hedge that can't start before the deadline is pointless
+            if delay is not None and (remaining is None or delay < remaining):
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    if self._spend():
+                        HEDGED_REQUESTS.labels(outcome='sent').inc()
+                        attempts.append(asyncio.ensure_future(self._attempt(runtime, path, body, timeout, backends)))
+                    else:
+                        HEDGED_REQUESTS.labels(outcome='over_budget').inc()
+            winner, response = await self._first_success(attempts, deadline)
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+        if winner is not attempts[0] and not call_failed(response.status_code):
+            HEDGED_REQUESTS.labels(outcome='won').inc()
+        return response.status_code, response.text
+
+    @staticmethod
+    async def _first_success(attempts, deadline):
+        """Return (attempt, response) for the first successful response, else the last failed one, or raise its error."""
+        pending = set(attempts)
+        winner, response, error = None, None, None
+        while pending:
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("Deadline exceeded waiting for the inference backend")
+            for attempt in done:
+                if attempt.exception() is not None:
+                    error = attempt.exception()
+                    continue
+                winner, response = attempt, attempt.result()
+                if not call_failed(response.status_code):
+                    return winner, response
+        if response is not None:
+            return winner, response
+        raise error
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+def get_hedger():
+    """Return this process's hedger, or None when hedging is disabled or there's no second backend."""
+    global _hedger
+    if not HEDGE_ENABLED or not HEDGE_POSSIBLE:
+        return None
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger()
+    return _hedger
@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from celery.signals import worker_process_init, worker_process_shutdown
+
+logger = logging.getLogger(__name__)
+
+# 'sync' sends requests from the task thread with a pooled requests session;
+# 'async' hands them to the per-process event loop in src/aio.py
+TASK_EXECUTION_MODE = os.environ.get('TASK_EXECUTION_MODE', 'sync').lower()
+
+# Connection pool configuration from environment variables
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))  # Number of upstream hosts to keep pools for
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))  # Keep-alive connections per upstream host
+HTTP_POOL_BLOCK = os.environ.get('HTTP_POOL_BLOCK', 'false').lower() == 'true'  # Wait for a free connection instead of opening extra ones
+
+# Timeouts (seconds). The inference balancer allows up to 10 minute reads.
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 600))
+HTTP_DELIVERY_READ_TIMEOUT = float(os.environ.get('HTTP_DELIVERY_READ_TIMEOUT', 30))
+
+# Retry configuration
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+HTTP_RETRY_STATUSES = (502, 503, 504)
+
+# (connect, read) timeout tuples as accepted by requests
+INFERENCE_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+DELIVERY_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_DELIVERY_READ_TIMEOUT)
+
+class DeadlineExceeded(Exception):
+    """A request's deadline passed before its upstream call could complete."""
+
+def deadline_timeout(deadline, timeout=INFERENCE_TIMEOUT):
+    """Shorten a (connect, read) timeout to the time left before `deadline` (epoch seconds, or None)."""
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded before calling the inference backend")
+    connect, read = timeout
+    return (min(connect, remaining), min(read, remaining))
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session():
+    """
+    Create a requests session with a bounded keep-alive pool per upstream host.
+
+    Failed connection attempts are retried with exponential backoff for every
+    method, since the request never reached the server. Read errors and
+    retryable status codes are only retried for idempotent methods, so a POST
+    to the inference balancer is never sent twice.
+    """
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=HTTP_POOL_BLOCK,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+def get_session():
+    """Return the shared session for this process, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+@worker_process_init.connect
+def init_session(**kwargs):
+    """Create a fresh session in each worker process so pooled sockets are never shared across a fork."""
+    global _session
+    with _session_lock:
+        _session = create_session()
+    logger.info(f"HTTP session initialized (pool_maxsize={HTTP_POOL_MAXSIZE}, timeout={INFERENCE_TIMEOUT}, retries={HTTP_MAX_RETRIES})")
+
+@worker_process_shutdown.connect
+def close_session(**kwargs):
+    """Close pooled connections when the worker process exits."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def http_request(method, url, **kwargs):
+    """Send a request through this process's transport for the configured execution mode."""
+    if TASK_EXECUTION_MODE == 'async':
+        from src.aio import get_runtime
+        runtime = get_runtime()
+        return runtime.run(runtime.request(method, url, **kwargs))
+    return get_session().request(method, url, **kwargs)
+
+def http_stream(method, url, **kwargs):
+    """
+    Send a request and return the response without reading its body.
+
+    The response has `status_code`, `text`, `iter_lines()` and `close()` like
+    a streamed requests response, in both execution modes. Callers must
+    close it.
+    """
+    if TASK_EXECUTION_MODE == 'async':
+        from src.aio import get_runtime
+        return get_runtime().stream(method, url, **kwargs)
+    return get_session().request(method, url, stream=True, **kwargs)
+
+def http_post(url, **kwargs):
+    return http_request('POST', url, **kwargs)
+
+def http_get(url, **kwargs):
+    return http_request('GET', url, **kwargs)
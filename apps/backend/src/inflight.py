@@ -0,0 +1,47 @@
+import os
+import time
+import logging
+import threading
+import redis
+from celery.signals import task_prerun, task_postrun
+from src.celery import BROKER_URL
+
+logger = logging.getLogger(__name__)
+
+# Workers record running tasks so the API can read the in-flight count for admission control
+INFLIGHT_TRACKING_ENABLED = os.environ.get('INFLIGHT_TRACKING_ENABLED', 'false').lower() == 'true'
+INFLIGHT_KEY = os.environ.get('INFLIGHT_KEY', 'tasks:in-flight')
+# Entries older than this are ignored, so tasks lost to a crashed worker stop counting
+INFLIGHT_MAX_AGE = int(os.environ.get('INFLIGHT_MAX_AGE', 900))
+
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(BROKER_URL)
+    return _client
+
+@task_prerun.connect
+def track_task_started(task_id=None, **kwargs):
+    if not INFLIGHT_TRACKING_ENABLED:
+        return
+    try:
+        _get_client().zadd(INFLIGHT_KEY, {task_id: time.time()})
+    except redis.RedisError as e:
+        logger.warning(f"Could not record in-flight task {task_id}: {str(e)}")
+
+@task_postrun.connect
+def track_task_finished(task_id=None, **kwargs):
+    if not INFLIGHT_TRACKING_ENABLED:
+        return
+    try:
+        pipe = _get_client().pipeline(transaction=False)
+        pipe.zrem(INFLIGHT_KEY, task_id)
+        pipe.zremrangebyscore(INFLIGHT_KEY, 0, time.time() - INFLIGHT_MAX_AGE)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not clear in-flight task {task_id}: {str(e)}")
@@ -0,0 +1,123 @@
+import os
+import logging
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Port scraped by Prometheus on worker pods (see the worker deployment annotations)
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 9090))
+
+# Result cache
+RESULT_CACHE_LOOKUPS = Counter(
+    'result_cache_lookups_total',
+    'Result cache lookups by where they happened and their outcome',
+    ['source', 'outcome'],
+)
+
+# Single-flight request coalescing
+SINGLEFLIGHT_REQUESTS = Counter(
+    'singleflight_requests_total',
+    'Deterministic requests by single-flight role (owner, waiter, fallback)',
+    ['role'],
+)
+
+# Micro-batching
+BATCH_SIZE = Histogram(
+    'inference_batch_size',
+    'Number of inference calls dispatched together',
+    ['model'],
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+# Streamed inference
+STREAM_EVENTS = Counter(
+    'inference_stream_events_total',
+    'Events read from streamed model responses (forwarded, throttled, result)',
+    ['outcome'],
+)
+
+# Adaptive routing between inference backends
+ROUTING_REQUESTS = Counter(
+    'inference_backend_requests_total',
+    'Upstream inference calls by backend and outcome (success, failure)',
+    ['backend', 'outcome'],
+)
+ROUTING_EJECTIONS = Counter(
+    'inference_backend_ejections_total',
+    'Backends ejected as outliers, by reason (error_rate, latency)',
+    ['backend', 'reason'],
+)
+ROUTING_LATENCY = Gauge('inference_backend_latency_seconds', 'Latency moving average per backend', ['backend'])
+HEDGED_REQUESTS = Counter(
+    'inference_hedged_requests_total',
+    'Hedged inference calls (sent, won, over_budget)',
+    ['outcome'],
+)
+
+# Poller
+POLL_CHECKS = Counter(
+    'poller_checks_total',
+    'Prediction status checks by model and outcome (pending, finished, error, expired)',
+    ['model', 'outcome'],
+)
+POLL_OUTSTANDING = Gauge('poller_outstanding_predictions', 'Predictions waiting to be checked')
+POLL_PREDICTION_SECONDS = Histogram(
+    'poller_prediction_seconds',
+    'Time from submission until a prediction was seen to finish, by model',
+    ['model'],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+
+# Webhook deliverer
+WEBHOOK_DELIVERIES = Counter(
+    'webhook_deliveries_total',
+    'Queued webhook deliveries by outcome (delivered, retried, deferred, dead_lettered)',
+    ['outcome'],
+)
+WEBHOOK_BATCH_SIZE = Histogram(
+    'webhook_batch_size',
+    'Results per POST to endpoints that accept batches',
+    buckets=(1, 2, 5, 10, 20, 50, 100),
+)
+WEBHOOK_QUEUE_DEPTH = Gauge('webhook_queue_depth', 'Webhook deliveries queued or awaiting retry')
+
+# Admission control (API)
+ADMISSION_DECISIONS = Counter(
+    'admission_decisions_total',
+    'Task submissions by admission outcome (admitted, deferred, rejected) and reason',
+    ['outcome', 'reason'],
+)
+QUEUE_DEPTH = Gauge('celery_queue_depth', 'Messages waiting in the admission-controlled broker queues')
+TASKS_IN_FLIGHT = Gauge('celery_tasks_in_flight', 'Tasks currently running on workers')
+
+# Priority tiers
+TASKS_SUBMITTED = Counter('tasks_submitted_total', 'Inference tasks enqueued by tier', ['tier'])
+TASK_QUEUE_WAIT = Histogram(
+    'task_queue_wait_seconds',
+    'Time between submission and the start of execution, by tier',
+    ['tier'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+TASKS_EXPIRED = Counter('tasks_expired_total', 'Inference tasks skipped because their deadline had passed, by tier', ['tier'])
+TASK_DURATION = Histogram(
+    'task_duration_seconds',
+    'Inference task execution time, by tier',
+    ['tier'],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+
+def start_metrics_server(port=WORKER_METRICS_PORT):
+    """
+    Expose Prometheus metrics for a worker.
+
+    Prefork children keep their own counters, so when PROMETHEUS_MULTIPROC_DIR
+    is set the server aggregates the per-process files written there.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+    logger.info(f"Metrics server started on port {port}")
@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import logging
+from src.adapters import get_adapter
+from src import codec
+from src.sinks import SINK_TYPES, build_sink, encode_message
+from src.blobstore import get_blob_store
+from src.result_cache import get_result_cache
+from src.singleflight import get_singleflight
+from src.batching import get_batcher
+from src.http_client import http_post, http_get, http_stream, deadline_timeout
+from src.routing import upstream_call
+from src.hedging import get_hedger
+from src.polling import get_poll_queue, poll_interval, classify_poll, POLL_TIMEOUT, POLL_REQUEST_TIMEOUT
+from src.metrics import STREAM_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Stream responses from adapters with a streaming endpoint and forward progress to streaming sinks
+STREAMING_ENABLED = os.environ.get('STREAMING_ENABLED', 'false').lower() == 'true'
+# Minimum seconds between progress messages forwarded for one task
+STREAM_PROGRESS_INTERVAL = float(os.environ.get('STREAM_PROGRESS_INTERVAL', 0.25))
+# Also deliver the full decoded model response as `original_response`. It repeats
+# the (often base64) outputs, and it turns off incremental response parsing.
+INCLUDE_ORIGINAL_RESPONSE = os.environ.get('INCLUDE_ORIGINAL_RESPONSE', 'false').lower() == 'true'
+
+def iter_stream_events(lines):
+    """Decode server-sent events (or JSON lines) into (event, data) pairs. Lines may be str or bytes."""
+    event, data = None, []
+    for line in lines:
+        line = line.decode('utf-8') if isinstance(line, bytes) else line
+        if line.startswith('data:'):
+            data.append(line[5:].strip())
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('{'):
+            yield None, codec.loads(line)
+        elif not line.strip() and data:
+            yield event, codec.loads("\n".join(data))
+            event, data = None, []
+    if data:
+        yield event, codec.loads("\n".join(data))
+
+class InferencePipeline:
+    """
+    The single hot path shared by every inference task:
+
+        build request -> call model -> parse/transform output -> deliver to sinks
+
+    When a blob store is configured, inline base64 outputs are written to it
+    during the transform step so only their URLs reach Redis and the sinks.
+    With streaming enabled, models with a streaming endpoint are read
+    incrementally and progress updates go to the sinks that stream (the
+    WebSocket) while the model runs; the final result is handled as usual.
+    Adapters that list `response_fields` have their response parsed as it
+    arrives, keeping only those fields, so a task holds about one copy of a
+    base64 image rather than the body, its text and the decoded JSON.
+    When the result cache is enabled, deterministic requests are answered
+    from it without calling the model, and with single-flight enabled
+    concurrent duplicates share one model call. A request's `deadline`
+    bounds the upstream timeouts, and with hedging enabled a slow call is
+    duplicated to another backend (src/hedging.py). Models served by queued
+    providers are submitted and then polled, either by the task or, with the
+    poller enabled, by src/poller.py, which finishes the request later.
+
+    The model-specific parts live in the adapter (src/adapters.py) and the
+    destinations in sinks (src/sinks.py), so a new model only registers an
+    adapter and reuses the serialization, connection pool and delivery code.
+    """
+
+    def __init__(self, task_id, inference_model, params=None, sinks=None, deadline=None):
+        self.task_id = task_id
+        self.deadline = deadline
+        self.prediction_id = None
+        self.inference_model = inference_model
+        self.params = {k: v for k, v in (params or {}).items() if v is not None}
+        self.sink_specs = sinks or []
+        self.adapter = get_adapter(inference_model)
+        if self.adapter is None:
+            raise ValueError(f"Unknown inference model: {inference_model}")
+
+    def build_request(self):
+        """Build and serialize the upstream request body once."""
+        payload = self.adapter.build_request(self.params)
+        logger.info(f"Task ID: {self.task_id} - Sending payload: {payload}")
+        return codec.dumps(payload)
+
+    def timeout(self):
+        """Upstream (connect, read) timeout, shortened to the time left before the deadline."""
+        return deadline_timeout(self.deadline)
+
+    def batcher(self):
+        """The micro-batcher, when it is enabled and the adapter can send requests as one batched call."""
+        batcher = get_batcher()
+        return batcher if batcher is not None and self.adapter.supports_batch else None
+
+    def call_model(self, body):
+        """Call the model through the balancer (or the micro-batcher) and return (status_code, response_text)."""
+        batcher = self.batcher()
+        hedger = get_hedger()
+        if batcher is not None:
+            status_code, response_text = batcher.call(self.adapter, self.params, body, self.deadline)
+        elif hedger is not None:
+            status_code, response_text = hedger.post(self.adapter.path, body, self.timeout(), self.deadline)
+        else:
+            timeout = self.timeout()
+            with upstream_call(self.adapter.path) as call:
+                response = http_post(call.url, data=body, timeout=timeout)
+                call.status_code = response.status_code
+            status_code, response_text = response.status_code, response.text
+        logger.info(f"Task ID: {self.task_id} - Got response: {status_code}")
+        return status_code, response_text
+
+    def parses_incrementally(self):
+        """Whether the response can be parsed as it arrives (not for batched or hedged calls, which read the whole body)."""
+        return (
+            bool(self.adapter.response_fields)
+            and not INCLUDE_ORIGINAL_RESPONSE
+            and self.batcher() is None
+            and get_hedger() is None
+        )
+
+    def read_model_response(self, body):
+        """Call the model, decode only the adapter's response fields while the body arrives, and return the message."""
+        timeout = self.timeout()
+        with upstream_call(self.adapter.path) as call:
+            response = http_stream('POST', call.url, data=body, timeout=timeout)
+            call.status_code = response.status_code
+            try:
+                logger.info(f"Task ID: {self.task_id} - Got response: {response.status_code}")
+                if response.status_code != 200:
+                    return self.parse_response(response.status_code, response.text)
+                response.raw.decode_content = True
+                try:
+                    data = self.adapter.parse_response_stream(response.raw)
+                except ValueError as e:
+                    logger.warning(f"Task ID: {self.task_id} - Could not parse response as JSON: {str(e)}")
+                    data = str(e)
+                return self.build_message(response.status_code, data)
+            finally:
+                response.close()
+
+    def run_prediction(self, body, flight_key=None):
+        """
+        Submit to a queued provider and return the final message.
+
+        With the poller enabled the prediction is handed over instead, along
+        with the flight, and None is returned.
+        """
+        timeout = self.timeout()
+        response = http_post(self.adapter.submit_url, data=body, headers=self.adapter.request_headers(), timeout=timeout)
+        logger.info(f"Task ID: {self.task_id} - Got submission response: {response.status_code}")
+        if response.status_code != 200:
+            return self.parse_response(response.status_code, response.text)
+        self.prediction_id = self.adapter.parse_submission(codec.loads(response.text))
+        logger.info(f"Task ID: {self.task_id} - Submitted prediction {self.prediction_id}")
+        queue = get_poll_queue()
+        if queue is not None:
+            queue.add(self.poll_job(flight_key))
+            return None
+        return self.wait_for_prediction()
+
+    def poll_job(self, flight_key=None):
+        """Everything the poller needs to finish this request."""
+        return {
+            "task_id": self.task_id,
+            "model": self.inference_model,
+            "params": self.params,
+            "sinks": self.sink_specs,
+            "prediction_id": self.prediction_id,
+            "submitted_at": time.time(),
+            "deadline": self.deadline,
+            "flight_key": flight_key,
+        }
+
+    def wait_for_prediction(self):
+        """Poll for the submitted prediction from the task itself and return the final message."""
+        submitted_at = time.time()
+        expires_at = min(submitted_at + POLL_TIMEOUT, self.deadline or float('inf'))
+        while True:
+            now = time.time()
+            wait = min(poll_interval(now - submitted_at), expires_at - now)
+            if wait <= 0:
+                raise TimeoutError(f"Prediction {self.prediction_id} did not complete within {expires_at - submitted_at:.0f}s")
+            time.sleep(wait)
+            try:
+                response = http_get(self.adapter.poll_url(self.prediction_id), headers=self.adapter.request_headers(), timeout=POLL_REQUEST_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Task ID: {self.task_id} - Error polling prediction {self.prediction_id}: {str(e)}")
+                continue
+            done = classify_poll(self.adapter, response.status_code, response.text)
+            if done is not None:
+                logger.info(f"Task ID: {self.task_id} - Prediction {self.prediction_id} finished: {response.status_code}")
+                return self.build_message(*done)
+
+    def progress_sinks(self):
+        """Sinks that get progress updates, or [] when this request isn't streamed."""
+        if not (STREAMING_ENABLED and self.adapter.supports_stream):
+            return []
+        return [build_sink(spec) for spec in self.sink_specs if getattr(SINK_TYPES.get(spec.get('type')), 'streams', False)]
+
+    def stream_model(self, body, sinks):
+        """Call the model's streaming endpoint, forwarding progress to `sinks`, and return the final message."""
+        timeout = self.timeout()
+        with upstream_call(self.adapter.stream_path) as call:
+            response = http_stream('POST', call.url, data=body, timeout=timeout)
+            call.status_code = response.status_code
+            try:
+                logger.info(f"Task ID: {self.task_id} - Got streamed response: {response.status_code}")
+                if response.status_code != 200:
+                    return self.parse_response(response.status_code, response.text)
+                last_sent = 0
+                for event, data in iter_stream_events(response.iter_lines(decode_unicode=True)):
+                    parsed = self.adapter.parse_stream_event(event, data)
+                    if parsed is None:
+                        continue
+                    kind, payload = parsed
+                    if kind == 'result':
+                        STREAM_EVENTS.labels(outcome='result').inc()
+                        return self.build_message(response.status_code, payload)
+                    now = time.monotonic()
+                    if now - last_sent < STREAM_PROGRESS_INTERVAL:
+                        STREAM_EVENTS.labels(outcome='throttled').inc()
+                        continue
+                    last_sent = now
+                    STREAM_EVENTS.labels(outcome='forwarded').inc()
+                    self.deliver_progress(sinks, payload)
+            finally:
+                response.close()
+            raise ValueError("Inference stream ended without a result")
+
+    def deliver_progress(self, sinks, progress):
+        """Best-effort delivery of a progress update; failures never fail the task."""
+        message = {"type": "progress", "task_id": self.task_id, "model": self.inference_model}
+        message.update(progress)
+        body = encode_message(message)
+        for sink in sinks:
+            try:
+                sink.deliver(body)
+            except Exception as e:
+                logger.warning(f"Task ID: {self.task_id} - Error delivering progress to {sink.type}: {str(e)}")
+
+    def parse_response(self, status_code, response_text):
+        """Decode the model response once and build the message delivered to every sink."""
+        try:
+            data = codec.loads(response_text)
+        except json.JSONDecodeError:
+            logger.warning(f"Task ID: {self.task_id} - Could not parse response as JSON: {response_text[:200]}")
+            # If we can't parse the response, just send it as-is
+            data = response_text
+        return self.build_message(status_code, data)
+
+    def build_message(self, status_code, data):
+        """Build the delivered message from the decoded model response (or the raw text if it wasn't JSON)."""
+        message = {
+            "task_id": self.task_id,
+            "model": self.inference_model,
+            "status_code": status_code,
+        }
+        if isinstance(data, str):
+            message["response"] = data
+        else:
+            blob_store = get_blob_store()
+            if blob_store is not None:
+                self.adapter.offload_outputs(data, blob_store)
+            message["response"] = self.adapter.parse_output(data)
+            if INCLUDE_ORIGINAL_RESPONSE:
+                message["original_response"] = data
+
+        # Include original request in the delivered message
+        message.update(self.params)
+        return message
+
+    def deliver(self, message):
+        """Serialize the message once and send it to every sink, returning each sink's status."""
+        statuses = {}
+        if not self.sink_specs:
+            return statuses
+        body = encode_message(message)
+        for spec in self.sink_specs:
+            sink = build_sink(spec)
+            try:
+                logger.info(f"Task ID: {self.task_id} - Delivering to {sink.type}: {sink.url}")
+                statuses[f"{sink.type}_status"] = sink.deliver(body)
+                logger.info(f"Task ID: {self.task_id} - {sink.type} delivery status: {statuses[f'{sink.type}_status']}")
+            except Exception as e:
+                logger.error(f"Task ID: {self.task_id} - Error delivering to {sink.type}: {str(e)}")
+                statuses[f"{sink.type}_error"] = str(e)
+        return statuses
+
+    def cached_message(self, cached, source="cached"):
+        """Build the delivered message for a result produced by another request (cache or single-flight)."""
+        message = {
+            "task_id": self.task_id,
+            "model": self.inference_model,
+            source: True,
+        }
+        message.update(cached)
+        message.update(self.params)
+        return message
+
+    @staticmethod
+    def shareable_result(message):
+        """The part of a message that can be reused by identical requests."""
+        return {key: message[key] for key in ("status_code", "response", "original_response") if key in message}
+
+    def cache_result(self, cache, message):
+        """Cache successful, parsed responses; errors and unparseable bodies are never cached."""
+        if message["status_code"] != 200 or not isinstance(message["response"], dict):
+            return
+        cache.set(self.adapter, self.params, self.shareable_result(message))
+
+    def complete(self, message):
+        """Deliver the message and build the task result."""
+        # Store the transformed response so offloaded images stay out of the result backend
+        result = {"status_code": message["status_code"], "response": message["response"]}
+        for source in ("cached", "coalesced"):
+            if message.get(source):
+                result[source] = True
+        result.update(self.deliver(message))
+        return result
+
+    def run(self):
+        cache = get_result_cache()
+        cached = cache.get(self.adapter, self.params, source='task') if cache is not None else None
+        if cached is not None:
+            logger.info(f"Task ID: {self.task_id} - Result cache hit")
+            return self.complete(self.cached_message(cached))
+
+        flight = get_singleflight()
+        flight_key = flight.key(self.adapter, self.params) if flight is not None else None
+        if flight_key is not None and not flight.acquire(flight_key, self.task_id):
+            logger.info(f"Task ID: {self.task_id} - Waiting for identical in-flight request")
+            shared = flight.wait(flight_key, self.deadline)
+            if shared is not None:
+                return self.complete(self.cached_message(shared, source="coalesced"))
+            # The owner failed; make the call ourselves without taking over the flight
+            flight_key = None
+
+        try:
+            body = self.build_request()
+            sinks = self.progress_sinks()
+            if self.adapter.supports_poll:
+                message = self.run_prediction(body, flight_key)
+            elif sinks:
+                message = self.stream_model(body, sinks)
+            elif self.parses_incrementally():
+                message = self.read_model_response(body)
+            else:
+                status_code, response_text = self.call_model(body)
+                message = self.parse_response(status_code, response_text)
+        except Exception:
+            if flight_key is not None:
+                flight.abandon(flight_key, self.task_id)
+            raise
+
+        if message is None:
+            # Handed to the poller, which ends the flight and delivers the result
+            return {"submitted": True, "prediction_id": self.prediction_id}
+        return self.finish(message, flight_key)
+
+    def finish(self, message, flight_key=None):
+        """Share and cache the message from a model call, deliver it, and build the task result."""
+        if flight_key is not None:
+            # Identical requests only get a success; after an error they call the model themselves
+            if message["status_code"] == 200:
+                get_singleflight().publish(flight_key, self.task_id, self.shareable_result(message))
+            else:
+                get_singleflight().abandon(flight_key, self.task_id)
+        cache = get_result_cache()
+        if cache is not None:
+            self.cache_result(cache, message)
+        return self.complete(message)
+
+def run_pipeline(task_id, inference_model, params=None, sinks=None, deadline=None):
+    """Run one inference request end to end and return the task result."""
+    return InferencePipeline(task_id, inference_model, params, sinks, deadline).run()
+
+def lookup_cached_result(inference_model, params, source):
+    """Return the cached result for a request, or None if caching is disabled or it misses."""
+    cache = get_result_cache()
+    adapter = get_adapter(inference_model)
+    if cache is None or adapter is None:
+        return None
+    return cache.get(adapter, params, source=source)
+
+def deliver_cached_result(task_id, inference_model, params, sinks, cached):
+    """Deliver a result found in the cache before enqueuing and return the task result."""
+    pipeline = InferencePipeline(task_id, inference_model, params, sinks)
+    return pipeline.complete(pipeline.cached_message(cached))
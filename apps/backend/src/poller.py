@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+import os
+import time
+import asyncio
+import logging
+from celery import states
+from src import codec
+from src.adapters import get_adapter
+from src.aio import httpx_timeout
+from src.celery import app as celery_app
+from src.pipeline import InferencePipeline
+from src.polling import get_poll_queue, poll_interval, poll_result, classify_poll, PredictionFailed, POLL_TIMEOUT, POLL_REQUEST_TIMEOUT
+from src.singleflight import get_singleflight
+from src.metrics import start_metrics_server, POLL_CHECKS, POLL_OUTSTANDING, POLL_PREDICTION_SECONDS
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+POLL_BATCH_SIZE = int(os.environ.get('POLL_BATCH_SIZE', 200))  # Predictions claimed from Redis at once
+POLL_CONCURRENCY = int(os.environ.get('POLL_CONCURRENCY', 500))  # Status checks in flight at once
+# A claimed prediction is checked again after this long if its poller died mid-check
+POLL_LEASE_SECONDS = float(os.environ.get('POLL_LEASE_SECONDS', 60))
+POLL_TICK = float(os.environ.get('POLL_TICK', 0.1))  # Seconds between claims when nothing is due
+
+class Poller:
+    """
+    Finishes predictions that workers submitted to queued providers.
+
+    Each cycle claims the predictions that are due from Redis in one call
+    and checks them concurrently on a shared connection pool (or in bulk
+    status requests, for adapters with `poll_batch_path`). Finished
+    predictions go through the pipeline's usual transform and delivery, and
+    their result is stored under the original task ID. Pending ones are
+    rescheduled, batched into one Redis write per cycle, at an interval
+    that grows with their age and starts near the model's usual completion
+    time. One process can track thousands of outstanding predictions.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.client = None
+        self.active = set()
+        self.expected = {}  # Moving average of completion time per model, seconds
+        self.reschedules = {}
+
+    async def run(self):
+        import httpx
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=POLL_CONCURRENCY, max_keepalive_connections=POLL_CONCURRENCY),
+            timeout=httpx_timeout(POLL_REQUEST_TIMEOUT),
+            headers={"Content-Type": "application/json"},
+        )
+        logger.info(f"Poller started (batch_size={POLL_BATCH_SIZE}, concurrency={POLL_CONCURRENCY})")
+        while True:
+            jobs = []
+            try:
+                await self.flush()
+                free = POLL_CONCURRENCY - len(self.active)
+                if free > 0:
+                    jobs, outstanding = await asyncio.to_thread(self.queue.claim, min(free, POLL_BATCH_SIZE), POLL_LEASE_SECONDS)
+                    POLL_OUTSTANDING.set(outstanding)
+            except Exception as e:
+                logger.error(f"Error claiming predictions: {str(e)}")
+            self.dispatch(jobs)
+            if len(jobs) < POLL_BATCH_SIZE:
+                await asyncio.sleep(POLL_TICK)
+
+    def dispatch(self, jobs):
+        """Start the status checks for claimed jobs, in bulk for adapters that support it."""
+        bulk = {}
+        for job in jobs:
+            adapter = get_adapter(job["model"])
+            if adapter is None or not adapter.supports_poll:
+                self.spawn(asyncio.to_thread(self.close, job, {"error": f"Unknown inference model: {job['model']}"}))
+            elif adapter.poll_batch_path:
+                bulk.setdefault(adapter.name, (adapter, []))[1].append(job)
+            else:
+                self.spawn(self.check(adapter, job))
+        for adapter, group in bulk.values():
+            self.spawn(self.check_batch(adapter, group))
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.active.add(task)
+        task.add_done_callback(self.active.discard)
+
+    async def flush(self):
+        """Write the next check times gathered since the last cycle in one call."""
+        if self.reschedules:
+            reschedules, self.reschedules = self.reschedules, {}
+            await asyncio.to_thread(self.queue.reschedule_many, reschedules)
+
+    async def check(self, adapter, job):
+        try:
+            response = await self.client.get(adapter.poll_url(job["prediction_id"]), headers=adapter.request_headers())
+        except Exception as e:
+            logger.warning(f"Task ID: {job['task_id']} - Error polling prediction {job['prediction_id']}: {str(e)}")
+            POLL_CHECKS.labels(model=adapter.name, outcome='error').inc()
+            await self.schedule(job)
+            return
+        done = classify_poll(adapter, response.status_code, response.text)
+        if done is None:
+            retry = response.status_code == 429 or response.status_code >= 500
+            POLL_CHECKS.labels(model=adapter.name, outcome='error' if retry else 'pending').inc()
+            await self.schedule(job)
+        else:
+            await self.finish(job, done)
+
+    async def check_batch(self, adapter, jobs):
+        try:
+            body = codec.dumps(adapter.build_poll_batch_request([job["prediction_id"] for job in jobs]))
+            response = await self.client.post(adapter.poll_batch_url, content=body, headers=adapter.request_headers())
+            statuses = adapter.split_poll_batch_response(codec.loads(response.content)) if response.status_code == 200 else {}
+        except Exception as e:
+            logger.warning(f"Error polling {len(jobs)} {adapter.name} predictions: {str(e)}")
+            statuses = {}
+        for job in jobs:
+            status = statuses.get(job["prediction_id"])
+            state, prediction = adapter.parse_poll(status) if status is not None else ('error', None)
+            if state in ('pending', 'error'):
+                POLL_CHECKS.labels(model=adapter.name, outcome=state).inc()
+                await self.schedule(job)
+            else:
+                await self.finish(job, poll_result(state, prediction))
+
+    async def schedule(self, job):
+        """Set the next check, or give up once the prediction is past its timeout or deadline."""
+        now = time.time()
+        expires_at = min(job["submitted_at"] + POLL_TIMEOUT, job.get("deadline") or float('inf'))
+        if now >= expires_at:
+            POLL_CHECKS.labels(model=job["model"], outcome='expired').inc()
+            error = f"Prediction {job['prediction_id']} did not complete within {expires_at - job['submitted_at']:.0f}s"
+            logger.warning(f"Task ID: {job['task_id']} - {error}")
+            await asyncio.to_thread(self.close, job, {"error": error}, abandon=True)
+            return
+        interval = poll_interval(now - job["submitted_at"], self.expected.get(job["model"]))
+        self.reschedules[job["task_id"]] = min(now + interval, expires_at)
+
+    async def finish(self, job, done):
+        elapsed = time.time() - job["submitted_at"]
+        POLL_CHECKS.labels(model=job["model"], outcome='finished').inc()
+        POLL_PREDICTION_SECONDS.labels(model=job["model"]).observe(elapsed)
+        expected = self.expected.get(job["model"])
+        self.expected[job["model"]] = elapsed if expected is None else 0.8 * expected + 0.2 * elapsed
+        await asyncio.to_thread(self.deliver, job, done)
+
+    def deliver(self, job, done):
+        """Build, deliver and store the result of a finished prediction."""
+        logger.info(f"Task ID: {job['task_id']} - Prediction {job['prediction_id']} finished: {done[0]}")
+        try:
+            pipeline = InferencePipeline(job["task_id"], job["model"], job["params"], job["sinks"], job.get("deadline"))
+            pipeline.prediction_id = job["prediction_id"]
+            result = pipeline.finish(pipeline.build_message(*done), job.get("flight_key"))
+        except Exception as e:
+            logger.error(f"Task ID: {job['task_id']} - Error finishing prediction {job['prediction_id']}: {str(e)}")
+            self.close(job, {"error": str(e)}, abandon=True)
+            return
+        self.close(job, result)
+
+    def close(self, job, result, abandon=False):
+        """Store the task's final result (a failure if the prediction failed) and forget the prediction."""
+        flight = get_singleflight()
+        if abandon and flight is not None and job.get("flight_key"):
+            flight.abandon(job["flight_key"], job["task_id"])
+        try:
+            if result.get("status_code", 200) != 200:
+                error = PredictionFailed(f"Prediction {job['prediction_id']} failed ({result['status_code']}): {result.get('response')}")
+                celery_app.backend.mark_as_failure(job["task_id"], error)
+            else:
+                celery_app.backend.store_result(job["task_id"], result, states.SUCCESS)
+            self.queue.remove(job["task_id"])
+        except Exception as e:
+            # The lease runs out and the prediction is checked (and delivered) again
+            logger.error(f"Task ID: {job['task_id']} - Error storing result: {str(e)}")
+
+if __name__ == '__main__':
+    queue = get_poll_queue()
+    if queue is None:
+        raise SystemExit("POLLER_ENABLED is not set; workers poll their own predictions")
+    start_metrics_server()
+    asyncio.run(Poller(queue).run())
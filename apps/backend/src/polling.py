@@ -0,0 +1,146 @@
+import os
+import time
+import logging
+import threading
+import redis
+from src import codec
+from src.celery import app as celery_app, BACKEND_URL
+from src.http_client import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Hand submitted predictions to the poller process (src/poller.py) and free the
+# worker slot. Without it, tasks poll their own predictions.
+POLLER_ENABLED = os.environ.get('POLLER_ENABLED', 'false').lower() == 'true'
+POLLER_REDIS_URL = os.environ.get('POLLER_REDIS_URL', BACKEND_URL)
+POLLER_PREFIX = os.environ.get('POLLER_PREFIX', 'poller')
+# Give up on a prediction this many seconds after submission (or at the task's deadline)
+POLL_TIMEOUT = float(os.environ.get('POLL_TIMEOUT', HTTP_READ_TIMEOUT))
+# Poll intervals grow with a prediction's age (POLL_INTERVAL_FACTOR x age), within these bounds
+POLL_MIN_INTERVAL = float(os.environ.get('POLL_MIN_INTERVAL', 0.5))
+POLL_MAX_INTERVAL = float(os.environ.get('POLL_MAX_INTERVAL', 10))
+POLL_INTERVAL_FACTOR = float(os.environ.get('POLL_INTERVAL_FACTOR', 0.1))
+# (connect, read) timeout of one status check
+POLL_REQUEST_TIMEOUT = (HTTP_CONNECT_TIMEOUT, float(os.environ.get('POLL_READ_TIMEOUT', 30)))
+
+# Task state while the poller owns a prediction
+SUBMITTED = 'SUBMITTED'
+# Status code of the message for a prediction the provider reports as failed,
+# so it is neither cached nor shared with identical requests
+PREDICTION_FAILED_STATUS = 502
+
+class PredictionFailed(Exception):
+    """A queued prediction the provider reports as failed."""
+
+# Takes up to ARGV[2] predictions due by ARGV[1] and hides them until ARGV[3],
+# so a poller that dies mid-check doesn't lose them. Returns the IDs, their
+# jobs and the number of outstanding predictions.
+CLAIM_SCRIPT = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local jobs = {}
+if #due > 0 then
+    for _, id in ipairs(due) do
+        redis.call('zadd', KEYS[1], ARGV[3], id)
+    end
+    jobs = redis.call('hmget', KEYS[2], unpack(due))
+end
+return {due, jobs, redis.call('zcard', KEYS[1])}
+"""
+
+def poll_interval(age, expected=None):
+    """
+    Seconds until the next status check of a prediction submitted `age` seconds ago.
+
+    Young predictions are checked often and old ones less often. With
+    `expected` (the usual completion time), a prediction that is younger
+    than that is next checked shortly before it would usually be done,
+    early enough that the estimate can also come down.
+    """
+    if expected and age < 0.8 * expected:
+        return min(max(0.8 * expected - age, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL)
+    return min(max(age * POLL_INTERVAL_FACTOR, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL)
+
+def poll_result(state, prediction):
+    """(status_code, data) for a finished prediction, from the adapter's `parse_poll`, or None while it is pending."""
+    if state == 'pending':
+        return None
+    return (PREDICTION_FAILED_STATUS if state == 'failed' else 200), prediction
+
+def classify_poll(adapter, status_code, response_text):
+    """
+    Interpret one status response.
+
+    Returns None while the prediction is pending or the check should be
+    retried (429, 5xx, unreadable body), else (status_code, data) to build
+    the delivered message from, where data is the decoded response or the
+    raw text of an error. A failed prediction gets PREDICTION_FAILED_STATUS.
+    """
+    if status_code == 429 or status_code >= 500:
+        return None
+    try:
+        data = codec.loads(response_text)
+    except ValueError:
+        if status_code == 200:
+            return None
+        return status_code, response_text
+    if status_code != 200:
+        return status_code, data
+    return poll_result(*adapter.parse_poll(data))
+
+class PollQueue:
+    """
+    Outstanding predictions in Redis: a sorted set of task IDs scored by
+    their next check time, and a hash of the jobs needed to finish them.
+    """
+
+    def __init__(self, client, prefix=POLLER_PREFIX):
+        self.client = client
+        self.due_key = f"{prefix}:due"
+        self.jobs_key = f"{prefix}:jobs"
+        self._claim = client.register_script(CLAIM_SCRIPT)
+
+    def add(self, job):
+        """Mark the task submitted and schedule its first check."""
+        celery_app.backend.store_result(job["task_id"], {"prediction_id": job["prediction_id"]}, SUBMITTED)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self.jobs_key, job["task_id"], codec.dumps(job))
+        pipe.zadd(self.due_key, {job["task_id"]: time.time() + poll_interval(0)})
+        pipe.execute()
+
+    def claim(self, limit, lease):
+        """Take up to `limit` due jobs for `lease` seconds; returns (jobs, outstanding)."""
+        now = time.time()
+        task_ids, jobs, outstanding = self._claim(keys=[self.due_key, self.jobs_key], args=[now, limit, now + lease])
+        claimed = []
+        for task_id, job in zip(task_ids, jobs):
+            if job is None:
+                # Finished by another poller after this one last saw it
+                self.client.zrem(self.due_key, task_id)
+                continue
+            claimed.append(codec.loads(job))
+        return claimed, outstanding
+
+    def reschedule_many(self, next_checks):
+        """Set the next check time of many jobs ({task_id: epoch seconds}) in one call."""
+        # XX: don't resurrect a job another poller just finished
+        self.client.zadd(self.due_key, next_checks, xx=True)
+
+    def remove(self, task_id):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(self.due_key, task_id)
+        pipe.hdel(self.jobs_key, task_id)
+        pipe.execute()
+
+_poll_queue = None
+_poll_queue_lock = threading.Lock()
+
+def get_poll_queue():
+    """Return the process-wide poll queue, or None when predictions are polled in the task."""
+    global _poll_queue
+    if not POLLER_ENABLED:
+        return None
+    if _poll_queue is None:
+        with _poll_queue_lock:
+            if _poll_queue is None:
+                _poll_queue = PollQueue(redis.Redis.from_url(POLLER_REDIS_URL))
+    return _poll_queue
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import redis
+from src import codec
+from src.celery import BACKEND_URL
+from src.metrics import RESULT_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Result cache configuration from environment variables
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'false').lower() == 'true'
+RESULT_CACHE_REDIS_URL = os.environ.get('RESULT_CACHE_REDIS_URL', BACKEND_URL)
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 3600))  # Seconds
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 10000))
+RESULT_CACHE_MAX_VALUE_BYTES = int(os.environ.get('RESULT_CACHE_MAX_VALUE_BYTES', 8 * 1024 * 1024))
+RESULT_CACHE_PREFIX = os.environ.get('RESULT_CACHE_PREFIX', 'result-cache')
+
+def canonical_hash(payload):
+    """Stable hash of a request payload, independent of key order and whitespace."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def has_fixed_seed(params):
+    """Whether a request pins its seed. A missing or negative seed (e.g. Wavespeed's -1) asks for a random one."""
+    seed = params.get('seed')
+    return isinstance(seed, int) and not isinstance(seed, bool) and seed >= 0
+
+class ResultCache:
+    """
+    Redis cache of completed generations keyed on the canonical model request.
+
+    Only deterministic requests (those with a fixed, non-negative seed) are cached. Entries
+    expire after `ttl` seconds, and a sorted set of last-access times keeps
+    the cache to `max_entries` by evicting the least recently used entries.
+    Redis errors are logged and treated as misses so the cache can never fail
+    a request.
+    """
+
+    def __init__(self, client, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 max_value_bytes=RESULT_CACHE_MAX_VALUE_BYTES, prefix=RESULT_CACHE_PREFIX):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_value_bytes = max_value_bytes
+        self.prefix = prefix
+        self.lru_key = f"{prefix}:lru"
+
+    def entry_key(self, adapter, params):
+        """Return the Redis key for a request, or None if the request isn't deterministic."""
+        if not has_fixed_seed(params):
+            return None
+        return f"{self.prefix}:{adapter.name}:{canonical_hash(adapter.build_request(params))}"
+
+    def get(self, adapter, params, source):
+        """Return the cached result for a request, or None on a miss or for uncacheable requests."""
+        key = self.entry_key(adapter, params)
+        if key is None:
+            return None
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.get(key)
+            # Refresh the entry's recency only if it is still tracked
+            pipe.zadd(self.lru_key, {key: time.time()}, xx=True)
+            value, _ = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Result cache lookup failed: {str(e)}")
+            value = None
+
+        RESULT_CACHE_LOOKUPS.labels(source=source, outcome='hit' if value is not None else 'miss').inc()
+        if value is None:
+            return None
+        return codec.loads(value)
+
+    def set(self, adapter, params, value):
+        """Cache a result for a deterministic request, evicting least recently used entries over the limit."""
+        key = self.entry_key(adapter, params)
+        if key is None:
+            return False
+        data = codec.dumps(value)
+        if len(data) > self.max_value_bytes:
+            logger.info(f"Result too large to cache ({len(data)} bytes)")
+            return False
+
+        now = time.time()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(key, data, ex=self.ttl)
+            pipe.zadd(self.lru_key, {key: now})
+            # Forget entries that have already expired through their TTL
+            pipe.zremrangebyscore(self.lru_key, 0, now - self.ttl)
+            pipe.zcard(self.lru_key)
+            size = pipe.execute()[-1]
+
+            excess = size - self.max_entries
+            if excess > 0:
+                evicted = [member for member, _ in self.client.zpopmin(self.lru_key, excess)]
+                if evicted:
+                    self.client.delete(*evicted)
+            return True
+        except redis.RedisError as e:
+            logger.warning(f"Result cache store failed: {str(e)}")
+            return False
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Return the process-wide result cache, or None when caching is disabled."""
+    global _result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(redis.Redis.from_url(RESULT_CACHE_REDIS_URL))
+    return _result_cache
@@ -0,0 +1,242 @@
+import os
+import math
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from src.adapters import INFERENCE_BALANCER_URL
+from src.metrics import ROUTING_REQUESTS, ROUTING_EJECTIONS, ROUTING_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Inference backends the workers route between, e.g.
+# 'http://proxy-a.inference-balancer.svc.cluster.local,http://proxy-b.inference-balancer.svc.cluster.local'.
+# An optional '=<weight>' suffix biases selection. Empty keeps sending everything to INFERENCE_BALANCER_URL.
+INFERENCE_BACKENDS = os.environ.get('INFERENCE_BACKENDS', '')
+# 'p2c' (power of two choices on latency x outstanding requests) or 'least_outstanding'
+ROUTING_POLICY = os.environ.get('ROUTING_POLICY', 'p2c')
+# Time constant of the latency and error-rate moving averages, in seconds
+ROUTING_DECAY_SECONDS = float(os.environ.get('ROUTING_DECAY_SECONDS', 30))
+# Latency charged for a failed call, so a backend that fails fast doesn't look fast
+ROUTING_FAILURE_PENALTY = float(os.environ.get('ROUTING_FAILURE_PENALTY', 30))
+
+# Circuit breaker: open after this many consecutive failures, then allow one probe after the open period
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+
+# Outlier ejection: take a backend out of rotation when its error rate, or its
+# latency relative to the other backends, is far off
+OUTLIER_ERROR_RATE = float(os.environ.get('OUTLIER_ERROR_RATE', 0.5))
+OUTLIER_LATENCY_FACTOR = float(os.environ.get('OUTLIER_LATENCY_FACTOR', 3))  # 0 disables latency ejection
+OUTLIER_MIN_REQUESTS = int(os.environ.get('OUTLIER_MIN_REQUESTS', 10))
+OUTLIER_EJECTION_SECONDS = float(os.environ.get('OUTLIER_EJECTION_SECONDS', 30))
+OUTLIER_MAX_EJECTED_PERCENT = int(os.environ.get('OUTLIER_MAX_EJECTED_PERCENT', 50))
+
+# Upstream responses that count as backend failures
+FAILURE_STATUSES = {429, 500, 502, 503, 504}
+
+def parse_backends(value):
+    """Parse 'url[=weight],...' into (url, weight) pairs."""
+    backends = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        url, weight = item, 1.0
+        if '=' in item:
+            head, tail = item.rsplit('=', 1)
+            try:
+                url, weight = head, float(tail)
+            except ValueError:
+                pass
+        backends.append((url.rstrip('/'), weight))
+    return backends
+
+class Backend:
+    """Health and load of one inference backend, as seen by this process."""
+
+    def __init__(self, url, weight=1.0):
+        self.url = url
+        self.weight = weight
+        self.in_flight = 0
+        self.latency = 0.0  # Peak-sensitive EWMA of request latency, seconds
+        self.error_rate = 0.0  # EWMA of failures (0 or 1)
+        self.requests = 0
+        self.updated_at = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # Circuit breaker
+        self.probing = False  # A half-open probe is in flight
+        self.ejected_until = 0.0  # Outlier ejection
+
+    def available(self, now):
+        if now < self.ejected_until:
+            return False
+        if self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+            # Open, then half-open: one probe at a time once the open period is over
+            return now >= self.open_until and not self.probing
+        return True
+
+    def cost(self, default_latency):
+        """Expected wait for a new request: latency scaled by the requests already outstanding."""
+        latency = self.latency if self.requests else default_latency
+        return latency * (self.in_flight + 1) / self.weight
+
+    def record(self, now, elapsed, failed):
+        if failed:
+            elapsed = max(elapsed, ROUTING_FAILURE_PENALTY)
+        if self.updated_at is None:
+            self.latency = elapsed
+            self.error_rate = float(failed)
+        else:
+            decay = math.exp(-(now - self.updated_at) / ROUTING_DECAY_SECONDS)
+            # Jump to a higher latency at once and decay back slowly (peak EWMA),
+            # so a backend whose queue time spikes is avoided immediately
+            self.latency = elapsed if elapsed > self.latency else self.latency * decay + elapsed * (1 - decay)
+            self.error_rate = self.error_rate * decay + float(failed) * (1 - decay)
+        self.updated_at = now
+        self.requests += 1
+
+class Router:
+    """
+    Picks the inference backend for each upstream call.
+
+    Every worker process keeps its own view of each backend: the number of
+    requests it has outstanding there, a latency moving average and an error
+    rate. `p2c` samples two available backends (by weight) and takes the one
+    with the lower latency x outstanding cost; `least_outstanding` takes the
+    backend with the fewest outstanding requests. Backends are skipped while
+    their circuit is open (after consecutive failures) or while ejected as an
+    outlier. If none are available, all of them are used rather than failing.
+    """
+
+    def __init__(self, backends, policy=ROUTING_POLICY):
+        self.backends = [Backend(url, weight) for url, weight in backends]
+        self.policy = policy
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude=()):
+        """Choose a backend for one request and count it as outstanding, avoiding `exclude` (URLs) if possible."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [backend for backend in self.backends if backend.available(now)]
+            others = [backend for backend in candidates if backend.url not in exclude]
+            if others:
+                candidates = others
+            elif not candidates:
+                logger.warning("No inference backend available, routing to all of them")
+                candidates = self.backends
+            backend = self._choose(candidates)
+            if backend.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                backend.probing = True
+            backend.in_flight += 1
+            return backend
+
+    def _choose(self, candidates):
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.policy == 'least_outstanding':
+            return min(candidates, key=lambda backend: (backend.in_flight / backend.weight, backend.latency))
+        # Backends without samples yet are assumed to be as fast as the average
+        sampled = [backend.latency for backend in self.backends if backend.requests]
+        default_latency = sum(sampled) / len(sampled) if sampled else 1.0
+        first, second = random.choices(candidates, weights=[backend.weight for backend in candidates], k=2)
+        return first if first.cost(default_latency) <= second.cost(default_latency) else second
+
+    def release(self, backend, elapsed, failed):
+        """Record the outcome of a request started with `acquire`."""
+        with self._lock:
+            now = time.monotonic()
+            backend.in_flight -= 1
+            backend.probing = False
+            backend.record(now, elapsed, failed)
+            if failed:
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures == CIRCUIT_FAILURE_THRESHOLD:
+                    logger.warning(f"Circuit opened for inference backend {backend.url}")
+                if backend.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                    backend.open_until = now + CIRCUIT_OPEN_SECONDS
+            else:
+                if backend.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                    logger.info(f"Circuit closed for inference backend {backend.url}")
+                backend.consecutive_failures = 0
+            self._eject_outlier(backend, now)
+        ROUTING_REQUESTS.labels(backend=backend.url, outcome='failure' if failed else 'success').inc()
+        ROUTING_LATENCY.labels(backend=backend.url).set(backend.latency)
+
+    def cancel(self, backend):
+        """Forget a request that was cancelled (a hedged call that lost), without recording an outcome."""
+        with self._lock:
+            backend.in_flight -= 1
+            backend.probing = False
+
+    def _eject_outlier(self, backend, now):
+        if backend.requests < OUTLIER_MIN_REQUESTS or now < backend.ejected_until:
+            return
+        reason = None
+        if backend.error_rate > OUTLIER_ERROR_RATE:
+            reason = 'error_rate'
+        elif OUTLIER_LATENCY_FACTOR > 0:
+            others = sorted(other.latency for other in self.backends if other is not backend and other.requests)
+            if others and backend.latency > OUTLIER_LATENCY_FACTOR * others[len(others) // 2]:
+                reason = 'latency'
+        if reason is None:
+            return
+        ejected = sum(1 for other in self.backends if now < other.ejected_until)
+        if (ejected + 1) * 100 > OUTLIER_MAX_EJECTED_PERCENT * len(self.backends):
+            return
+        backend.ejected_until = now + OUTLIER_EJECTION_SECONDS
+        ROUTING_EJECTIONS.labels(backend=backend.url, reason=reason).inc()
+        logger.warning(f"Ejected inference backend {backend.url} for {OUTLIER_EJECTION_SECONDS}s ({reason})")
+
+class UpstreamCall:
+    """The URL chosen for one upstream call; set `status_code` once the response arrives."""
+
+    def __init__(self, url, backend=None):
+        self.url = url
+        self.backend = backend  # Base URL of the chosen backend (None without INFERENCE_BACKENDS)
+        self.status_code = None
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """Return this process's router, or None when INFERENCE_BACKENDS isn't set."""
+    global _router
+    if not INFERENCE_BACKENDS:
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router(parse_backends(INFERENCE_BACKENDS))
+    return _router
+
+def call_failed(status_code):
+    return status_code is None or status_code in FAILURE_STATUSES
+
+@contextmanager
+def upstream_call(path, exclude=()):
+    """
+    Route one call to `path` and record its outcome.
+
+    Yields an UpstreamCall whose `url` the caller requests and whose
+    `status_code` it sets. Exceptions count as failures, except for
+    cancellation. `exclude` lists backends to avoid when others are available.
+    """
+    router = get_router()
+    if router is None:
+        yield UpstreamCall(f"{INFERENCE_BALANCER_URL}{path}")
+        return
+    backend = router.acquire(exclude)
+    call = UpstreamCall(f"{backend.url}{path}", backend.url)
+    started = time.monotonic()
+    try:
+        yield call
+    except asyncio.CancelledError:
+        router.cancel(backend)
+        raise
+    except BaseException:
+        router.release(backend, time.monotonic() - started, failed=True)
+        raise
+    router.release(backend, time.monotonic() - started, failed=call_failed(call.status_code))
@@ -0,0 +1,146 @@
+import os
+import time
+import logging
+import threading
+import redis
+from src import codec
+from src.celery import BACKEND_URL
+from src.http_client import HTTP_READ_TIMEOUT
+from src.result_cache import canonical_hash, has_fixed_seed
+from src.metrics import SINGLEFLIGHT_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Single-flight configuration from environment variables
+SINGLEFLIGHT_ENABLED = os.environ.get('SINGLEFLIGHT_ENABLED', 'false').lower() == 'true'
+SINGLEFLIGHT_REDIS_URL = os.environ.get('SINGLEFLIGHT_REDIS_URL', BACKEND_URL)
+# How long the owner holds the flight; must outlive the slowest inference call
+SINGLEFLIGHT_LOCK_TTL = int(os.environ.get('SINGLEFLIGHT_LOCK_TTL', HTTP_READ_TIMEOUT + 60))
+# How long a duplicate waits for the owner before calling the model itself
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_WAIT_TIMEOUT', HTTP_READ_TIMEOUT))
+# How long a finished flight's result stays readable for late subscribers
+SINGLEFLIGHT_RESULT_TTL = int(os.environ.get('SINGLEFLIGHT_RESULT_TTL', 60))
+SINGLEFLIGHT_PREFIX = os.environ.get('SINGLEFLIGHT_PREFIX', 'singleflight')
+
+# Marker published when the owner fails, so waiters stop waiting and call the model themselves
+ABANDONED = '__abandoned__'
+
+# Deletes the lock only if it is still held by the caller
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight deterministic requests across all workers.
+
+    The first task to `acquire` a request's key owns the inference call.
+    Duplicates `wait` on a Redis channel for the owner's result and then
+    deliver it to their own sinks under their own task IDs. If the owner
+    fails or its lease expires, waiters fall back to calling the model.
+    """
+
+    def __init__(self, client, lock_ttl=SINGLEFLIGHT_LOCK_TTL, wait_timeout=SINGLEFLIGHT_WAIT_TIMEOUT,
+                 result_ttl=SINGLEFLIGHT_RESULT_TTL, prefix=SINGLEFLIGHT_PREFIX):
+        self.client = client
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.prefix = prefix
+        self._release = client.register_script(RELEASE_SCRIPT)
+
+    def key(self, adapter, params):
+        """Return the flight key for a request, or None if the request isn't deterministic."""
+        if not has_fixed_seed(params):
+            return None
+        return f"{adapter.name}:{canonical_hash(adapter.build_request(params))}"
+
+    def _lock_key(self, key):
+        return f"{self.prefix}:lock:{key}"
+
+    def _result_key(self, key):
+        return f"{self.prefix}:result:{key}"
+
+    def _channel(self, key):
+        return f"{self.prefix}:channel:{key}"
+
+    def acquire(self, key, owner):
+        """Try to become the owner of a flight. Redis errors make every task its own owner."""
+        try:
+            acquired = bool(self.client.set(self._lock_key(key), owner, nx=True, ex=self.lock_ttl))
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight acquire failed: {str(e)}")
+            acquired = True
+        SINGLEFLIGHT_REQUESTS.labels(role='owner' if acquired else 'waiter').inc()
+        return acquired
+
+    def publish(self, key, owner, value):
+        """Share the owner's result with current and late waiters and end the flight."""
+        self._finish(key, owner, codec.dumps(value))
+
+    def abandon(self, key, owner):
+        """End a failed flight so waiters call the model themselves."""
+        self._finish(key, owner, ABANDONED)
+
+    def _finish(self, key, owner, data):
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(self._result_key(key), data, ex=self.result_ttl)
+            pipe.publish(self._channel(key), data)
+            pipe.execute()
+            self._release(keys=[self._lock_key(key)], args=[owner])
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight publish failed: {str(e)}")
+
+    def wait(self, key, deadline=None):
+        """
+        Wait for the owner's result, for up to `wait_timeout` seconds and
+        never past `deadline` (epoch seconds, or None).
+
+        Returns the shared result, or None if the owner failed, its lease
+        expired or the wait timed out.
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self._channel(key))
+            # Check after subscribing so a result published in between isn't missed
+            data = self.client.get(self._result_key(key))
+            wait = self.wait_timeout if deadline is None else min(self.wait_timeout, deadline - time.time())
+            wait_until = time.monotonic() + wait
+            while data is None and time.monotonic() < wait_until:
+                message = pubsub.get_message(timeout=min(1.0, max(0, wait_until - time.monotonic())))
+                if message is not None:
+                    data = message['data']
+                elif not self.client.exists(self._lock_key(key)):
+                    # The owner went away; its result may have landed just before
+                    data = self.client.get(self._result_key(key))
+                    break
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight wait failed: {str(e)}")
+            data = None
+        finally:
+            pubsub.close()
+
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if data is None or data == ABANDONED:
+            SINGLEFLIGHT_REQUESTS.labels(role='fallback').inc()
+            return None
+        return codec.loads(data)
+
+_singleflight = None
+_singleflight_lock = threading.Lock()
+
+def get_singleflight():
+    """Return the process-wide single-flight coordinator, or None when coalescing is disabled."""
+    global _singleflight
+    if not SINGLEFLIGHT_ENABLED:
+        return None
+    if _singleflight is None:
+        with _singleflight_lock:
+            if _singleflight is None:
+                _singleflight = SingleFlight(redis.Redis.from_url(SINGLEFLIGHT_REDIS_URL))
+    return _singleflight
@@ -0,0 +1,109 @@
+import os
+import logging
+from src import codec
+from src.http_client import http_post, DELIVERY_TIMEOUT
+from src.webhook_queue import get_webhook_queue
+
+logger = logging.getLogger(__name__)
+
+# Default delivery endpoints when a request doesn't provide its own URL
+DEFAULT_WEBHOOK_URL = os.environ.get('DEFAULT_WEBHOOK_URL', 'http://webhook.webhook.svc.cluster.local/publish-response')
+DEFAULT_WEBSOCKET_URL = os.environ.get('DEFAULT_WEBSOCKET_URL', 'http://visualize-websocket.frontend.svc.cluster.local:8766/publish')
+
+# Registered sink classes, keyed by the `type` of a sink spec
+SINK_TYPES = {}
+
+class DeliverySink:
+    """
+    Destination for a finished inference result.
+
+    Sinks are described in Celery messages by a JSON spec such as
+    `{"type": "webhook", "url": "https://example.com/hook"}` and built on the
+    worker with `build_sink`.
+    """
+    type = None
+    default_url = None
+    # Whether the sink also receives progress updates while a streamed request runs
+    streams = False
+
+    def __init__(self, url=None):
+        self.url = url or self.default_url
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(url=spec.get('url'))
+
+    def deliver(self, body):
+        """Send the already-serialized message and return the HTTP status code."""
+        response = http_post(self.url, data=body, timeout=DELIVERY_TIMEOUT)
+        return response.status_code
+
+def register_sink(cls):
+    SINK_TYPES[cls.type] = cls
+    return cls
+
+def build_sink(spec):
+    """Instantiate a sink from its spec, raising ValueError for unknown types."""
+    sink_cls = SINK_TYPES.get(spec.get('type'))
+    if sink_cls is None:
+        raise ValueError(f"Unknown sink type: {spec.get('type')}")
+    return sink_cls.from_spec(spec)
+
+@register_sink
+class WebhookSink(DeliverySink):
+    """
+    POSTs results to a customer webhook.
+
+    With WEBHOOK_QUEUE_ENABLED the result is queued for the deliverer
+    process instead, which retries failed deliveries, and `deliver` returns
+    202. A `"batch": true` spec lets the deliverer POST several results to
+    the URL at once, as a JSON array.
+    """
+    type = 'webhook'
+    default_url = DEFAULT_WEBHOOK_URL
+
+    def __init__(self, url=None, batch=False):
+        super().__init__(url)
+        self.batch = batch
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(url=spec.get('url'), batch=bool(spec.get('batch')))
+
+    def deliver(self, body):
+        queue = get_webhook_queue()
+        if queue is None:
+            return super().deliver(body)
+        queue.enqueue(self.url, body, batch=self.batch)
+        return 202
+
+@register_sink
+class WebsocketSink(DeliverySink):
+    """
+    POSTs results to the visualizer's `/publish` endpoint.
+
+    The WebSocket server delivers each result to clients subscribed to its
+    task ID, plus any extra `topics` from the sink spec (e.g. "session:abc"),
+    which are passed in the query string so the body is shared across sinks.
+    """
+    type = 'websocket'
+    default_url = DEFAULT_WEBSOCKET_URL
+    streams = True
+
+    def __init__(self, url=None, topics=None):
+        super().__init__(url)
+        self.topics = topics or []
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(url=spec.get('url'), topics=spec.get('topics'))
+
+    def deliver(self, body):
+        if not self.topics:
+            return super().deliver(body)
+        response = http_post(self.url, data=body, params={"topics": ",".join(self.topics)}, timeout=DELIVERY_TIMEOUT)
+        return response.status_code
+
+def encode_message(message):
+    """Serialize a result message once so every sink sends the same bytes."""
+    return codec.dumps(message)
@@ -0,0 +1,34 @@
+import os
+
+def _parse_mapping(value):
+    """Parse 'name:value,name:value' into a dict."""
+    mapping = {}
+    for item in value.split(','):
+        if ':' in item:
+            name, target = item.split(':', 1)
+            mapping[name.strip()] = target.strip()
+    return mapping
+
+# Priority tiers and the broker queue each one is routed to. Interactive
+# traffic stays on the `default` queue.
+TIER_QUEUES = _parse_mapping(os.environ.get('TIER_QUEUES', 'interactive:default,batch:batch'))
+# Every queue a tier routes to, in tier order; the default for the queues
+# workers consume and admission control watches, so no tier is left unserved
+TIER_QUEUE_NAMES = list(dict.fromkeys(TIER_QUEUES.values()))
+DEFAULT_TIER = os.environ.get('DEFAULT_TIER', 'interactive')
+# Optional Redis message priorities per tier (0 is highest), e.g. 'interactive:0,batch:9'
+TIER_PRIORITIES = {name: int(priority) for name, priority in _parse_mapping(os.environ.get('TIER_PRIORITIES', '')).items()}
+
+def resolve_tier(tier):
+    """Return the tier to use for a submission, raising ValueError for unknown tiers."""
+    tier = tier or DEFAULT_TIER
+    if tier not in TIER_QUEUES:
+        raise ValueError(f"Unknown tier '{tier}', expected one of: {', '.join(TIER_QUEUES)}")
+    return tier
+
+def routing_options(tier):
+    """apply_async options that route a task for `tier`."""
+    options = {"queue": TIER_QUEUES[tier]}
+    if tier in TIER_PRIORITIES:
+        options["priority"] = TIER_PRIORITIES[tier]
+    return options
@@ -0,0 +1,162 @@
+import os
+import math
+import time
+import uuid
+import random
+import logging
+import threading
+import redis
+from src import codec
+from src.celery import BACKEND_URL
+
+logger = logging.getLogger(__name__)
+
+# Queue webhook deliveries in Redis for the deliverer process (src/deliverer.py)
+# instead of POSTing from the inference task
+WEBHOOK_QUEUE_ENABLED = os.environ.get('WEBHOOK_QUEUE_ENABLED', 'false').lower() == 'true'
+WEBHOOK_QUEUE_REDIS_URL = os.environ.get('WEBHOOK_QUEUE_REDIS_URL', BACKEND_URL)
+WEBHOOK_QUEUE_PREFIX = os.environ.get('WEBHOOK_QUEUE_PREFIX', 'webhooks')
+# Attempts before a delivery is moved to the dead-letter list
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+# Exponential backoff between attempts (with full jitter), in seconds
+WEBHOOK_RETRY_BASE_DELAY = float(os.environ.get('WEBHOOK_RETRY_BASE_DELAY', 1))
+WEBHOOK_RETRY_MAX_DELAY = float(os.environ.get('WEBHOOK_RETRY_MAX_DELAY', 300))
+# Results for a batching endpoint are collected for up to this long to share a POST
+WEBHOOK_BATCH_WINDOW = float(os.environ.get('WEBHOOK_BATCH_WINDOW', 1))
+WEBHOOK_DEAD_LETTER_MAX = int(os.environ.get('WEBHOOK_DEAD_LETTER_MAX', 10000))  # Oldest dead letters are dropped beyond this
+
+# Takes up to ARGV[2] deliveries due by ARGV[1] and hides them until ARGV[3],
+# so they are retried if the deliverer dies mid-send. Returns the IDs, their
+# jobs and bodies, and the number of queued deliveries.
+CLAIM_SCRIPT = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local jobs, bodies = {}, {}
+if #due > 0 then
+    for _, id in ipairs(due) do
+        redis.call('zadd', KEYS[1], ARGV[3], id)
+    end
+    jobs = redis.call('hmget', KEYS[2], unpack(due))
+    bodies = redis.call('hmget', KEYS[3], unpack(due))
+end
+return {due, jobs, bodies, redis.call('zcard', KEYS[1])}
+"""
+
+def retry_delay(attempts, retry_after=None):
+    """Seconds before the next attempt: exponential backoff with full jitter, at least `retry_after`."""
+    delay = random.uniform(0, min(WEBHOOK_RETRY_MAX_DELAY, WEBHOOK_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0)))
+    if retry_after:
+        delay = max(delay, min(retry_after, WEBHOOK_RETRY_MAX_DELAY))
+    return delay
+
+class WebhookQueue:
+    """
+    Webhook deliveries waiting in Redis: a sorted set of delivery IDs scored
+    by when they are due, a hash of delivery metadata (URL, attempts, ...)
+    and a hash of the serialized results, plus a capped dead-letter list.
+    """
+
+    def __init__(self, client, prefix=WEBHOOK_QUEUE_PREFIX):
+        self.client = client
+        self.due_key = f"{prefix}:due"
+        self.jobs_key = f"{prefix}:jobs"
+        self.bodies_key = f"{prefix}:bodies"
+        self.dead_key = f"{prefix}:dead"
+        self._claim = client.register_script(CLAIM_SCRIPT)
+
+    def enqueue(self, url, body, batch=False):
+        """
+        Queue one serialized result for `url`.
+
+        Results for batching endpoints are due at the end of the current
+        WEBHOOK_BATCH_WINDOW, so those queued in the same window are claimed
+        (and POSTed) together.
+        """
+        now = time.time()
+        due = math.ceil(now / WEBHOOK_BATCH_WINDOW) * WEBHOOK_BATCH_WINDOW if batch and WEBHOOK_BATCH_WINDOW > 0 else now
+        job = {"id": str(uuid.uuid4()), "url": url, "batch": batch, "attempts": 0, "created_at": now}
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self.jobs_key, job["id"], codec.dumps(job))
+        pipe.hset(self.bodies_key, job["id"], body)
+        pipe.zadd(self.due_key, {job["id"]: due})
+        pipe.execute()
+        return job["id"]
+
+    def claim(self, limit, lease):
+        """Take up to `limit` due deliveries for `lease` seconds; returns ([(job, body)], queued)."""
+        now = time.time()
+        ids, jobs, bodies, queued = self._claim(
+            keys=[self.due_key, self.jobs_key, self.bodies_key], args=[now, limit, now + lease]
+        )
+        claimed = []
+        for delivery_id, job, body in zip(ids, jobs, bodies):
+            if job is None or body is None:
+                self.client.zrem(self.due_key, delivery_id)
+                continue
+            claimed.append((codec.loads(job), body))
+        return claimed, queued
+
+    def complete(self, jobs):
+        """Forget delivered jobs."""
+        ids = [job["id"] for job in jobs]
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(self.due_key, *ids)
+        pipe.hdel(self.jobs_key, *ids)
+        pipe.hdel(self.bodies_key, *ids)
+        pipe.execute()
+
+    def retry(self, jobs, due):
+        """Store the jobs' attempt counts and schedule them again ({delivery_id: epoch seconds})."""
+        pipe = self.client.pipeline(transaction=True)
+        for job in jobs:
+            pipe.hset(self.jobs_key, job["id"], codec.dumps(job))
+        pipe.zadd(self.due_key, due, xx=True)
+        pipe.execute()
+
+    def defer(self, jobs, delay):
+        """Put claimed jobs back without counting an attempt (their destination was busy)."""
+        self.client.zadd(self.due_key, {job["id"]: time.time() + delay for job in jobs}, xx=True)
+
+    def dead_letter(self, items, error):
+        """Move failed deliveries ([(job, body)]) to the dead-letter list."""
+        pipe = self.client.pipeline(transaction=True)
+        for job, body in items:
+            entry = dict(job, error=error, failed_at=time.time(), body=body.decode('utf-8') if isinstance(body, bytes) else body)
+            pipe.lpush(self.dead_key, codec.dumps(entry))
+            pipe.zrem(self.due_key, job["id"])
+            pipe.hdel(self.jobs_key, job["id"])
+            pipe.hdel(self.bodies_key, job["id"])
+        pipe.ltrim(self.dead_key, 0, WEBHOOK_DEAD_LETTER_MAX - 1)
+        pipe.execute()
+
+    def dead_letters(self, limit=100):
+        """The most recent dead letters, without their bodies."""
+        entries = [codec.loads(entry) for entry in self.client.lrange(self.dead_key, 0, limit - 1)]
+        for entry in entries:
+            entry.pop("body", None)
+        return entries
+
+    def replay_dead_letters(self, limit=100):
+        """Queue the oldest `limit` dead letters again with fresh attempt counts; returns how many."""
+        replayed = 0
+        for _ in range(limit):
+            entry = self.client.rpop(self.dead_key)
+            if entry is None:
+                break
+            entry = codec.loads(entry)
+            self.enqueue(entry["url"], entry["body"].encode('utf-8'), entry.get("batch", False))
+            replayed += 1
+        return replayed
+
+_webhook_queue = None
+_webhook_queue_lock = threading.Lock()
+
+def get_webhook_queue():
+    """Return the process-wide webhook queue, or None when webhooks are delivered by the task."""
+    global _webhook_queue
+    if not WEBHOOK_QUEUE_ENABLED:
+        return None
+    if _webhook_queue is None:
+        with _webhook_queue_lock:
+            if _webhook_queue is None:
+                _webhook_queue = WebhookQueue(redis.Redis.from_url(WEBHOOK_QUEUE_REDIS_URL))
+    return _webhook_queue
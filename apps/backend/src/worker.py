@@ -2,6 +2,9 @@
 import os
 import logging
 from src.celery import app
+from src.http_client import TASK_EXECUTION_MODE
+from src.metrics import start_metrics_server
+from src.tiers import TIER_QUEUE_NAMES
 
 # Configure logging
 logging.basicConfig(
@@ -10,17 +13,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# In async mode task threads only wait on the shared event loop, so a large
+# threads pool replaces the CPU-bound prefork default. It is sized apart from
+# ASYNC_MAX_IN_FLIGHT: the runtime's semaphore, not the pool, caps the
+# requests sent upstream, and tasks beyond the cap wait for a free slot there.
+if TASK_EXECUTION_MODE == 'async':
+    WORKER_POOL = os.environ.get('WORKER_POOL', 'threads')
+    WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 400))
+else:
+    WORKER_POOL = os.environ.get('WORKER_POOL', 'prefork')
+    WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 3))
+
+# Queues to consume, highest priority first. Defaults to every tier's queue,
+# so batch work is served whenever no interactive work is waiting.
+WORKER_QUEUES = os.environ.get('WORKER_QUEUES', ','.join(TIER_QUEUE_NAMES))
+
 if __name__ == '__main__':
     logger.info("Starting Celery worker...")
     logger.info(f"Broker URL: {app.conf.broker_url}")
     logger.info(f"Result Backend: {app.conf.result_backend}")
-    logger.info(f"Default Queue: {app.conf.task_default_queue}")
+    logger.info(f"Queues: {WORKER_QUEUES} (order strategy: {app.conf.broker_transport_options.get('queue_order_strategy')})")
+    logger.info(f"Execution mode: {TASK_EXECUTION_MODE} (pool={WORKER_POOL}, concurrency={WORKER_CONCURRENCY})")
     
+    # Expose worker metrics (result cache, ...) for Prometheus
+    start_metrics_server()
+
     # Use the app instance directly from celery.py
     argv = [
         'worker',
         '--loglevel=INFO',
-        '--concurrency=3',  # Adjust based on your needs
-        '-Q', 'default',    # Queue name
+        f'--pool={WORKER_POOL}',
+        f'--concurrency={WORKER_CONCURRENCY}',
+        '-Q', WORKER_QUEUES,
     ]
     app.worker_main(argv) 
\ No newline at end of file
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+
+# Celery keeps its broker and results in memory; the modules under test get a fake Redis
+os.environ.setdefault('CELERY_BROKER_URL', 'memory://')
+os.environ.setdefault('CELERY_RESULT_BACKEND', 'cache+memory://')
+
+# The modules are imported as the `src` package, as in the containers
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer())
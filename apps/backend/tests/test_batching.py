@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from src import batching
+from src.adapters import FluxAdapter
+
+
+class Response:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+@pytest.fixture
+def adapter():
+    adapter = FluxAdapter()
+    adapter.batch_path = '/flux/batch'
+    return adapter
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Records upstream calls; a batch gets one response per request, echoing its prompt."""
+    calls = []
+
+    def http_post(url, data=None, timeout=None):
+        body = json.loads(data)
+        calls.append((url, body))
+        if isinstance(body, list):
+            return Response(200, json.dumps([{"id": item["input"]["prompt"]} for item in body]))
+        return Response(200, json.dumps({"id": body["input"]["prompt"]}))
+
+    monkeypatch.setattr(batching, "http_post", http_post)
+    return calls
+
+
+def request(adapter, prompt, **params):
+    params = dict(params, prompt=prompt)
+    return params, json.dumps(adapter.build_request(params)).encode()
+
+
+def test_flux_is_only_batched_with_a_batch_endpoint(adapter):
+    assert not FluxAdapter().supports_batch
+    assert adapter.supports_batch
+
+
+def test_same_key_calls_are_coalesced_into_one_dispatch(adapter, upstream):
+    batcher = batching.MicroBatcher(window=5, max_size=2)
+    first = batcher.submit(adapter, *request(adapter, "a car", size="512*512"))
+    second = batcher.submit(adapter, *request(adapter, "a boat", size="512*512"))
+
+    assert first.result(timeout=1) == (200, '{"id":"a car"}')
+    assert second.result(timeout=1) == (200, '{"id":"a boat"}')
+    assert len(upstream) == 1
+    url, body = upstream[0]
+    assert url.endswith('/flux/batch')
+    assert [item["input"]["prompt"] for item in body] == ["a car", "a boat"]
+
+
+def test_calls_with_different_keys_are_sent_separately(adapter, upstream):
+    batcher = batching.MicroBatcher(window=0.01, max_size=2)
+    first = batcher.submit(adapter, *request(adapter, "a car", size="512*512"))
+    second = batcher.submit(adapter, *request(adapter, "a boat", size="1024*1024"))
+
+    assert first.result(timeout=1) == (200, '{"id": "a car"}')
+    assert second.result(timeout=1) == (200, '{"id": "a boat"}')
+    assert sorted(url.rsplit('/', 1)[-1] for url, _ in upstream) == ["flux", "flux"]
+
+
+def test_unexpected_batch_response_fails_every_request(adapter):
+    assert adapter.split_batch_response(200, '[{"id": "a"}]', 2) == [(502, '[{"id": "a"}]')] * 2
+    assert adapter.split_batch_response(503, 'busy', 2) == [(503, 'busy')] * 2
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import time
+
+import pytest
+from celery import states
+
+from src import pipeline, poller, polling
+from src.adapters import get_adapter
+from src.celery import app as celery_app
+from src.result_cache import ResultCache
+from src.singleflight import SingleFlight, ABANDONED
+
+
+@pytest.fixture
+def adapter():
+    return get_adapter('wavespeed-flux')
+
+
+def status_body(status, **fields):
+    return json.dumps({"data": dict(fields, id="pred-1", status=status)})
+
+
+@pytest.mark.parametrize("age, expected, interval", [
+    (0, None, polling.POLL_MIN_INTERVAL),
+    (50, None, 50 * polling.POLL_INTERVAL_FACTOR),
+    (10000, None, polling.POLL_MAX_INTERVAL),
+    # Younger than the usual completion time: check shortly before it
+    (1, 10, 7),
+    (20, 10, 20 * polling.POLL_INTERVAL_FACTOR),
+])
+def test_poll_interval_grows_with_age(age, expected, interval):
+    assert polling.poll_interval(age, expected) == pytest.approx(interval)
+
+
+def test_classify_poll_pending_and_retryable_checks_return_none(adapter):
+    assert polling.classify_poll(adapter, 200, status_body("processing")) is None
+    assert polling.classify_poll(adapter, 429, "slow down") is None
+    assert polling.classify_poll(adapter, 503, "unavailable") is None
+
+
+def test_classify_poll_completed_prediction_is_a_success(adapter):
+    status_code, prediction = polling.classify_poll(adapter, 200, status_body("completed", outputs=["https://img"]))
+    assert status_code == 200
+    assert prediction["outputs"] == ["https://img"]
+
+
+def test_classify_poll_failed_prediction_is_an_error(adapter):
+    status_code, prediction = polling.classify_poll(adapter, 200, status_body("failed", error="NSFW"))
+    assert status_code == polling.PREDICTION_FAILED_STATUS != 200
+    assert prediction["error"] == "NSFW"
+
+
+@pytest.fixture
+def coordination(redis_client, monkeypatch):
+    """A result cache and single-flight on the fake Redis, as the pipeline and poller see them."""
+    cache = ResultCache(redis_client)
+    flight = SingleFlight(redis_client)
+    monkeypatch.setattr(pipeline, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(pipeline, "get_singleflight", lambda: flight)
+    monkeypatch.setattr(poller, "get_singleflight", lambda: flight)
+    return cache, flight
+
+
+def make_job(adapter, task_id, params=None, flight_key=None, **fields):
+    job = {
+        "task_id": task_id,
+        "model": adapter.name,
+        "params": params or {},
+        "sinks": [],
+        "prediction_id": "pred-1",
+        "submitted_at": time.time(),
+        "deadline": None,
+        "flight_key": flight_key,
+    }
+    job.update(fields)
+    return job
+
+
+def submit(queue, flight, adapter, task_id, params):
+    """Queue a prediction for the poller as a flight owner would."""
+    flight_key = flight.key(adapter, params)
+    assert flight.acquire(flight_key, task_id)
+    job = make_job(adapter, task_id, params, flight_key)
+    queue.add(job)
+    return job
+
+
+def test_failed_poll_is_neither_cached_shared_nor_stored_as_success(adapter, redis_client, coordination):
+    cache, flight = coordination
+    params = {"prompt": "A car", "seed": 7}
+    queue = polling.PollQueue(redis_client)
+    job = submit(queue, flight, adapter, "task-failed", params)
+
+    done = polling.classify_poll(adapter, 200, status_body("failed", error="NSFW"))
+    poller.Poller(queue).deliver(job, done)
+
+    assert cache.get(adapter, params, source='task') is None
+    # Waiters are told to call the model themselves rather than handed the failure
+    assert redis_client.get(flight._result_key(job["flight_key"])).decode() == ABANDONED
+    assert celery_app.backend.get_state("task-failed") == states.FAILURE
+    assert not redis_client.hexists(queue.jobs_key, "task-failed")
+
+
+def test_completed_poll_is_cached_shared_and_stored_as_success(adapter, redis_client, coordination):
+    cache, flight = coordination
+    params = {"prompt": "A car", "seed": 7}
+    queue = polling.PollQueue(redis_client)
+    job = submit(queue, flight, adapter, "task-done", params)
+
+    done = polling.classify_poll(adapter, 200, status_body("completed", outputs=["https://img"]))
+    poller.Poller(queue).deliver(job, done)
+
+    assert cache.get(adapter, params, source='task')["status_code"] == 200
+    assert flight.wait(job["flight_key"])["status_code"] == 200
+    assert celery_app.backend.get_state("task-done") == states.SUCCESS
+
+
+def test_claim_takes_due_jobs_and_hides_them_for_the_lease(adapter, redis_client):
+    queue = polling.PollQueue(redis_client)
+    for task_id in ("t1", "t2", "t3"):
+        queue.add(make_job(adapter, task_id))
+    assert celery_app.backend.get_state("t1") == polling.SUBMITTED
+    # Nothing is due before the first poll interval
+    assert queue.claim(10, 60) == ([], 3)
+    redis_client.zadd(queue.due_key, {"t1": 0, "t2": 0, "t3": 0})
+
+    jobs, outstanding = queue.claim(2, 60)
+    assert [job["task_id"] for job in jobs] == ["t1", "t2"] and outstanding == 3
+    jobs, _ = queue.claim(10, 60)
+    assert [job["task_id"] for job in jobs] == ["t3"]
+    assert queue.claim(10, 60) == ([], 3)
+    assert redis_client.zscore(queue.due_key, "t1") > time.time() + 50
+
+
+def test_claim_drops_jobs_finished_by_another_poller(adapter, redis_client):
+    queue = polling.PollQueue(redis_client)
+    queue.add(make_job(adapter, "t1"))
+    redis_client.zadd(queue.due_key, {"t1": 0})
+    redis_client.hdel(queue.jobs_key, "t1")
+    assert queue.claim(10, 60) == ([], 1)
+    assert redis_client.zcard(queue.due_key) == 0
+
+
+def test_reschedule_does_not_resurrect_removed_jobs(adapter, redis_client):
+    queue = polling.PollQueue(redis_client)
+    queue.add(make_job(adapter, "t1"))
+    queue.add(make_job(adapter, "t2"))
+    queue.remove("t2")
+    queue.reschedule_many({"t1": 100, "t2": 100})
+    assert redis_client.zrange(queue.due_key, 0, -1, withscores=True) == [(b"t1", 100.0)]
+    assert not redis_client.hexists(queue.jobs_key, "t2")
+
+
+def test_expired_predictions_end_the_task_and_the_flight(adapter, redis_client, coordination):
+    _, flight = coordination
+    queue = polling.PollQueue(redis_client)
+    job = submit(queue, flight, adapter, "task-expired", {"seed": 1})
+    job["submitted_at"] -= polling.POLL_TIMEOUT + 1
+
+    asyncio.run(poller.Poller(queue).schedule(job))
+
+    result = celery_app.backend.get_result("task-expired")
+    assert "did not complete" in result["error"]
+    assert redis_client.get(flight._result_key(job["flight_key"])).decode() == ABANDONED
+    assert not redis_client.hexists(queue.jobs_key, "task-expired")
+
+
+def test_pending_predictions_are_rescheduled_in_one_write(adapter, redis_client):
+    queue = polling.PollQueue(redis_client)
+    jobs = [make_job(adapter, task_id) for task_id in ("t1", "t2")]
+    for job in jobs:
+        queue.add(job)
+    checker = poller.Poller(queue)
+
+    async def cycle():
+        for job in jobs:
+            await checker.schedule(job)
+        assert set(checker.reschedules) == {"t1", "t2"}
+        await checker.flush()
+
+    asyncio.run(cycle())
+    assert checker.reschedules == {}
+    assert redis_client.zscore(queue.due_key, "t1") == pytest.approx(time.time() + polling.POLL_MIN_INTERVAL, abs=1)
@@ -0,0 +1,58 @@
+import pytest
+
+from src.adapters import get_adapter
+from src.result_cache import ResultCache, has_fixed_seed
+
+
+@pytest.fixture
+def adapter():
+    return get_adapter('flux')
+
+
+@pytest.mark.parametrize("params, fixed", [
+    ({"seed": 0}, True),
+    ({"seed": 42}, True),
+    ({}, False),
+    ({"seed": -1}, False),
+    ({"seed": True}, False),
+    ({"seed": "42"}, False),
+])
+def test_only_fixed_seeds_are_deterministic(params, fixed):
+    assert has_fixed_seed(params) is fixed
+
+
+def test_round_trip_for_deterministic_requests(adapter, redis_client):
+    cache = ResultCache(redis_client)
+    value = {"status_code": 200, "response": {"image_url": "https://img"}}
+    assert cache.get(adapter, {"prompt": "a car", "seed": 1}, source='task') is None
+    assert cache.set(adapter, {"prompt": "a car", "seed": 1}, value)
+    assert cache.get(adapter, {"seed": 1, "prompt": "a car"}, source='task') == value
+    assert cache.get(adapter, {"prompt": "a car", "seed": 2}, source='task') is None
+
+
+def test_random_seeds_are_never_cached(adapter, redis_client):
+    cache = ResultCache(redis_client)
+    assert not cache.set(adapter, {"prompt": "a car"}, {"status_code": 200})
+    assert not cache.set(adapter, {"prompt": "a car", "seed": -1}, {"status_code": 200})
+    assert redis_client.dbsize() == 0
+
+
+def test_oversized_values_are_not_cached(adapter, redis_client):
+    cache = ResultCache(redis_client, max_value_bytes=10)
+    assert not cache.set(adapter, {"seed": 1}, {"response": "x" * 100})
+    assert cache.get(adapter, {"seed": 1}, source='task') is None
+
+
+def test_least_recently_used_entries_are_evicted(adapter, redis_client):
+    cache = ResultCache(redis_client, max_entries=2)
+    cache.set(adapter, {"seed": 1}, {"n": 1})
+    cache.set(adapter, {"seed": 2}, {"n": 2})
+    # Reading seed 1 makes seed 2 the least recently used
+    assert cache.get(adapter, {"seed": 1}, source='task') == {"n": 1}
+    cache.set(adapter, {"seed": 3}, {"n": 3})
+
+    assert cache.get(adapter, {"seed": 2}, source='task') is None
+    assert cache.get(adapter, {"seed": 1}, source='task') == {"n": 1}
+    assert cache.get(adapter, {"seed": 3}, source='task') == {"n": 3}
+    assert redis_client.zcard(cache.lru_key) == 2
+    assert not redis_client.exists(cache.entry_key(adapter, {"seed": 2}))
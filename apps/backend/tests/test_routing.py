@@ -0,0 +1,151 @@
+import pytest
+
+from src import routing
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(routing, "time", clock)
+    return clock
+
+
+def router(*urls, policy='p2c'):
+    return routing.Router([(url, 1.0) for url in urls], policy)
+
+
+def complete(router, backend, elapsed=1.0, failed=False):
+    assert router.acquire(exclude=[other.url for other in router.backends if other is not backend]) is backend
+    router.release(backend, elapsed, failed)
+
+
+def test_parse_backends():
+    assert routing.parse_backends(' http://a/ ,http://b=2,, http://c=x') == [
+        ('http://a', 1.0), ('http://b', 2.0), ('http://c=x', 1.0),
+    ]
+
+
+def test_latency_average_jumps_up_and_decays_down(clock):
+    backend = routing.Backend('http://a')
+    backend.record(clock.now, 1.0, False)
+    backend.record(clock.now, 5.0, False)
+    assert backend.latency == 5.0
+    clock.now += routing.ROUTING_DECAY_SECONDS
+    backend.record(clock.now, 1.0, False)
+    assert 1.0 < backend.latency < 5.0
+    # A failure counts as at least the failure penalty
+    backend.record(clock.now, 0.1, True)
+    assert backend.latency == routing.ROUTING_FAILURE_PENALTY
+
+
+def test_p2c_takes_the_cheaper_of_two_samples(clock, monkeypatch):
+    balancer = router('http://slow', 'http://fast')
+    slow, fast = balancer.backends
+    complete(balancer, slow, elapsed=5.0)
+    complete(balancer, fast, elapsed=1.0)
+    monkeypatch.setattr(routing.random, "choices", lambda candidates, weights, k: [slow, fast])
+    assert balancer.acquire() is fast
+    # Outstanding requests raise a backend's cost, until 1s x 5 matches 5s x 1
+    for _ in range(3):
+        assert balancer.acquire() is fast
+    assert fast.in_flight == 4
+    assert balancer.acquire() is slow
+
+
+def test_least_outstanding_takes_the_least_loaded_backend(clock):
+    balancer = router('http://a', 'http://b', policy='least_outstanding')
+    assert [balancer.acquire().url for _ in range(4)] == ['http://a', 'http://b', 'http://a', 'http://b']
+    balancer.cancel(balancer.backends[1])
+    assert balancer.acquire().url == 'http://b'
+
+
+def test_excluded_backends_are_avoided_when_others_are_available(clock):
+    balancer = router('http://a', 'http://b')
+    assert all(balancer.acquire(exclude=['http://a']).url == 'http://b' for _ in range(10))
+    solo = router('http://a')
+    assert solo.acquire(exclude=['http://a']).url == 'http://a'
+
+
+def test_circuit_opens_after_consecutive_failures_and_closes_after_a_probe(clock):
+    balancer = router('http://a', 'http://b')
+    a, b = balancer.backends
+    for _ in range(routing.CIRCUIT_FAILURE_THRESHOLD):
+        complete(balancer, a, failed=True)
+    assert not a.available(clock.now)
+    assert all(balancer.acquire() is b for _ in range(10))
+
+    # Half-open: one probe at a time once the open period is over
+    clock.now += routing.CIRCUIT_OPEN_SECONDS
+    probe = balancer.acquire(exclude=['http://b'])
+    assert probe is a and a.probing and not a.available(clock.now)
+    balancer.release(a, 1.0, failed=False)
+    assert a.consecutive_failures == 0 and a.available(clock.now)
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    balancer = router('http://a', 'http://b')
+    a, _ = balancer.backends
+    for _ in range(routing.CIRCUIT_FAILURE_THRESHOLD):
+        complete(balancer, a, failed=True)
+    clock.now += routing.CIRCUIT_OPEN_SECONDS
+    complete(balancer, a, failed=True)
+    assert a.open_until == clock.now + routing.CIRCUIT_OPEN_SECONDS
+    assert not a.available(clock.now)
+
+
+def test_all_backends_are_used_when_none_is_available(clock):
+    balancer = router('http://a')
+    a, = balancer.backends
+    for _ in range(routing.CIRCUIT_FAILURE_THRESHOLD):
+        complete(balancer, a, failed=True)
+    assert balancer.acquire() is a
+
+
+def test_outliers_are_ejected_up_to_the_cap(clock):
+    balancer = router('http://a', 'http://b', 'http://c')
+    a, b, c = balancer.backends
+    for _ in range(routing.OUTLIER_MIN_REQUESTS):
+        complete(balancer, c, elapsed=1.0)
+    for _ in range(routing.OUTLIER_MIN_REQUESTS):
+        complete(balancer, a, elapsed=10.0)
+    assert a.ejected_until == clock.now + routing.OUTLIER_EJECTION_SECONDS
+    assert not a.available(clock.now)
+
+    # b's error rate makes it an outlier too, but ejecting it would take
+    # more than OUTLIER_MAX_EJECTED_PERCENT of the backends out of rotation
+    complete(balancer, b, failed=True)
+    for _ in range(routing.OUTLIER_MIN_REQUESTS):
+        complete(balancer, b)
+    assert b.error_rate > routing.OUTLIER_ERROR_RATE
+    assert b.available(clock.now)
+
+    clock.now += routing.OUTLIER_EJECTION_SECONDS
+    assert a.available(clock.now)
+
+
+def test_upstream_call_records_status_and_exceptions(clock, monkeypatch):
+    balancer = router('http://a')
+    a, = balancer.backends
+    monkeypatch.setattr(routing, "get_router", lambda: balancer)
+
+    with routing.upstream_call('/flux') as call:
+        assert call.url == 'http://a/flux'
+        call.status_code = 503
+    assert a.consecutive_failures == 1 and a.in_flight == 0
+
+    with pytest.raises(RuntimeError):
+        with routing.upstream_call('/flux'):
+            raise RuntimeError("connection reset")
+    assert a.consecutive_failures == 2 and a.in_flight == 0
+
+    with routing.upstream_call('/flux') as call:
+        call.status_code = 200
+    assert a.consecutive_failures == 0
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from src.adapters import get_adapter
+from src.singleflight import SingleFlight
+
+
+@pytest.fixture
+def adapter():
+    return get_adapter('flux')
+
+
+@pytest.fixture
+def flight(redis_client):
+    return SingleFlight(redis_client, lock_ttl=30, wait_timeout=2)
+
+
+def test_only_deterministic_requests_have_a_flight(adapter, flight):
+    assert flight.key(adapter, {"prompt": "a car"}) is None
+    assert flight.key(adapter, {"prompt": "a car", "seed": 1}) == flight.key(adapter, {"seed": 1, "prompt": "a car"})
+
+
+def test_first_task_to_acquire_owns_the_flight(adapter, flight):
+    key = flight.key(adapter, {"seed": 1})
+    assert flight.acquire(key, "task-1")
+    assert not flight.acquire(key, "task-2")
+
+
+def test_waiters_get_the_published_result(adapter, flight):
+    key = flight.key(adapter, {"seed": 1})
+    assert flight.acquire(key, "owner")
+    result = {"status_code": 200, "response": {"image_url": "https://img"}}
+    publisher = threading.Timer(0.2, flight.publish, args=(key, "owner", result))
+    publisher.start()
+    try:
+        assert flight.wait(key) == result
+    finally:
+        publisher.join()
+    # The lock is released, and late waiters read the stored result
+    assert not flight.client.exists(flight._lock_key(key))
+    assert flight.wait(key) == result
+
+
+def test_waiters_fall_back_when_the_owner_abandons(adapter, flight):
+    key = flight.key(adapter, {"seed": 1})
+    assert flight.acquire(key, "owner")
+    flight.abandon(key, "owner")
+    assert flight.wait(key) is None
+    assert flight.acquire(key, "retry")
+
+
+def test_waiters_fall_back_when_the_owner_goes_away(adapter, flight, redis_client):
+    key = flight.key(adapter, {"seed": 1})
+    assert flight.acquire(key, "owner")
+    # The owner's lease expires without a result
+    redis_client.delete(flight._lock_key(key))
+    started = time.monotonic()
+    assert flight.wait(key) is None
+    assert time.monotonic() - started < 2
+
+
+def test_only_the_owner_releases_the_lock(adapter, flight, redis_client):
+    key = flight.key(adapter, {"seed": 1})
+    assert flight.acquire(key, "owner")
+    flight.publish(key, "stale-owner", {"status_code": 200})
+    assert redis_client.get(flight._lock_key(key)) == b"owner"
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from src import deliverer, webhook_queue
+from src.webhook_queue import WebhookQueue, retry_delay
+
+
+@pytest.fixture
+def queue(redis_client):
+    return WebhookQueue(redis_client)
+
+
+def claim_all(queue):
+    claimed, _ = queue.claim(100, 60)
+    return claimed
+
+
+def test_claim_takes_due_deliveries_and_hides_them_for_the_lease(queue):
+    first = queue.enqueue("http://hook/a", b'{"n": 1}')
+    queue.enqueue("http://hook/b", b'{"n": 2}')
+
+    claimed, queued = queue.claim(1, 60)
+    assert queued == 2
+    assert [(job["id"], job["url"], job["attempts"], body) for job, body in claimed] == [
+        (first, "http://hook/a", 0, b'{"n": 1}'),
+    ]
+    assert [job["url"] for job, _ in claim_all(queue)] == ["http://hook/b"]
+    assert claim_all(queue) == []
+
+
+def test_batched_deliveries_are_due_at_the_end_of_the_window(queue, redis_client, monkeypatch):
+    monkeypatch.setattr(webhook_queue, "WEBHOOK_BATCH_WINDOW", 60)
+    delivery_id = queue.enqueue("http://hook", b'{}', batch=True)
+    due = redis_client.zscore(queue.due_key, delivery_id)
+    assert due % 60 == 0 and time.time() <= due
+    assert claim_all(queue) == []
+
+
+def test_claim_drops_deliveries_completed_elsewhere(queue, redis_client):
+    delivery_id = queue.enqueue("http://hook", b'{}')
+    redis_client.hdel(queue.jobs_key, delivery_id)
+    assert claim_all(queue) == []
+    assert redis_client.zcard(queue.due_key) == 0
+
+
+def test_retry_delay_backs_off_with_jitter(monkeypatch):
+    monkeypatch.setattr(webhook_queue.random, "uniform", lambda low, high: high)
+    assert [retry_delay(attempts) for attempts in (1, 2, 3)] == [1, 2, 4]
+    assert retry_delay(100) == webhook_queue.WEBHOOK_RETRY_MAX_DELAY
+    monkeypatch.setattr(webhook_queue.random, "uniform", lambda low, high: low)
+    assert retry_delay(1, retry_after=20) == 20
+    assert retry_delay(1, retry_after=10 ** 6) == webhook_queue.WEBHOOK_RETRY_MAX_DELAY
+
+
+def test_dead_letters_are_capped_and_replayed_oldest_first(queue, redis_client, monkeypatch):
+    monkeypatch.setattr(webhook_queue, "WEBHOOK_DEAD_LETTER_MAX", 3)
+    for n in range(5):
+        queue.enqueue(f"http://hook/{n}", b'{"n": %d}' % n)
+    queue.dead_letter(claim_all(queue), "HTTP 404")
+
+    assert redis_client.zcard(queue.due_key) == 0 and redis_client.hlen(queue.bodies_key) == 0
+    entries = queue.dead_letters()
+    assert [entry["url"] for entry in entries] == ["http://hook/4", "http://hook/3", "http://hook/2"]
+    assert all(entry["error"] == "HTTP 404" and "body" not in entry for entry in entries)
+
+    assert queue.replay_dead_letters(limit=2) == 2
+    replayed = claim_all(queue)
+    assert [(job["url"], job["attempts"], body) for job, body in replayed] == [
+        ("http://hook/2", 0, b'{"n": 2}'),
+        ("http://hook/3", 0, b'{"n": 3}'),
+    ]
+    assert [entry["url"] for entry in queue.dead_letters()] == ["http://hook/4"]
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class Client:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.posts = []
+
+    async def post(self, url, content=None):
+        self.posts.append((url, content))
+        return Response(self.status_code, self.headers)
+
+
+class Destination:
+    def __init__(self, status_code=200, headers=None):
+        self.client = Client(status_code, headers)
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+
+def deliver(queue, destination):
+    sender = deliverer.Deliverer(queue)
+    sender.destinations["http://hook"] = destination
+
+    async def run():
+        await sender.dispatch(claim_all(queue))
+        await asyncio.gather(*sender.active)
+
+    asyncio.run(run())
+
+
+def test_batching_endpoints_get_one_post_per_url(queue):
+    for n in range(3):
+        queue.enqueue("http://hook/batch", b'{"n": %d}' % n, batch=True)
+    queue.enqueue("http://hook/single", b'{"n": 3}')
+    queue.client.zadd(queue.due_key, {member: 0 for member in queue.client.zrange(queue.due_key, 0, -1)})
+    destination = Destination()
+
+    deliver(queue, destination)
+
+    posts = sorted(destination.client.posts)
+    assert [url for url, _ in posts] == ["http://hook/batch", "http://hook/single"]
+    assert sorted(item["n"] for item in json.loads(posts[0][1])) == [0, 1, 2]
+    assert destination.in_flight == 0
+    assert queue.client.zcard(queue.due_key) == 0
+
+
+def test_rejected_deliveries_are_dead_lettered_at_once(queue):
+    queue.enqueue("http://hook/a", b'{}')
+    deliver(queue, Destination(404))
+    assert queue.client.zcard(queue.due_key) == 0
+    assert [entry["error"] for entry in queue.dead_letters()] == ["HTTP 404"]
+
+
+def test_failed_deliveries_are_retried_until_out_of_attempts(queue, monkeypatch):
+    monkeypatch.setattr(deliverer, "WEBHOOK_MAX_ATTEMPTS", 2)
+    delivery_id = queue.enqueue("http://hook/a", b'{}')
+
+    deliver(queue, Destination(503, {"Retry-After": "30"}))
+    job = json.loads(queue.client.hget(queue.jobs_key, delivery_id))
+    assert job["attempts"] == 1 and job["last_error"] == "HTTP 503"
+    assert queue.client.zscore(queue.due_key, delivery_id) >= time.time() + 29
+    assert queue.dead_letters() == []
+
+    queue.client.zadd(queue.due_key, {delivery_id: 0})
+    deliver(queue, Destination(503))
+    assert queue.client.zcard(queue.due_key) == 0
+    assert [entry["attempts"] for entry in queue.dead_letters()] == [2]
+
+
+def test_deliveries_for_a_busy_destination_are_deferred_without_an_attempt(queue):
+    delivery_id = queue.enqueue("http://hook/a", b'{}')
+    destination = Destination()
+    destination.in_flight = deliverer.WEBHOOK_DESTINATION_CONCURRENCY
+
+    deliver(queue, destination)
+
+    assert destination.client.posts == []
+    assert json.loads(queue.client.hget(queue.jobs_key, delivery_id))["attempts"] == 0
+    assert queue.client.zscore(queue.due_key, delivery_id) > time.time()
@@ -5,6 +5,8 @@ const config = {
         "ws://localhost:8765", // Port-forwarded URL (for local testing)
         "ws://visualize-websocket.frontend.svc.cluster.local:8765" // In-cluster URL
     ],
+    // Topics to subscribe to; the visualizer shows every result
+    topics: ["*"],
     reconnectDelay: 3000, // ms
     maxReconnectAttempts: 10,
     gridSize: 8 // 2x4 grid
@@ -19,6 +21,8 @@ const state = {
     socket: null,
     totalImagesReceived: 0,
     currentWsUrlIndex: 0,
+    lastSeq: null, // Sequence ID of the last message seen, to resume from after a reconnect
+    objectUrls: Array(config.gridSize).fill(null), // Blob URLs shown in each cell, revoked when replaced
     usedCells: Array(config.gridSize).fill(false) // Track which cells have been used
 };
 
@@ -65,14 +69,58 @@ function updateUI() {
     elements.imagesReceived.textContent = state.totalImagesReceived;
 }
 
+// Decode a binary image frame: a 4-byte big-endian header length, the JSON
+// header, then the raw image bytes
+function parseBinaryFrame(buffer) {
+    const headerLength = new DataView(buffer).getUint32(0);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+    const image = new Blob([new Uint8Array(buffer, 4 + headerLength)], {type: header.image.mime_type});
+    return {header, image};
+}
+
 // Handle received messages
 function handleMessage(event) {
     try {
+        if (event.data instanceof ArrayBuffer) {
+            const {header, image} = parseBinaryFrame(event.data);
+            if (typeof header.seq === 'number') {
+                state.lastSeq = Math.max(state.lastSeq || 0, header.seq);
+            }
+            displayImageBlob(image);
+            return;
+        }
+
         const data = JSON.parse(event.data);        
-        // We expect base64 image data at data.response.image_url
+
+        // The server numbers published messages; remember where we are so a
+        // reconnect only replays what was missed
+        if (data.type === 'connection_status') {
+            if (state.lastSeq === null || data.seq < state.lastSeq) {
+                state.lastSeq = data.seq;
+            }
+            return;
+        }
+        if (typeof data.seq === 'number') {
+            state.lastSeq = Math.max(state.lastSeq || 0, data.seq);
+        }
+
+        // Progress updates for streamed requests; the grid only shows finished images
+        if (data.type === 'progress') {
+            return;
+        }
+
+        // We expect either a blob URL or base64 image data at data.response.image_url
         if (data.response && data.response.image_url) {
-            // Get the base64 image data
             const imageData = data.response.image_url;
+
+            // Images offloaded to the blob store arrive as URLs
+            if (/^https?:\/\//.test(imageData)) {
+                console.log('Found image URL in response.image_url');
+                displayImageFromUrl(imageData);
+                return;
+            }
+
+            // Get the base64 image data
             console.log('Found base64 image in response.image_url');
             
             // Display the image
@@ -197,6 +245,50 @@ function displayImageFromUrl(imageUrl) {
     }
 }
 
+// Display an image received as raw bytes
+function displayImageBlob(blob) {
+    try {
+        // Get a random cell index for placement
+        const cellIndex = getRandomCellIndex();
+        const cell = document.getElementById(`cell-${cellIndex}`);
+        
+        if (!cell) return;
+        
+        const objectUrl = URL.createObjectURL(blob);
+        const img = new Image();
+        
+        // Release the image this one replaces, or the one that failed to load
+        function showInCell(content) {
+            cell.innerHTML = '';
+            cell.appendChild(content);
+            if (state.objectUrls[cellIndex]) {
+                URL.revokeObjectURL(state.objectUrls[cellIndex]);
+            }
+            state.objectUrls[cellIndex] = content === img ? objectUrl : null;
+            state.usedCells[cellIndex] = true;
+            state.totalImagesReceived++;
+            updateUI();
+        }
+        
+        img.onload = function() {
+            img.classList.add('image-loaded');
+            showInCell(img);
+        };
+        
+        img.onerror = function() {
+            URL.revokeObjectURL(objectUrl);
+            const error = document.createElement('div');
+            error.classList.add('error-image');
+            error.textContent = 'Failed to load image';
+            showInCell(error);
+        };
+        
+        img.src = objectUrl;
+    } catch (error) {
+        console.error('Error displaying image:', error);
+    }
+}
+
 // Display an image from base64 data
 function displayImage(imageData) {
     try {
@@ -259,11 +351,16 @@ function connectWebSocket() {
     state.connectionAttempts++;
     
     // Get current WebSocket URL
-    const wsUrl = config.wsUrls[state.currentWsUrlIndex];
+    // binary=1 asks for images as raw bytes in binary frames instead of base64 JSON
+    let wsUrl = `${config.wsUrls[state.currentWsUrlIndex]}?topics=${encodeURIComponent(config.topics.join(','))}&binary=1`;
+    if (state.lastSeq !== null) {
+        wsUrl += `&since=${state.lastSeq}`;
+    }
     
     try {
         console.log(`Connecting to WebSocket: ${wsUrl} (attempt ${state.connectionAttempts})`);
         const socket = new WebSocket(wsUrl);
+        socket.binaryType = 'arraybuffer';
         
         socket.onopen = function() {
             console.log('WebSocket connection established');
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# websocket_server.py is a script in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+import pytest
+import websockets
+from websockets import frames
+
+import websocket_server as server
+
+
+def test_text_deflate_compresses_only_text_frames():
+    factory = server.TextDeflateFactory(compress_settings={"level": 1})
+    _, extension = factory.process_request_params([], [])
+    assert isinstance(extension, server.TextDeflate)
+
+    text = extension.encode(frames.Frame(frames.OP_TEXT, b'{"a": "' + b"x" * 1000 + b'"}'))
+    assert text.rsv1 and len(text.data) < 1000
+
+    image = frames.Frame(frames.OP_BINARY, b"\x89PNG" + bytes(range(256)))
+    assert extension.encode(image) is image
+
+
+def test_send_frame_sends_bytes_as_text_and_binary_frames():
+    # send_frame relies on websockets internals; this fails if they change
+    async def handler(websocket, path=None):
+        await server.send_frame(websocket, frames.OP_TEXT, b'{"seq": 1}')
+        await server.send_frame(websocket, frames.OP_BINARY, b"\x00\x01\x02")
+        await websocket.wait_closed()
+
+    async def exchange():
+        async with websockets.serve(handler, "127.0.0.1", 0, compression=None, extensions=server.compression_extensions()) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            async with websockets.connect(f"ws://127.0.0.1:{port}") as client:
+                assert client.extensions and client.extensions[0].name == "permessage-deflate"
+                return [await client.recv(), await client.recv()]
+
+    assert asyncio.run(exchange()) == ['{"seq": 1}', b"\x00\x01\x02"]
+
+
+@pytest.mark.parametrize("body", [
+    b'{}',
+    b' { } \n',
+    b'{"task_id": "t1", "response": {"a": [1, {"b": "}]\\"x"}], "c": null}, "topics": ["x", "y"], "user_id": 7}',
+    b'{"a": "\\\\", "task_id": "q"}',
+    b'{"a":1.5e3 ,"session_id" : "s" }',
+    b'{"a": true, "b": false, "c": -0.5E-3, "d": [], "e": {}, "f": "\\u00e9\\n\\/", "task_id": "x"}',
+    '{"task_id": "é"}'.encode(),
+])
+def test_routing_fields_accepts_json_objects(body):
+    data = json.loads(body)
+    assert server.routing_fields(body) == {key: data[key] for key in server.ROUTING_FIELDS if key in data}
+
+
+@pytest.mark.parametrize("body", [
+    b'', b'[1]', b'"x"', b'{a: 1}', b'{"a": 1', b'{"a": }', b'{"a" 1}', b'{"a": 1}x', b'{"a": 1,}',
+    b'{"a": "x}', b'{"a": [1, 2}', b'{"a": [1 2]}', b'{"a": [1,]}', b'{"a": {"b"}}', b'{"a": {1: 2}}',
+    b'{"a": tru}', b'{"a": truex}', b'{"a": [nul]}', b'{"a": {"b": fals}}', b'{"a": NaN}',
+    b'{"a": 01}', b'{"a": 1.}', b'{"a": .5}', b'{"a": +1}', b'{"a": -}',
+    b'{"a": "\\x"}', b'{"a": "\\u12"}',
+])
+def test_routing_fields_rejects_invalid_json(body):
+    with pytest.raises(server.InvalidMessage):
+        server.routing_fields(body)
+
+
+def test_read_message_passes_the_body_through():
+    body = b'{"task_id": "t1", "response": {"image_url": "data:image/png;base64,iVBORw0KGgo="}}\n'
+    message, fields = server.read_message(body)
+    assert message == body.strip() and fields == {"task_id": "t1"}
+    with pytest.raises(server.InvalidMessage):
+        server.read_message(b'{"a": "\xff"}')
+
+
+@pytest.mark.parametrize("body", [b'{"seq": 1, "task_id": "t1"}', b'{"task_id": "t1", "s\\u0065q": 1}'])
+def test_read_message_rejects_a_client_supplied_seq(body, monkeypatch):
+    with pytest.raises(server.InvalidMessage):
+        server.read_message(body)
+    monkeypatch.setattr(server, "PUBLISH_PASSTHROUGH", False)
+    with pytest.raises(server.InvalidMessage):
+        server.read_message(body)
+    # Nested fields named seq are the publisher's own
+    assert server.read_message(b'{"response": {"seq": 1}}')[1] == {"response": {"seq": 1}}
+
+
+def test_replay_is_incomplete_across_a_message_too_large_to_buffer():
+    buffer = server.ReplayBuffer(max_messages=10, max_bytes=30)
+    for seq, message in [(3, b'{"a": 3}'), (4, b'{"a": 4}'), (5, b'{"a": "' + b"x" * 40 + b'"}'), (6, b'{"a": 6}')]:
+        buffer.append(seq, {"t"}, message)
+
+    assert [seq for seq, _, _ in buffer.entries] == [3, 4, 6]
+    assert buffer.since(4, {"t"}) == ([b'{"a": 6}'], False)
+    assert buffer.since(2, {"t"})[1] is False
+    assert buffer.since(5, {"t"}) == ([b'{"a": 6}'], True)
+    assert buffer.since(6, {"t"}) == ([], True)
+
+
+def test_memory_backplane_fans_out_to_every_replica():
+    async def publish():
+        hub = []
+        received = {"a": [], "b": []}
+        replicas = {name: server.MemoryBackplane(hub) for name in received}
+        for name, replica in replicas.items():
+            await replica.start(lambda message, topics, seq, name=name: received[name].append((bytes(message), topics, seq)))
+        reached = [
+            await replicas["a"].publish(b'{"task_id": "t1"}', {"t1"}),
+            await replicas["b"].publish(b'{"task_id": "t2"}', {"t2", "user:7"}),
+        ]
+        await replicas["b"].close()
+        reached.append(await replicas["a"].publish(b'{}', {"t3"}))
+        return reached, received
+
+    reached, received = asyncio.run(publish())
+    assert reached == [2, 2, 1]
+    assert received["a"][:2] == received["b"]
+    assert [(message, topics) for message, topics, _ in received["a"]] == [
+        (b'{"task_id": "t1"}', {"t1"}),
+        (b'{"task_id": "t2"}', {"t2", "user:7"}),
+        (b'{}', {"t3"}),
+    ]
+    sequences = [seq for _, _, seq in received["a"]]
+    assert sequences == sorted(set(sequences))
@@ -1,12 +1,29 @@
 #!/usr/bin/env python
 import asyncio
 import websockets
+from websockets import frames
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
 import json
+import base64
+import binascii
+import struct
 import logging
 import os
 from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 import ssl
 import time
+import re
+import heapq
+import itertools
+from collections import deque
+import multiprocessing
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configure logging
 logging.basicConfig(
@@ -15,9 +32,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def json_dumps(obj):
+    """Serialize to a JSON string, with orjson when it's installed."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+def json_loads(data):
+    """Parse JSON, with orjson when it's installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 # In-memory set of connected websocket clients
 connected_clients = set()
 client_info = {}  # Store additional information about clients
+# Topic index: topic -> websockets subscribed to it. Each client's own
+# topics are kept in client_info[websocket]['topics'].
+subscriptions = {}
 
 # Configuration from environment variables
 HOST = os.environ.get("HOST", "0.0.0.0")
@@ -25,87 +57,677 @@ WS_PORT = int(os.environ.get("WS_PORT", 8765))
 HTTP_PORT = int(os.environ.get("HTTP_PORT", 8766))
 PING_INTERVAL = 30  # Seconds
 CLIENT_TIMEOUT = 120  # Seconds
+PING_TIMEOUT = float(os.environ.get("PING_TIMEOUT", 5))  # Seconds to wait for a pong
+PING_CONCURRENCY = int(os.environ.get("PING_CONCURRENCY", 500))  # Pings awaiting a pong at once
+LIVENESS_TICK = 1  # Seconds between liveness sweeps
+# Directory shared with the Celery workers' filesystem blob store
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "/data/blobs")
+BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}\.(jpg|png|webp|bin)$')
+BLOB_CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "bin": "application/octet-stream",
+}
+# Subscribers of the wildcard topic receive every published message
+WILDCARD_TOPIC = "*"
+# Topics for clients that connect without choosing any (e.g. "*" for the old broadcast behaviour)
+DEFAULT_TOPICS = [t for t in os.environ.get("DEFAULT_TOPICS", "").split(",") if t]
+MAX_TOPICS_PER_CLIENT = int(os.environ.get("MAX_TOPICS_PER_CLIENT", 100))
+# Outbound messages buffered per client before the slow-client policy applies
+CLIENT_QUEUE_SIZE = int(os.environ.get("CLIENT_QUEUE_SIZE", 32))
+# What to do when a client's queue is full: drop_oldest, drop_newest or disconnect
+SLOW_CLIENT_POLICY = os.environ.get("SLOW_CLIENT_POLICY", "drop_oldest")
+SEND_TIMEOUT = float(os.environ.get("SEND_TIMEOUT", 30))  # Seconds a single send may take before the client is dropped
+# permessage-deflate for JSON (text) frames: "deflate" or "none". Binary
+# image frames are never compressed; image bytes don't deflate.
+WS_COMPRESSION = os.environ.get("WS_COMPRESSION", "deflate")
+WS_COMPRESSION_LEVEL = int(os.environ.get("WS_COMPRESSION_LEVEL", 1))  # Base64 and JSON compress almost as well at level 1
+WS_COMPRESSION_WINDOW_BITS = int(os.environ.get("WS_COMPRESSION_WINDOW_BITS", 12))
+WS_COMPRESSION_MEM_LEVEL = int(os.environ.get("WS_COMPRESSION_MEM_LEVEL", 5))
+# Largest message accepted on /publish and sent to clients (base64 images easily exceed aiohttp's 1 MB default)
+MAX_MESSAGE_SIZE = int(os.environ.get("MAX_MESSAGE_SIZE", 10 * 1024 * 1024))
+# Forward /publish bodies as received, decoding only their routing fields;
+# "false" parses and re-serializes every message
+PUBLISH_PASSTHROUGH = os.environ.get("PUBLISH_PASSTHROUGH", "true").lower() == "true"
 
-# Function to broadcast message to all connected clients
-async def broadcast(message):
-    if not connected_clients:
-        logger.warning("No connected clients to broadcast to")
-        return
-    
-    disconnected_clients = set()
-    success_count = 0
+# Backplane that carries /publish to the clients of every replica: local
+# (this process only), memory (in-process stand-in for tests) or redis
+BACKPLANE = os.environ.get("BACKPLANE", "local")
+BACKPLANE_REDIS_URL = os.environ.get("BACKPLANE_REDIS_URL", "redis://redis-master:6379/0")
+BACKPLANE_CHANNEL = os.environ.get("BACKPLANE_CHANNEL", "websocket:publish")
+BACKPLANE_SEQUENCE_KEY = os.environ.get("BACKPLANE_SEQUENCE_KEY", "websocket:publish:seq")
+# Recent messages kept for clients that reconnect with ?since=<seq>; 0 disables replay
+REPLAY_BUFFER_SIZE = int(os.environ.get("REPLAY_BUFFER_SIZE", 1000))
+REPLAY_BUFFER_BYTES = int(os.environ.get("REPLAY_BUFFER_BYTES", 64 * 1024 * 1024))
+# Server processes sharing the ports on this node (SO_REUSEPORT); more than one needs the redis backplane
+WORKERS = int(os.environ.get("WORKERS", 1))
+
+# Close handshakes and pings running in the background, referenced so they aren't garbage collected
+closing_tasks = set()
+ping_tasks = set()
+
+# Liveness schedule: a heap of (due, sequence, websocket), one entry per client,
+# ordered by when the client next needs checking
+liveness_heap = []
+liveness_sequence = itertools.count()
+ping_semaphore = None
+
+# Prometheus metrics, served on /metrics
+CONNECTED_CLIENTS = Gauge('websocket_connected_clients', 'Connected WebSocket clients')
+CONNECTED_CLIENTS.set_function(lambda: len(connected_clients))
+LIVENESS_SWEEP_SECONDS = Histogram(
+    'websocket_liveness_sweep_seconds', 'Time spent in one liveness sweep',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+)
+LIVENESS_CHECKS = Counter('websocket_liveness_checks_total', 'Clients examined by liveness sweeps')
+PINGS = Counter('websocket_pings_total', 'Pings sent to clients, by outcome', ['outcome'])
+IDLE_DISCONNECTS = Counter('websocket_idle_disconnects_total', 'Clients disconnected for inactivity')
+
+def subscribe(websocket, topics):
+    """Add topics to a client's subscriptions, up to MAX_TOPICS_PER_CLIENT."""
+    client_topics = client_info[websocket]['topics']
+    for topic in topics:
+        if not isinstance(topic, str) or not topic or topic in client_topics:
+            continue
+        if len(client_topics) >= MAX_TOPICS_PER_CLIENT:
+            logger.warning(f"Client {websocket.remote_address} reached the limit of {MAX_TOPICS_PER_CLIENT} topics")
+            break
+        client_topics.add(topic)
+        subscriptions.setdefault(topic, set()).add(websocket)
+
+def unsubscribe(websocket, topics):
+    """Remove topics from a client's subscriptions."""
+    client_topics = client_info[websocket]['topics']
+    for topic in list(topics):
+        if topic not in client_topics:
+            continue
+        client_topics.discard(topic)
+        subscribers = subscriptions.get(topic)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del subscriptions[topic]
+
+def remove_client(websocket):
+    """Forget a disconnected client and all of its subscriptions."""
+    if websocket in client_info:
+        unsubscribe(websocket, list(client_info[websocket]['topics']))
+        info = client_info.pop(websocket)
+        # The sender may be the one removing its client after a failed send
+        if info['sender'] is not None and info['sender'] is not asyncio.current_task():
+            info['sender'].cancel()
+    connected_clients.discard(websocket)
+
+def disconnect_client(websocket, code, reason):
+    """Drop a client now and close its connection in the background."""
+    remove_client(websocket)
+    task = asyncio.ensure_future(websocket.close(code=code, reason=reason))
+    closing_tasks.add(task)
+    task.add_done_callback(closing_tasks.discard)
+
+async def client_sender(websocket, queue, backlog=()):
+    """
+    Send a client's replayed backlog, then its queued messages, so a slow
+    client only ever delays itself.
+    """
+    try:
+        for opcode, data in backlog:
+            await asyncio.wait_for(send_frame(websocket, opcode, data), SEND_TIMEOUT)
+        while True:
+            opcode, data = await queue.get()
+            await asyncio.wait_for(send_frame(websocket, opcode, data), SEND_TIMEOUT)
+            if websocket in client_info:
+                client_info[websocket]['last_activity'] = time.time()
+    except asyncio.TimeoutError:
+        logger.warning(f"Send to client {websocket.remote_address} timed out after {SEND_TIMEOUT}s, disconnecting")
+        disconnect_client(websocket, 1011, "Send timeout")
+    except websockets.exceptions.ConnectionClosed:
+        logger.info(f"Client disconnected during send: {websocket.remote_address}")
+        remove_client(websocket)
+    except Exception as e:
+        logger.error(f"Error sending to client {websocket.remote_address}: {str(e)}")
+        disconnect_client(websocket, 1011, "Send error")
+
+def enqueue(websocket, frame):
+    """Queue an (opcode, data) frame for one client, applying SLOW_CLIENT_POLICY if its queue is full."""
+    info = client_info.get(websocket)
+    if info is None:
+        return False
+    queue = info['queue']
+    if queue.full():
+        info['dropped'] += 1
+        if SLOW_CLIENT_POLICY == "disconnect":
+            logger.warning(f"Disconnecting slow client {websocket.remote_address} ({queue.qsize()} messages queued)")
+            disconnect_client(websocket, 1013, "Client too slow")
+            return False
+        if SLOW_CLIENT_POLICY != "drop_oldest":
+            return False
+        queue.get_nowait()
+    queue.put_nowait(frame)
+    return True
+
+def connect_topics(path):
+    """Topics requested in the connection URL: ?topics=a,b and/or ?task_id=, ?session_id=, ?user_id=."""
+    query = parse_qs(urlsplit(path or "").query)
+    topics = [t for value in query.get("topics", []) for t in value.split(",") if t]
+    for field, prefix in (("task_id", "task"), ("session_id", "session"), ("user_id", "user")):
+        topics.extend(f"{prefix}:{value}" for value in query.get(field, []) if value)
+    return topics or DEFAULT_TOPICS
+
+def connect_binary(path):
+    """Whether a client asked for binary image frames (?binary=1)."""
+    return parse_qs(urlsplit(path or "").query).get("binary", ["0"])[0] in ("1", "true")
+
+def connect_since(path):
+    """The sequence ID a reconnecting client resumes from (?since=<seq>), or None."""
+    values = parse_qs(urlsplit(path or "").query).get("since")
+    if not values:
+        return None
+    try:
+        return int(values[0])
+    except ValueError:
+        return None
+
+def message_topics(data, extra_topics=()):
+    """Topics a published message is delivered to, derived from its routing fields."""
+    topics = {WILDCARD_TOPIC}
+    for field, prefix in (("task_id", "task"), ("session_id", "session"), ("user_id", "user")):
+        if data.get(field):
+            topics.add(f"{prefix}:{data[field]}")
+    if isinstance(data.get("topics"), list):
+        topics.update(t for t in data["topics"] if isinstance(t, str))
+    topics.update(extra_topics)
+    return topics
+
+# Top-level fields of a published message that decide its topics
+ROUTING_FIELDS = ("task_id", "session_id", "user_id", "topics")
+# Top-level fields the server adds to every message, which publishers can't set
+RESERVED_FIELDS = ("seq",)
+JSON_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+JSON_SCALAR = re.compile(rb'(?:true|false|null|-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)(?![^ \t\n\r,}\]])')
+JSON_ESCAPE = re.compile(rb'\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})?')
+
+class InvalidMessage(ValueError):
+    """A /publish body that isn't a UTF-8 JSON object."""
+
+def skip_string(body, pos):
+    """Index just past the JSON string that starts at body[pos]."""
+    start = pos
+    while True:
+        pos = body.find(b'"', pos + 1)
+        if pos < 0:
+            raise InvalidMessage("Unterminated string")
+        escapes = 0
+        while body[pos - 1 - escapes] == 0x5c:
+            escapes += 1
+        if escapes % 2 == 0:
+            break
+    # Base64 has no backslashes, so an image is passed over by the find
+    if body.find(b'\\', start, pos) >= 0:
+        for escape in JSON_ESCAPE.finditer(body, start, pos):
+            if len(escape.group()) == 1:
+                raise InvalidMessage(f"Invalid escape at {escape.start()}")
+    return pos + 1
+
+def skip_key(body, pos):
+    """Index of the value after the object key (and ':') that starts at body[pos]."""
+    if body[pos:pos + 1] != b'"':
+        raise InvalidMessage(f"Expected a key at {pos}")
+    pos = JSON_WHITESPACE.match(body, skip_string(body, pos)).end()
+    if body[pos:pos + 1] != b':':
+        raise InvalidMessage(f"Expected ':' at {pos}")
+    return JSON_WHITESPACE.match(body, pos + 1).end()
+
+def skip_value(body, pos):
+    """Index just past the JSON value that starts at body[pos], checked without decoding it."""
+    closers = []  # Closing brackets of the enclosing arrays and objects
+    while True:
+        head = body[pos:pos + 1]
+        if head == b'"':
+            pos = skip_string(body, pos)
+        elif head == b'{' or head == b'[':
+            closer = b'}' if head == b'{' else b']'
+            pos = JSON_WHITESPACE.match(body, pos + 1).end()
+            if body[pos:pos + 1] == closer:
+                pos += 1
+            else:
+                closers.append(closer)
+                if closer == b'}':
+                    pos = skip_key(body, pos)
+                continue
+        else:
+            match = JSON_SCALAR.match(body, pos)
+            if match is None:
+                raise InvalidMessage(f"Expected a value at {pos}")
+            pos = match.end()
+        # After a value: close finished containers, or move on to the next member
+        while closers:
+            pos = JSON_WHITESPACE.match(body, pos).end()
+            separator = body[pos:pos + 1]
+            if separator == closers[-1]:
+                closers.pop()
+                pos += 1
+            elif separator == b',':
+                pos = JSON_WHITESPACE.match(body, pos + 1).end()
+                if closers[-1] == b'}':
+                    pos = skip_key(body, pos)
+                break
+            else:
+                raise InvalidMessage(f"Expected ',' or '{closers[-1].decode()}' at {pos}")
+        else:
+            return pos
+
+def routing_fields(body):
+    """
+    The ROUTING_FIELDS of a serialized JSON object, read by walking its
+    top-level keys.
+
+    Other values are checked against the JSON grammar and skipped rather
+    than decoded, and strings are passed over with byte searches, so a
+    multi-megabyte base64 image costs a scan, not a parse. Raw control
+    characters inside strings aren't looked for. Raises InvalidMessage if
+    the body isn't a JSON object or sets one of the RESERVED_FIELDS.
+    """
+    pos = JSON_WHITESPACE.match(body).end()
+    if body[pos:pos + 1] != b'{':
+        raise InvalidMessage("Expected a JSON object")
+    fields = {}
+    pos = JSON_WHITESPACE.match(body, pos + 1).end()
+    if body[pos:pos + 1] == b'}':
+        pos = JSON_WHITESPACE.match(body, pos + 1).end()
+    else:
+        while True:
+            key_pos = pos
+            pos = skip_key(body, pos)
+            key = json_loads(body[key_pos:skip_string(body, key_pos)])
+            if key in RESERVED_FIELDS:
+                raise InvalidMessage(f"'{key}' is set by the server")
+            end = skip_value(body, pos)
+            if key in ROUTING_FIELDS:
+                fields[key] = json_loads(body[pos:end])
+            pos = JSON_WHITESPACE.match(body, end).end()
+            separator = body[pos:pos + 1]
+            pos = JSON_WHITESPACE.match(body, pos + 1).end()
+            if separator == b'}':
+                break
+            if separator != b',':
+                raise InvalidMessage(f"Expected ',' or '}}' at {pos}")
+    if pos != len(body):
+        raise InvalidMessage(f"Unexpected data at {pos}")
+    return fields
+
+def subscribers_for(topics):
+    """Every client subscribed to at least one of the topics."""
+    clients = set()
+    for topic in topics:
+        clients |= subscriptions.get(topic, set())
+    return clients
+
+class ReplayBuffer:
+    """
+    Ring buffer of recently published messages, ordered by sequence ID and
+    capped both by count and by total size. A message larger than the size
+    cap isn't kept, and replays from before it are reported incomplete.
+    """
+
+    def __init__(self, max_messages=REPLAY_BUFFER_SIZE, max_bytes=REPLAY_BUFFER_BYTES):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.entries = deque()  # (seq, topics, message)
+        self.size = 0
+        self.last_seq = 0
+        self.skipped_seq = 0  # Latest message too large to keep
+
+    def append(self, seq, topics, message):
+        self.last_seq = max(self.last_seq, seq)
+        if self.max_messages <= 0:
+            return
+        if len(message) > self.max_bytes:
+            self.skipped_seq = max(self.skipped_seq, seq)
+            return
+        self.entries.append((seq, topics, message))
+        self.size += len(message)
+        while len(self.entries) > self.max_messages or self.size > self.max_bytes:
+            _, _, evicted = self.entries.popleft()
+            self.size -= len(evicted)
+
+    def since(self, seq, topics):
+        """
+        Return (messages, complete): the buffered messages after `seq` on any
+        of `topics`, and whether nothing after `seq` has been evicted or skipped.
+        """
+        missed = []
+        for entry_seq, entry_topics, message in reversed(self.entries):
+            if entry_seq <= seq:
+                break
+            if WILDCARD_TOPIC in topics or not topics.isdisjoint(entry_topics):
+                missed.append(message)
+        missed.reverse()
+        oldest = self.entries[0][0] if self.entries else self.last_seq + 1
+        # A sequence ahead of ours means the stream was reset (e.g. a local backplane restart)
+        complete = max(oldest - 1, self.skipped_seq) <= seq <= self.last_seq
+        return missed, complete
+
+replay_buffer = ReplayBuffer()
+
+def sniff_mime_type(data):
+    """Detect the image type from its magic bytes."""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+def binary_frame(message):
+    """
+    Binary variant of a message carrying a base64 image, or None if it has none.
+
+    Layout: a 4-byte big-endian header length, the JSON header (the message
+    without the image, plus `image.mime_type` and `image.size`), then the raw
+    image bytes.
+    """
+    data = json_loads(message)
+    response = data.get("response")
+    image = response.get("image_url") if isinstance(response, dict) else None
+    if not isinstance(image, str) or image.startswith(("http://", "https://")):
+        return None
+    mime_type = None
+    if image.startswith("data:"):
+        prefix, image = image.split(",", 1)
+        mime_type = prefix[5:].split(";", 1)[0] or None
+    try:
+        raw = base64.b64decode(image)
+    except (binascii.Error, ValueError):
+        return None
+    response["image_url"] = None
+    # The raw upstream response repeats the base64 image
+    data.pop("original_response", None)
+    data["image"] = {"mime_type": mime_type or sniff_mime_type(raw), "size": len(raw)}
+    header = json_dumps(data).encode()
+    return struct.pack("!I", len(header)) + header + raw
+
+def client_payload(websocket, message, binary):
+    """
+    The (opcode, data) frame to send a client: the binary variant for binary
+    clients when the message has an image, else the JSON message as text.
+    """
+    info = client_info.get(websocket)
+    if info is not None and info['binary'] and binary is not None:
+        return frames.OP_BINARY, binary
+    return frames.OP_TEXT, message
+
+async def send_frame(websocket, opcode, data):
+    """
+    Send already-encoded bytes as one frame. `send` only sends str as text
+    and would encode a message shared by many clients again for each.
+    `write_frame` is internal to the websockets protocol, which is why
+    requirements.txt pins websockets exactly and tests/ covers this.
+    """
+    await websocket.ensure_open()
+    await websocket.write_frame(True, opcode, data)
+
+EMPTY_OBJECT = re.compile(rb'\{[ \t\n\r]*\}')
+
+def with_sequence(message, seq):
+    """Add a `seq` field to a serialized JSON object (bytes or a memoryview) without parsing it."""
+    if EMPTY_OBJECT.match(message):
+        return b'{"seq": %d}' % seq
+    return b"".join((b'{"seq": %d, ' % seq, memoryview(message)[1:]))
+
+# Queue an already-serialized message for the clients subscribed to any of its
+# topics. Each client's sender task delivers it, so this never waits on a socket.
+def broadcast(message, topics, seq=None):
+    if seq is not None:
+        message = with_sequence(message, seq)
+        replay_buffer.append(seq, topics, message)
+    recipients = subscribers_for(topics)
+    if not recipients:
+        logger.info("No subscribed clients for message")
+        return 0
     
-    for client in connected_clients:
+    # Build the binary variant once, and only if a binary client needs it
+    binary = None
+    if any(client_info[client]['binary'] for client in recipients if client in client_info):
+        binary = binary_frame(message)
+    queued = sum(1 for client in recipients if enqueue(client, client_payload(client, message, binary)))
+    logger.info(f"Queued message for {queued} of {len(recipients)} subscribed clients")
+    return queued
+
+def encode_envelope(message, topics, seq):
+    """Frame a serialized message for the backplane: a JSON header with its sequence and topics, a newline, the message."""
+    return b"".join((json_dumps({"seq": seq, "topics": sorted(topics)}).encode(), b"\n", message))
+
+def decode_envelope(envelope):
+    """Return (message, topics, seq) from an envelope; the message is a view into it, not a copy."""
+    newline = envelope.index(b"\n")
+    header = json_loads(envelope[:newline])
+    return memoryview(envelope)[newline + 1:], set(header["topics"]), header["seq"]
+
+# Sequence IDs for the local and memory backplanes; they restart with the process
+local_sequence = itertools.count(1)
+
+class Backplane:
+    """
+    Carries published messages to every server process.
+
+    `publish` assigns the message the next sequence ID and sends it once;
+    each process receives it and calls `deliver(message, topics, seq)` for
+    its own subscribers.
+    """
+
+    async def start(self, deliver):
+        self.deliver = deliver
+
+    async def publish(self, message, topics):
+        """Publish a message and return the number of processes it reached."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class LocalBackplane(Backplane):
+    """Single process: deliver straight to this process's clients."""
+
+    async def publish(self, message, topics):
+        self.deliver(message, topics, next(local_sequence))
+        return 1
+
+class MemoryBackplane(Backplane):
+    """
+    In-memory stand-in for the Redis backplane, used in tests. Instances
+    sharing a `hub` list behave like replicas subscribed to one channel.
+    """
+
+    def __init__(self, hub=None):
+        self.hub = hub if hub is not None else []
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self.hub.append(self)
+
+    async def publish(self, message, topics):
+        envelope = encode_envelope(message, topics, next(local_sequence))
+        for replica in list(self.hub):
+            replica.deliver(*decode_envelope(envelope))
+        return len(self.hub)
+
+    async def close(self):
+        if self in self.hub:
+            self.hub.remove(self)
+
+class RedisBackplane(Backplane):
+    """
+    Redis pub/sub: every replica subscribes to BACKPLANE_CHANNEL and delivers
+    to its own clients. Sequence IDs come from a Redis counter, incremented
+    in the same script that publishes, so all replicas agree on them.
+    """
+
+    PUBLISH_SCRIPT = """
+    local seq = redis.call('INCR', KEYS[1])
+    local header = '{"seq": ' .. seq .. ', "topics": ' .. ARGV[2] .. '}'
+    return redis.call('PUBLISH', ARGV[1], header .. '\\n' .. ARGV[3])
+    """
+
+    def __init__(self, url=BACKPLANE_REDIS_URL, channel=BACKPLANE_CHANNEL, sequence_key=BACKPLANE_SEQUENCE_KEY):
+        self.url = url
+        self.channel = channel
+        self.sequence_key = sequence_key
+        self.listener = None
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        import redis.asyncio as aioredis
+        self.client = aioredis.from_url(self.url)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(self.channel)
+        self.listener = asyncio.create_task(self.listen())
+        logger.info(f"Subscribed to backplane channel {self.channel} on {self.url}")
+
+    async def listen(self):
+        while True:
+            try:
+                # Resubscribes by itself after a reconnect
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None and message["type"] == "message":
+                    self.deliver(*decode_envelope(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading from backplane: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def publish(self, message, topics):
+        return await self.client.eval(self.PUBLISH_SCRIPT, 1, self.sequence_key, self.channel, json_dumps(sorted(topics)), message)
+
+    async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+        await self.pubsub.reset()
+        await self.client.close()
+
+BACKPLANES = {
+    "local": LocalBackplane,
+    "memory": MemoryBackplane,
+    "redis": RedisBackplane,
+}
+
+backplane = BACKPLANES[BACKPLANE]()
+
+def schedule_liveness_check(websocket, due):
+    heapq.heappush(liveness_heap, (due, next(liveness_sequence), websocket))
+
+async def ping_client(client):
+    """Ping one client, bounded by PING_CONCURRENCY, and schedule its next check."""
+    async with ping_semaphore:
+        if client not in client_info:
+            return
         try:
-            await client.send(message)
-            success_count += 1
-            # Update last activity timestamp
-            if client in client_info:
-                client_info[client]['last_activity'] = time.time()
+            pong_waiter = await client.ping()
+            await asyncio.wait_for(pong_waiter, timeout=PING_TIMEOUT)
+        except asyncio.TimeoutError:
+            PINGS.labels(outcome='timeout').inc()
+            logger.warning(f"Ping timeout for client {client.remote_address}")
+            disconnect_client(client, 1011, "Ping timeout")
+            return
         except websockets.exceptions.ConnectionClosed:
-            logger.info(f"Client disconnected during broadcast: {client.remote_address}")
-            disconnected_clients.add(client)
+            PINGS.labels(outcome='closed').inc()
+            logger.info(f"Client {client.remote_address} disconnected during ping")
+            remove_client(client)
+            return
         except Exception as e:
-            logger.error(f"Error broadcasting to client {client.remote_address}: {str(e)}")
-            disconnected_clients.add(client)
-    
-    # Remove disconnected clients
-    for client in disconnected_clients:
-        if client in connected_clients:
-            connected_clients.remove(client)
-        if client in client_info:
-            del client_info[client]
-    
-    logger.info(f"Broadcasted message to {success_count} clients (removed {len(disconnected_clients)} disconnected)")
+            PINGS.labels(outcome='error').inc()
+            logger.error(f"Error pinging client {client.remote_address}: {str(e)}")
+            remove_client(client)
+            return
+
+    PINGS.labels(outcome='ok').inc()
+    info = client_info.get(client)
+    if info is not None:
+        # A pong proves the client is alive, even if it has nothing to say
+        now = time.time()
+        info['last_ping'] = now
+        info['last_activity'] = now
+        schedule_liveness_check(client, now + PING_INTERVAL)
+
+def liveness_sweep(now):
+    """
+    Check the clients whose liveness check is due.
+
+    Activity only updates `last_activity`; a client that was active since its
+    entry was scheduled is simply pushed back, so a sweep costs O(due) rather
+    than O(clients). Due clients are pinged concurrently in the background.
+    """
+    checked = 0
+    while liveness_heap and liveness_heap[0][0] <= now:
+        _, _, client = heapq.heappop(liveness_heap)
+        info = client_info.get(client)
+        if info is None:
+            continue
+        checked += 1
+        if now - info['last_activity'] > CLIENT_TIMEOUT:
+            IDLE_DISCONNECTS.inc()
+            logger.warning(f"Client {client.remote_address} timed out after {CLIENT_TIMEOUT}s of inactivity")
+            disconnect_client(client, 1001, "Idle timeout")
+            continue
+        due = info['last_activity'] + PING_INTERVAL
+        if due > now:
+            schedule_liveness_check(client, due)
+            continue
+        task = asyncio.create_task(ping_client(client))
+        ping_tasks.add(task)
+        task.add_done_callback(ping_tasks.discard)
+    LIVENESS_CHECKS.inc(checked)
+    return checked
+
+class TextDeflate(PerMessageDeflate):
+    """permessage-deflate that only compresses text frames and sends binary frames as-is."""
+    skipping = False
 
-# Periodic ping to keep connections alive
+    def encode(self, frame):
+        if frame.opcode == frames.OP_BINARY or (frame.opcode == frames.OP_CONT and self.skipping):
+            self.skipping = not frame.fin
+            return frame
+        return super().encode(frame)
+
+class TextDeflateFactory(ServerPerMessageDeflateFactory):
+    """Negotiates permessage-deflate like the stock factory, but with a TextDeflate extension."""
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, TextDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            self.compress_settings,
+        )
+
+def compression_extensions():
+    """Server extensions for WS_COMPRESSION."""
+    if WS_COMPRESSION != "deflate":
+        return []
+    return [TextDeflateFactory(
+        server_max_window_bits=WS_COMPRESSION_WINDOW_BITS,
+        client_max_window_bits=WS_COMPRESSION_WINDOW_BITS,
+        compress_settings={"level": WS_COMPRESSION_LEVEL, "memLevel": WS_COMPRESSION_MEM_LEVEL},
+    )]
+
+# Periodic liveness sweep to keep connections alive and drop dead ones
 async def ping_clients():
+    global ping_semaphore
+    ping_semaphore = asyncio.Semaphore(PING_CONCURRENCY)
     while True:
         try:
-            disconnected_clients = set()
-            now = time.time()
-            
-            # Check each client
-            for client in connected_clients:
-                try:
-                    # Check if client has been inactive for too long
-                    if client in client_info:
-                        last_activity = client_info[client]['last_activity']
-                        if (now - last_activity) > CLIENT_TIMEOUT:
-                            logger.warning(f"Client {client.remote_address} timed out after {CLIENT_TIMEOUT}s of inactivity")
-                            disconnected_clients.add(client)
-                            continue
-                    
-                    # Send ping
-                    pong_waiter = await client.ping()
-                    await asyncio.wait_for(pong_waiter, timeout=5)
-                    if client in client_info:
-                        client_info[client]['last_ping'] = now
-                        
-                except asyncio.TimeoutError:
-                    logger.warning(f"Ping timeout for client {client.remote_address}")
-                    disconnected_clients.add(client)
-                except websockets.exceptions.ConnectionClosed:
-                    logger.info(f"Client {client.remote_address} disconnected during ping")
-                    disconnected_clients.add(client)
-                except Exception as e:
-                    logger.error(f"Error pinging client {client.remote_address}: {str(e)}")
-                    disconnected_clients.add(client)
-            
-            # Clean up disconnected clients
-            for client in disconnected_clients:
-                if client in connected_clients:
-                    connected_clients.remove(client)
-                if client in client_info:
-                    del client_info[client]
-            
-            if disconnected_clients:
-                logger.info(f"Ping cycle removed {len(disconnected_clients)} disconnected clients. {len(connected_clients)} clients remain.")
-                
+            started = time.perf_counter()
+            liveness_sweep(time.time())
+            LIVENESS_SWEEP_SECONDS.observe(time.perf_counter() - started)
         except Exception as e:
             logger.error(f"Error in ping_clients: {str(e)}")
         
-        await asyncio.sleep(PING_INTERVAL)
+        await asyncio.sleep(LIVENESS_TICK)
 
 # WebSocket handler for client connections
 async def websocket_handler(websocket, path):
@@ -120,31 +742,77 @@ async def websocket_handler(websocket, path):
             'last_activity': time.time(),
             'last_ping': time.time(),
             'address': client_addr,
-            'path': path
+            'path': path,
+            'topics': set(),
+            'queue': asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE),
+            'dropped': 0,
+            'sender': None,
+            'binary': connect_binary(path)
+        }
+        schedule_liveness_check(websocket, time.time() + PING_INTERVAL)
+        subscribe(websocket, connect_topics(path))
+        
+        # A reconnecting client passes the last sequence ID it saw (?since=<seq>)
+        # and first receives what it missed. The backlog is taken in the same
+        # step as subscribing, so nothing falls between it and the live queue.
+        welcome = {
+            "type": "connection_status", 
+            "status": "connected",
+            "connected_clients": len(connected_clients),
+            "topics": sorted(client_info[websocket]['topics']),
+            "seq": replay_buffer.last_seq
         }
+        backlog = []
+        since = connect_since(path)
+        if since is not None:
+            backlog, complete = replay_buffer.since(since, client_info[websocket]['topics'])
+            backlog = [
+                client_payload(websocket, message, binary_frame(message) if client_info[websocket]['binary'] else None)
+                for message in backlog
+            ]
+            welcome["replay"] = {"since": since, "count": len(backlog), "complete": complete}
         
         # Send welcome message
         try:
-            await websocket.send(json.dumps({
-                "type": "connection_status", 
-                "status": "connected",
-                "connected_clients": len(connected_clients)
-            }))
+            await websocket.send(json_dumps(welcome))
         except Exception as e:
             logger.error(f"Error sending welcome message: {str(e)}")
         
+        if websocket in client_info:
+            client_info[websocket]['sender'] = asyncio.create_task(
+                client_sender(websocket, client_info[websocket]['queue'], backlog)
+            )
+        
         # Keep the connection alive until client disconnects
         async for message in websocket:
+            info = client_info.get(websocket)
+            if info is None:
+                break
             # Update last activity time
-            client_info[websocket]['last_activity'] = time.time()
+            info['last_activity'] = time.time()
             
             try:
                 # Try to parse the message as JSON
-                data = json.loads(message)
+                data = json_loads(message)
                 logger.debug(f"Received message from client {client_addr}: {str(data)[:100]}")
                 
+                # Subscription changes: {"type": "subscribe" | "unsubscribe", "topics": [...]}
+                if isinstance(data, dict) and data.get("type") in ("subscribe", "unsubscribe"):
+                    topics = data.get("topics")
+                    if not isinstance(topics, list):
+                        topics = []
+                    if data["type"] == "subscribe":
+                        subscribe(websocket, topics)
+                    else:
+                        unsubscribe(websocket, topics)
+                    await websocket.send(json_dumps({
+                        "type": "subscriptions",
+                        "topics": sorted(client_info[websocket]['topics'])
+                    }))
+                    continue
+                
                 # Echo back for testing
-                await websocket.send(json.dumps({
+                await websocket.send(json_dumps({
                     "type": "echo", 
                     "original": data,
                     "timestamp": time.time()
@@ -163,28 +831,51 @@ async def websocket_handler(websocket, path):
         logger.error(f"Error handling client {websocket.remote_address}: {str(e)}")
     finally:
         # Clean up
-        if websocket in connected_clients:
-            connected_clients.remove(websocket)
-        if websocket in client_info:
-            del client_info[websocket]
+        remove_client(websocket)
         logger.info(f"Client removed: {client_addr}. Remaining clients: {len(connected_clients)}")
 
+def read_message(body):
+    """
+    Return (message, routing fields) for a /publish body. In pass-through
+    mode the message is the body itself, checked to be UTF-8 and a JSON
+    object; otherwise it is parsed and serialized again.
+    """
+    if not PUBLISH_PASSTHROUGH:
+        data = json_loads(body)
+        if not isinstance(data, dict):
+            raise InvalidMessage("Expected a JSON object")
+        for key in RESERVED_FIELDS:
+            if key in data:
+                raise InvalidMessage(f"'{key}' is set by the server")
+        return json_dumps(data).encode(), data
+    # Clients receive it as a text frame, which must be UTF-8
+    if not body.isascii():
+        try:
+            body.decode()
+        except UnicodeDecodeError as e:
+            raise InvalidMessage(f"Invalid UTF-8: {str(e)}")
+    return body.strip(), routing_fields(body)
+
 # HTTP POST handler to receive messages from Celery tasks
 async def http_handler(request):
     try:
-        # Get the request body
-        data = await request.json()
-        logger.info(f"Received message via HTTP POST: {list(data.keys())}")
+        # Only the routing fields are decoded; the body is forwarded to clients as-is
+        message, data = read_message(await request.read())
         
-        # Broadcast to all connected clients
-        await broadcast(json.dumps(data))
+        # Deliver to the clients subscribed to the message's topics. Publishers
+        # can add topics in the query string (?topics=session:abc,user:42).
+        extra_topics = [t for t in request.query.get("topics", "").split(",") if t]
+        topics = message_topics(data, extra_topics)
+        logger.info(f"Received message via HTTP POST: {len(message)} bytes for {sorted(topics)}")
+        replicas = await backplane.publish(message, topics)
         
         return web.json_response({
             "status": "success", 
             "clients": len(connected_clients),
+            "replicas": replicas,
             "timestamp": time.time()
         })
-    except json.JSONDecodeError as e:
+    except (json.JSONDecodeError, InvalidMessage) as e:
         logger.error(f"Invalid JSON in HTTP request: {str(e)}")
         return web.json_response({"status": "error", "message": "Invalid JSON", "error": str(e)}, status=400)
     except Exception as e:
@@ -200,6 +891,10 @@ async def health_handler(request):
         "timestamp": time.time()
     })
 
+# Prometheus metrics endpoint (per process when WORKERS > 1)
+async def metrics_handler(request):
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
 # Status endpoint
 async def status_handler(request):
     client_list = []
@@ -209,6 +904,10 @@ async def status_handler(request):
             "connected_at": info['connected_at'],
             "last_activity": info['last_activity'],
             "path": info['path'],
+            "topics": len(info['topics']),
+            "binary": info['binary'],
+            "queued": info['queue'].qsize(),
+            "dropped": info['dropped'],
             "idle": time.time() - info['last_activity']
         })
         
@@ -216,21 +915,50 @@ async def status_handler(request):
         "status": "ok",
         "uptime": int(time.time() - start_time),
         "connected_clients": len(connected_clients),
+        "topics": len(subscriptions),
+        "replay": {
+            "messages": len(replay_buffer.entries),
+            "bytes": replay_buffer.size,
+            "first_seq": replay_buffer.entries[0][0] if replay_buffer.entries else None,
+            "last_seq": replay_buffer.last_seq
+        },
         "clients": client_list,
         "timestamp": time.time()
     })
 
+# Blob endpoint serving images written by the workers' filesystem blob store
+async def blob_handler(request):
+    key = request.match_info['key']
+    if not BLOB_KEY_PATTERN.match(key):
+        return web.json_response({"status": "error", "message": "Invalid blob key"}, status=400)
+
+    path = os.path.join(BLOB_STORE_DIR, key[:2], key)
+    if not os.path.exists(path):
+        return web.json_response({"status": "error", "message": "Blob not found"}, status=404)
+
+    # Blobs are content-addressed, so they never change once written
+    return web.FileResponse(path, headers={
+        "Content-Type": BLOB_CONTENT_TYPES[key.rsplit('.', 1)[1]],
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Access-Control-Allow-Origin": "*",
+    })
+
 # Create HTTP application
-app = web.Application()
+app = web.Application(client_max_size=MAX_MESSAGE_SIZE)
 app.router.add_post('/publish', http_handler)
+app.router.add_get('/blobs/{key}', blob_handler)
 app.router.add_get('/health', health_handler)
 app.router.add_get('/status', status_handler)
+app.router.add_get('/metrics', metrics_handler)
 
 # Start time for uptime reporting
 start_time = time.time()
 
 # Start both servers
 async def start_servers():
+    # Receive published messages for this process's clients
+    await backplane.start(broadcast)
+    
     # Start WebSocket server
     ping_task = asyncio.create_task(ping_clients())
     
@@ -240,14 +968,17 @@ async def start_servers():
         HOST, 
         WS_PORT, 
         ping_interval=None, 
-        max_size=10 * 1024 * 1024  # 10 MB max message size
+        max_size=MAX_MESSAGE_SIZE,
+        compression=None,
+        extensions=compression_extensions(),
+        reuse_port=WORKERS > 1
     )
     logger.info(f"WebSocket server started on ws://{HOST}:{WS_PORT}")
     
     # Start HTTP server
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, HOST, HTTP_PORT)
+    site = web.TCPSite(runner, HOST, HTTP_PORT, reuse_port=WORKERS > 1)
     await site.start()
     logger.info(f"HTTP server started on http://{HOST}:{HTTP_PORT}")
     
@@ -268,13 +999,31 @@ async def start_servers():
         ws_server.close()
         await ws_server.wait_closed()
         await runner.cleanup()
+        await backplane.close()
         logger.info("Servers shut down")
 
-if __name__ == "__main__":
+def run_server():
     logger.info("Starting WebSocket and HTTP servers...")
     try:
         asyncio.run(start_servers())
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
     except Exception as e:
-        logger.error(f"Server error: {str(e)}", exc_info=True) 
\ No newline at end of file
+        logger.error(f"Server error: {str(e)}", exc_info=True)
+
+if __name__ == "__main__":
+    if WORKERS > 1:
+        # Processes share the ports; each one only sees its own clients, so
+        # published messages must reach all of them through Redis
+        if BACKPLANE != "redis":
+            raise SystemExit(f"WORKERS={WORKERS} requires BACKPLANE=redis")
+        processes = [multiprocessing.Process(target=run_server, name=f"websocket-server-{i}") for i in range(WORKERS)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            logger.info("Server stopped by user")
+    else:
+        run_server() 
\ No newline at end of file